@@ -1,3 +1,5 @@
+import importlib
+
 import streamlit as st
 
 # Class to generate multiple Streamlit pages using an object oriented approach 
@@ -12,10 +14,23 @@ class MultiPage:
             page_icon="📊")
     
     def add_page(self, title, func) -> None: 
+        # func is the page function, or its path as "module:function" so
+        # the page module (and its plotting/ML dependencies) is only
+        # imported when the page is first selected
         self.pages.append({"title": title, "function": func })
 
     def run(self):
         st.title(self.app_name)
         page = st.sidebar.radio('Menu', self.pages, format_func=lambda page: page['title'])
-        page['function']() 
+        load_page(page)()
+
 
+def load_page(page):
+    """Returns the function of a page, importing its module on first use."""
+    func = page["function"]
+    if isinstance(func, str):
+        module_name, func_name = func.split(":")
+        # Imported modules are cached by Python, so this only costs an
+        # import the first time the page is selected in the process
+        func = getattr(importlib.import_module(module_name), func_name)
+    return func
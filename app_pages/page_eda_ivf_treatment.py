@@ -1,18 +1,41 @@
-import plotly.express as px
+import plotly.graph_objects as go
 import numpy as np
 import streamlit as st
 import matplotlib.pyplot as plt
 import seaborn as sns
-from src.data_management import load_ifv_treatment_data
+from src.count_cube import (
+    category_paths,
+    long_counts,
+    top_paths,
+    variable_counts,
+)
+from src.data_management import (
+    load_bitmap_index,
+    load_count_cube,
+    load_ifv_treatment_data,
+)
+from src.figure_cache import figure_key, show_plotly, show_pyplot
 
 
 sns.set_style("whitegrid")
 
+# The parallel plot draws one record per distinct path of categories. It
+# can be limited to the most common paths, and is cut down to the most
+# common paths that fit when its JSON would be larger than the payload cap
+PARALLEL_TOP_PATHS = None
+MAX_PARALLEL_PAYLOAD_BYTES = 2 * 2 ** 20
+# Columns with more categories are not drawn, like px.parallel_categories
+MAX_PARALLEL_CATEGORIES = 50
+# Columns the count and pie plots can be filtered by, besides the plotted
+# ones
+EXTRA_FILTER_COLUMNS = [
+    "Patient age at treatment",
+    "Fresh cycle",
+    "Frozen cycle",
+]
 
-def page_eda_ivf_treatment_body():
-    # Load data using the cached function
-    df = load_ifv_treatment_data()
 
+def page_eda_ivf_treatment_body():
     to_plot = [
         "Date of embryo transfer",
         "Elective single embryo transfer",
@@ -25,6 +48,10 @@ def page_eda_ivf_treatment_body():
         "Parallel Plot",
     ]
 
+    # Load the (value x outcome) counts of the plotted columns; the rows
+    # are only loaded for the parallel plot
+    cube = load_count_cube()
+
     st.write("### Exploratory Analysis of IVF Treatment Data")
     st.info(
         """
@@ -42,11 +69,13 @@ def page_eda_ivf_treatment_body():
 
     # Inspect dataset
     if st.checkbox("Inspect dataset"):
+        # The full dataset is only loaded when it is inspected
+        df_full = load_ifv_treatment_data()
         st.write(
-            f"The dataset has {df.shape[0]} rows and {df.shape[1]} columns,"
-            f"find below the first 10 rows."
+            f"The dataset has {df_full.shape[0]} rows and "
+            f"{df_full.shape[1]} columns, find below the first 10 rows."
         )
-        st.write(df.head(10))
+        st.write(df_full.head(10))
 
     st.write("---")
 
@@ -92,13 +121,6 @@ def page_eda_ivf_treatment_body():
 
     # Inspect data
 
-    # Create a filtered DataFrame based on to_plot
-    # Exclude "Parallel Plot" from filtering columns
-    df_eda = df.filter(to_plot[:-1] + ["Live birth occurrence"])
-    # Convert columns to string to avoid mixed type issues
-    columns_to_convert = ["Total embryos created"]
-    convert_to_string(df_eda, columns_to_convert)
-
     # Checkbox to display the radio buttons for data visualization
     if st.checkbox("Visualize Data"):
         # Select a variable for exploration
@@ -106,34 +128,73 @@ def page_eda_ivf_treatment_body():
                                      index=0)
         # Display plots based on selected variable or Parallel Plot
         if selected_variable == "Parallel Plot":
-            display_parallel_plot(df_eda)
+            display_parallel_plot(to_plot[:-1], "Live birth occurrence")
         else:
+            # Filters are evaluated on the bitmap index of the dataset
+            filters = select_filters(
+                to_plot[:-1] + EXTRA_FILTER_COLUMNS, "Live birth occurrence"
+            )
             st.write(f"### Plots for: {selected_variable}")
-            display_selected_plots(df_eda, selected_variable,
-                                   "Live birth occurrence")
+            display_selected_plots(cube, selected_variable,
+                                   "Live birth occurrence", filters)
 
 
-def display_parallel_plot(df):
+def display_parallel_plot(columns, target_var):
     """Displays the parallel categories plot."""
     st.write(
         """
         * Information in yellow shows that the treatment was successful.
         """
     )
-    # Convert the categorical column to a numeric type
-    df['Live birth occurrence'] = df['Live birth occurrence'].astype('category').cat.codes
-
-    # Create the parallel categories plot with the Viridis color scale
-    fig = px.parallel_categories(
-        df,
-        color="Live birth occurrence",
-        color_continuous_scale="Viridis",  
-        labels={"Live birth occurrence": "Live Birth Occurrence"},
+    show_plotly(
+        figure_key("eda", "Parallel Plot", "parallel"),
+        lambda: plot_parallel_categories(columns, target_var),
+    )
+
+
+def plot_parallel_categories(columns, target_var):
+    """
+    Returns the parallel categories figure of the columns and the target,
+    drawn from the count of each distinct path of categories rather than
+    from every row.
+    """
+    # The shared dataset, restricted to the plotted columns; the plot
+    # derives its columns without modifying it
+    df = load_ifv_treatment_data(columns=columns + [target_var])
+    df_plot = plot_columns(df, columns, target_var)
+    # Convert the categorical column to a numeric type, in the derived
+    # frame rather than the shared dataset
+    df_plot = df_plot.assign(
+        **{target_var: df_plot[target_var].astype('category').cat.codes}
     )
+    dimensions = [
+        col for col in columns + [target_var]
+        if df_plot[col].nunique() <= MAX_PARALLEL_CATEGORIES
+    ]
+    # The target is one of the dimensions, so each path has one outcome
+    # to color it by
+    paths = category_paths(df_plot, dimensions)
+
+    # Halve the number of paths drawn until the figure fits the payload
+    k = PARALLEL_TOP_PATHS or len(paths)
+    while True:
+        shown = top_paths(paths, k)
+        fig = parallel_categories_figure(shown, dimensions, target_var)
+        if k <= 1 or len(fig.to_json()) <= MAX_PARALLEL_PAYLOAD_BYTES:
+            break
+        k //= 2
+
+    title = "Parallel Categories Plot of Treatment Outcomes"
+    if len(shown) < len(paths):
+        title += (
+            f"<br><sup>The {len(shown)} most common of {len(paths)} paths, "
+            f"{shown['count'].sum() / paths['count'].sum():.1%} of the "
+            "cases</sup>"
+        )
 
     # Update layout to adjust size, font size, margins, and background colors
     fig.update_layout(
-        title="Parallel Categories Plot of Treatment Outcomes",
+        title=title,
         font=dict(size=10, color='black'),
         margin=dict(l=50, r=50, t=70, b=50),
         width=1000, height=600,
@@ -147,31 +208,130 @@ def display_parallel_plot(df):
                       titlefont=dict(color='black'))
     )
 
-    # Display the plot in Streamlit
-    st.plotly_chart(fig)
+    return fig
+
+
+def parallel_categories_figure(paths, dimensions, target_var):
+    """
+    Returns a parallel categories figure of weighted paths, drawn like
+    px.parallel_categories of the rows with the target as color.
+    """
+    labels = {"Live birth occurrence": "Live Birth Occurrence"}
+    fig = go.Figure(
+        go.Parcats(
+            dimensions=[
+                dict(label=labels.get(col, col), values=paths[col])
+                for col in dimensions
+            ],
+            counts=paths["count"],
+            line=dict(color=paths[target_var], coloraxis="coloraxis"),
+        )
+    )
+    # Viridis color scale, as the continuous color of plotly express
+    fig.update_layout(
+        coloraxis=dict(
+            colorscale="Viridis",
+            colorbar=dict(title=labels.get(target_var, target_var)),
+        )
+    )
+    return fig
+
+
+def select_filters(columns, target_var):
+    """
+    Displays a multiselect of the values of each column and the number of
+    cases they select. Returns the filters as a dict of column: selected
+    values; a column without selected values is not filtered.
+    """
+    index = load_bitmap_index()
+    filters = {}
+    with st.expander("Filter cases"):
+        st.write(
+            "Select values to only plot the matching cases. Values of one "
+            "variable are combined with OR, variables with AND."
+        )
+        for col in columns:
+            # The values of the column, as labelled in the plots
+            if col not in index.values:
+                continue
+            filters[col] = st.multiselect(
+                col, index.values[col], key=f"eda_filter_{col}"
+            )
+
+    if any(filters.values()):
+        n_selected = index.count(filters)
+        n_successful = index.count({**filters, target_var: ["1"]})
+        st.write(
+            f"{n_selected} of {index.n_rows} cases selected"
+            + (f", {n_successful / n_selected:.1%} with a live birth."
+               if n_selected else ".")
+        )
+    return filters
 
 
-def display_selected_plots(df, col, target_var):
+def display_selected_plots(cube, col, target_var, filters=None):
     """
-    Displays count, proportion, and pie charts based on the selected column.
+    Displays count, proportion, and pie charts based on the selected column,
+    among the cases matching the filters of the other columns.
     """
-    # Count distribution plot
+    # The filters that apply to the plots of the column, in a stable order
+    # for the figure keys; the column's own filter does not apply
+    applied = tuple(
+        (name, tuple(values))
+        for name, values in sorted((filters or {}).items())
+        if values and name != col
+    )
+    if applied:
+        # Counts of the filtered cases, from the bitmap index
+        counts = load_bitmap_index().variable_counts(
+            col, dict(applied), target_var
+        )
+    else:
+        # Counts of each value of the column per outcome, from the count
+        # cube
+        counts = variable_counts(cube, col, target_var)
+    if counts.empty:
+        st.warning("No cases match the selected filters.")
+        return
+
+    # Count distribution plot, rendered once per variable, filters and
+    # dataset
     st.write(f"**Count Distribution for {col}**")
-    plot_count_distribution(df, col, target_var)
+    show_pyplot(
+        figure_key("eda", col, "count", applied),
+        lambda: plot_count_distribution(counts, col, target_var),
+    )
 
     # Pie chart
     st.write(f"**Pie Chart for {col}**")
-    plot_pie_chart(df, col, target_var)
+    if counts[1].sum() == 0:
+        st.warning("None of the selected cases resulted in a live birth.")
+        return
+    show_pyplot(
+        figure_key("eda", col, "pie", applied),
+        lambda: plot_pie_chart(counts, col, target_var),
+    )
+
+
+# Columns plotted as strings to avoid mixed type issues
+STRING_COLUMNS = ["Total embryos created"]
 
 
-def convert_to_string(df, columns):
-    for col in columns:
-        # Convert to string to avoid mixed type issues
-        df[col] = df[col].astype(str)
+def plot_columns(df, columns, target_var):
+    """
+    Returns a new frame with the plotted columns and the target, leaving
+    the shared dataset untouched. Only the columns of STRING_COLUMNS are
+    converted (to strings); the others are taken as they are.
+    """
+    df_plot = df[columns + [target_var]]
+    for col in STRING_COLUMNS:
+        if col in columns:
+            df_plot = df_plot.assign(**{col: df_plot[col].astype(str)})
+    return df_plot
 
 
-def plot_count_distribution(df, col, target_var):
-    plt.figure(figsize=(15, 6))
+def plot_count_distribution(counts, col, target_var):
+    fig = plt.figure(figsize=(15, 6))
 
     # Define custom ordering for specific columns with ranges
     if col == "Date of embryo transfer":
@@ -228,15 +388,23 @@ def plot_count_distribution(df, col, target_var):
     else:
         order = sorted(
             # Sort other categorical columns in ascending order as strings
-            df[col].unique(),
+            counts.index,
             key=str,
         )
 
-    sns.countplot(data=df, x=col, hue=target_var, order=order)
+    # Bars of the precomputed counts, drawn like a countplot of the rows
+    sns.barplot(
+        data=long_counts(counts, col, target_var),
+        x=col,
+        y="count",
+        hue=target_var,
+        order=order,
+        errorbar=None,
+    )
     plt.xticks(rotation=90)
     plt.title(f"{col}", fontsize=20, y=1.05)
     plt.ylabel(f"Number of Cases")
-    st.pyplot(plt.gcf())
+    return fig
 
 
 # Choose color palette
@@ -244,12 +412,15 @@ palette = sns.color_palette("colorblind")
 
 
 # Function to plot pie charts
-def plot_pie_chart(df, col, target_var):
-    # Filter the data to include only successful cases
-    df_successful = df[df[target_var] == 1]
-
-    # Aggregate counts within each category for successful cases
-    df_pie = df_successful.groupby([col]).size().reset_index(name="count")
+def plot_pie_chart(counts, col, target_var):
+    # Counts within each category for successful cases, leaving out the
+    # categories without any
+    successful = counts[1]
+    df_pie = (
+        successful[successful > 0]
+        .rename_axis(col)
+        .reset_index(name="count")
+    )
 
     # Calculate total count for percentage calculations
     total_count = df_pie["count"].sum()
@@ -272,7 +443,7 @@ def plot_pie_chart(df, col, target_var):
         colors = palette
 
     # Plot pie chart for successful cases
-    plt.figure(figsize=(15, 6)) 
+    fig = plt.figure(figsize=(15, 6))
     wedges, texts, autotexts = plt.pie(
         df_pie["count"],
         startangle=90,
@@ -302,4 +473,4 @@ def plot_pie_chart(df, col, target_var):
 
     plt.title(f"Distribution of {col} in Successful IVF Cases",
               fontsize=20, y=1.05)
-    st.pyplot(plt.gcf())
+    return fig
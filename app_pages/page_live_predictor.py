@@ -1,17 +1,32 @@
+import os
+
 import streamlit as st
 import pandas as pd
 from src.data_management import (
+    MAX_CACHED_ENTRIES,
     load_ifv_treatment_data,
-    load_pkl_file,
-    load_gzip_file,
+    load_clf_model,
     load_best_features,
-    load_ifv_treatment_data_before_cleaning
 )
+from src.model_registry import DEFAULT_VERSION, MODEL_ROOT, registry
+from src.rerun_stats import fragment, session_rerun_stats, track_reruns
+from src.widget_manifest import WIDGET_NOTES, load_widget_manifest
 from src.machine_learning.prediction_live import (
     predict_success,
 )
+from src.machine_learning.prediction_table import (
+    TABLE_FILE_NAME,
+    load_prediction_table,
+    model_checksum,
+)
+from src.machine_learning.batch_scoring import (
+    ScoredCasesWriter,
+    read_cases,
+    score_cases,
+)
 
 
+@track_reruns("page")
 def page_live_predictor_body():
     """
     The main function that sets up the Streamlit page for live prediction
@@ -22,20 +37,17 @@ def page_live_predictor_body():
 
     # Load necessary files and models
     # Define the version of the model to use
-    version = "v1"
+    version = DEFAULT_VERSION
 
     # Loads the pre-processing pipeline (feature engineering steps)
-    ml_pipe_fe = load_pkl_file(
-        f"outputs/ml_pipeline/ivf_success_predictor/{version}/"
-        "clf_pipeline_pre_processing.pkl"
-    )
-    # Loads the trained classification model in gzipped format
-    ml_pipe_model = load_gzip_file(
-        f"outputs/ml_pipeline/ivf_success_predictor/{version}/"
-        "clf_pipeline_model.pkl.gz"
-    )
+    ml_pipe_fe = registry.get("pre_processing", version)
+    # Loads the trained classification model, memory-mapped from its
+    # compact artifact when it was exported
+    ml_pipe_model = load_clf_model(version)
     # Loads the list of best features used by the model
     best_features = load_best_features(version)
+    # Loads the precomputed predictions of this model, if they were built
+    table = load_prediction_table_for_version(version)
 
     # Display the title and description using Streamlit
     st.write(
@@ -55,33 +67,146 @@ def page_live_predictor_body():
     )
     st.write("---")
 
-    # Generate Live Data from user inputs
-    # This function creates input widgets corresponding to the features
-    # used in the ML model
-    X_live = DrawInputsWidgets()
+    LivePredictionPanel(
+        best_features, ml_pipe_fe, ml_pipe_model, version, table
+    )
+
+    st.write("---")
+    BatchScoringSection(best_features, ml_pipe_fe, ml_pipe_model, version)
+
 
-    # Button to run the prediction analysis; on click,
-    # triggers the prediction process
-    if st.button("Run Predictive Analysis"):
+@fragment
+@track_reruns("fragment")
+def LivePredictionPanel(best_features, ml_pipe_fe, ml_pipe_model, version,
+                        table):
+    """
+    The input widgets and the prediction result. The widgets sit in a form,
+    so editing them does not rerun the app until the form is submitted,
+    and the panel is a fragment, so a submission only reruns the panel
+    rather than the whole page.
+    """
+    with st.form("live_prediction_inputs"):
+        # Generate Live Data from user inputs
+        # This function creates input widgets corresponding to the features
+        # used in the ML model
+        X_live = DrawInputsWidgets(version)
+
+        # Button to run the prediction analysis; on click,
+        # submits every input at once and triggers the prediction process
+        submitted = st.form_submit_button("Run Predictive Analysis")
+
+    if submitted and X_live is not None:
         # Call the predict_success function using the live input data,
         # selected features, and loaded models
-        success_prediction = predict_success(
-            X_live, best_features, ml_pipe_fe, ml_pipe_model
+        predict_success(
+            X_live, best_features, ml_pipe_fe, ml_pipe_model,
+            model_version=version, table=table,
         )
+        session_rerun_stats().prediction_completed()
 
 
-def DrawInputsWidgets():
+def load_prediction_table_for_version(version):
     """
-    Creates input widgets on the Streamlit page for each feature required
-    by the model using the available data to provide user-friendly inputs
-    for each feature.
+    Loads the precomputed prediction table of a model version. Returns None
+    if it was not built or is stale, in which case every prediction goes
+    through the pipeline. Cached per checksum of the model artifacts and
+    version of the table file, so a retrained model or a rebuilt table is
+    picked up without a restart.
     """
+    model_dir = f"{MODEL_ROOT}/{version}"
+    path = f"{model_dir}/{TABLE_FILE_NAME}"
+    try:
+        checksum = model_checksum(model_dir)
+        stat = os.stat(path)
+    except OSError:
+        return None
+    file_version = (stat.st_size, stat.st_mtime_ns)
+    return _load_prediction_table(path, checksum, file_version)
+
+
+@st.cache_resource(max_entries=MAX_CACHED_ENTRIES)
+def _load_prediction_table(path, checksum, file_version):
+    return load_prediction_table(path, checksum)
+
+
+def BatchScoringSection(best_features, ml_pipe_fe, ml_pipe_model, version):
+    """
+    Scores an uploaded list of cases (CSV or Excel, one column per model
+    feature) chunk by chunk and offers the results for download.
+    """
+    st.write(
+        """
+        ### Batch Scoring
+        """
+    )
+    st.info(
+        f"""
+        Upload a CSV or Excel file with one row per case and the columns:
+        {", ".join(best_features)}.
+        """
+    )
+    uploaded_file = st.file_uploader(
+        # Legacy .xls files would need xlrd, which is not installed
+        "Patient list", type=["csv", "xlsx"]
+    )
+    if uploaded_file is None or not st.button("Score Uploaded Cases"):
+        return
+
+    # Reference values the uploaded cases are validated against
+    reference = load_ifv_treatment_data(columns=best_features)
+    writer = ScoredCasesWriter()
+    progress = st.progress(0.0, text="Scoring cases...")
+    preview = None
+    try:
+        # Excel files are parsed here, so their errors are reported too
+        n_cases, chunks = read_cases(uploaded_file)
+        for scored in score_cases(
+            chunks, best_features, reference, ml_pipe_fe, ml_pipe_model,
+            model_version=version,
+        ):
+            writer.write(scored)
+            if preview is None:
+                preview = scored.head(20)
+            progress.progress(
+                min(writer.n_rows / n_cases, 1.0),
+                text=f"Scored {writer.n_rows} of about {n_cases} cases",
+            )
+    except ValueError as error:
+        progress.empty()
+        st.error(f"The uploaded cases could not be scored. {error}")
+        return
+
+    progress.progress(1.0, text=f"Scored {writer.n_rows} cases")
+    if preview is not None:
+        st.dataframe(preview)
+    st.download_button(
+        label="Download Results",
+        data=writer.getvalue(),
+        file_name="scored_cases.csv",
+        mime="text/csv",
+    )
 
-    # Load the IVF treatment data into a DataFrame for reference
-    df = load_ifv_treatment_data()
 
-    # Load the selected best features for the model
-    best_features = load_best_features()
+def DrawInputsWidgets(version=DEFAULT_VERSION):
+    """
+    Creates input widgets on the Streamlit page for each feature required
+    by the model, as described by the widget manifest of the model version
+    (see src/widget_manifest.py), so no data is read on a rerun.
+    """
+
+    # Load the description of each widget: type, options, bounds, default
+    # and the notes to display before it
+    try:
+        widgets = load_widget_manifest(version)["widgets"]
+    except FileNotFoundError:
+        st.error(
+            """
+            Best features file not found. Please ensure it is
+            saved correctly in the output folder.
+            """
+        )
+        return None
+    best_features = [widget["feature"] for widget in widgets]
 
     # Initialize an empty DataFrame with columns matching the best features
     # Creates an empty DataFrame with specified columns (Pandas API)
@@ -94,100 +219,55 @@ def DrawInputsWidgets():
     # Creates the specified number of columns in the layout
     cols = st.columns(num_cols)
 
-    # Flags to control the display of additional information
-    embryos_transferred_info_displayed = False
-    cycle_info_displayed = False
-
     # Iterate over each feature to create an appropriate input widget
-    for i, feature in enumerate(best_features):
+    for i, widget in enumerate(widgets):
+        feature = widget["feature"]
         # Selects the column to place the widget in (cycle among the available
         # columns ensuring that widgets are distributed evenly across the
         # available columns, wrapping around when the end of the column list
         # is reached
         col = cols[i % num_cols]
 
-        # Display specific information about the "Embryos transferred" feature
-        # if not already displayed
-        if (
-            feature == "Embryos transferred"
-            and not embryos_transferred_info_displayed
-        ):
-            st.write("* 1e means 1 embryo selectively elected.")
-            embryos_transferred_info_displayed = True
-
-        # Display additional info about cycle type
-        if (
-            not pd.api.types.is_numeric_dtype(df[feature])
-            and not cycle_info_displayed):
-            # Checks if the feature contains information about frozen
-            # or fresh cycles
-            if any(
-                "- frozen" in str(val) or "- fresh" in str(val)
-                for val in df[feature].unique()
-            ):
-                # Explanation of the frozen/fresh cycle information
-                st.write(
-                    """
-                    * '- frozen' or '- fresh' indicates frozen or
-                    fresh cycle, respectively.
-                    """
-                )
-                cycle_info_displayed = True
-
-        # Create appropriate input widgets based on the data type
-        # of the feature using Pandas API
-        if pd.api.types.is_numeric_dtype(df[feature]):
-            # Extracts unique values of the feature using Pandas API
-            unique_values = df[feature].unique()
-            # Checks if the feature is binary (0/1)
-            if set(unique_values) == {0, 1}:
-                # Create a dropdown for binary features (Yes/No)
-                st_widget = col.selectbox(
-                    # Label for the dropdown
-                    label=feature,
-                    # Options presented to the user
-                    options=["No", "Yes"],
-                    # Default selection index
-                    index=0,
-                )
-                # Assigns 1 or 0 based on user input (Pandas API)
-                X_live.at[0, feature] = 1 if st_widget == "Yes" else 0
-            else:
-                # Create a number input for continuous or discrete
-                # numeric features
-                min_value = int(
-                    # Minimum value of the feature (Pandas API)
-                    df[feature].min()
-                )
-                max_value = int(
-                    # Maximum value of the feature (Pandas API)
-                    df[feature].max()
-                )
-                st_widget = col.number_input(
-                    label=feature,
-                    value=int(
-                        # Default value set to the mean of the feature
-                        # (Pandas API)
-                        df[feature].mean()
-                    ),
-                    # Increment or decrement step size (1 numer at a time)
-                    step=1,
-                    # Format the input as an integer
-                    format="%d",
-                    min_value=min_value,
-                    max_value=max_value,
-                )
-                # Assigns the user's input to the DataFrame (Pandas API)
-                X_live.at[0, feature] = st_widget
+        # Display the information about the feature, e.g. what "1e" means
+        # for "Embryos transferred" or the frozen/fresh cycle suffixes
+        for flag in widget["info"]:
+            st.write(WIDGET_NOTES[flag])
+
+        if widget["type"] == "yes_no":
+            # Create a dropdown for binary features (Yes/No)
+            st_widget = col.selectbox(
+                # Label for the dropdown
+                label=feature,
+                # Options presented to the user
+                options=widget["options"],
+                # Default selection index
+                index=0,
+            )
+            # Assigns 1 or 0 based on user input (Pandas API)
+            X_live.at[0, feature] = 1 if st_widget == "Yes" else 0
+        elif widget["type"] == "number":
+            # Create a number input for continuous or discrete
+            # numeric features
+            st_widget = col.number_input(
+                label=feature,
+                # Default value set to the mean of the feature
+                value=widget["default"],
+                # Increment or decrement step size (1 numer at a time)
+                step=1,
+                # Format the input as an integer
+                format="%d",
+                min_value=widget["min"],
+                max_value=widget["max"],
+            )
+            # Assigns the user's input to the DataFrame (Pandas API)
+            X_live.at[0, feature] = st_widget
         else:
-            # For categorical features, create a dropdown with sorted options
-            sorted_options = sorted(
-                df[feature].unique()
-            )  # Sorts unique values of the feature (Pandas API)
+            # For categorical features, create a dropdown of the options in
+            # category order
             st_widget = col.selectbox(
                 label=feature,
                 # Options presented to the user
-                options=sorted_options,
+                options=widget["options"],
                 index=0,
             )
             X_live.at[0, feature] = st_widget
@@ -1,53 +1,21 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-from src.data_management import (
-    load_ifv_treatment_data,
-    load_pkl_file,
-    load_gzip_file
-)
 from src.machine_learning.evaluate_clf import clf_performance
+from src.model_registry import DEFAULT_VERSION, registry
 
 
 def page_ml_success_predictor_body():
 
-    version = "v1"
-    # load needed files
-    ivf_pipe_dc = load_pkl_file(
-        f"outputs/ivf_success_predictor/data_cleaning_pipeline/{version}/"
-        "data_cleaning_pipeline.pkl"
-    )
-
-    ivf_preprocessing = load_pkl_file(
-        f"outputs/ml_pipeline/ivf_success_predictor/{version}/"
-        "clf_pipeline_pre_processing.pkl"
-    )
-
-    ivf_pipe_model = load_gzip_file(
-        f"outputs/ml_pipeline/ivf_success_predictor/{version}/"
-        "clf_pipeline_model.pkl.gz"
-    )
-
-    ivf_feat_importance = plt.imread(
-        f"outputs/ml_pipeline/ivf_success_predictor/{version}"
-        "/features_importance.png"
-    )
-
-    X_train = pd.read_csv(
-        f"outputs/ml_pipeline/ivf_success_predictor/{version}/X_train.csv"
-    )
-
-    X_test = pd.read_csv(
-        f"outputs/ml_pipeline/ivf_success_predictor/{version}/X_test.csv"
-    )
-
-    y_train = pd.read_csv(
-        f"outputs/ml_pipeline/ivf_success_predictor/{version}/y_train.csv"
-    ).values
-
-    y_test = pd.read_csv(
-        f"outputs/ml_pipeline/ivf_success_predictor/{version}/y_test.csv"
-    ).values
+    version = DEFAULT_VERSION
+    # load needed files, cached across sessions by the model registry
+    ivf_pipe_dc = registry.get("data_cleaning_pipeline", version)
+    ivf_preprocessing = registry.get("pre_processing", version)
+    # The pickled pipeline, which is displayed below
+    ivf_pipe_model = registry.get("model", version)
+    ivf_feat_importance = registry.get("feature_importance", version)
+    X_train = registry.get("X_train", version)
+    X_test = registry.get("X_test", version)
+    y_train = registry.get("y_train", version)
+    y_test = registry.get("y_test", version)
 
     st.write("### ML Pipeline: IVF Success Predictor")
     # display pipeline training summary conclusions
@@ -1,7 +1,9 @@
 import streamlit as st
 import plotly.express as px
 import numpy as np
-from src.data_management import load_ifv_treatment_data
+from src.count_cube import long_counts, variable_counts
+from src.data_management import load_count_cube
+from src.figure_cache import figure_key, show_pyplot
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
 import seaborn as sns
@@ -11,9 +13,6 @@ sns.set_style("whitegrid")
 
 def page_project_hypotheses_body():
 
-    # Load data using the cached function
-    df = load_ifv_treatment_data()
-
     vars_to_study = [
         "Patient age at treatment",
         "Patient/Egg provider age",
@@ -23,6 +22,9 @@ def page_project_hypotheses_body():
         "Partner/Sperm provider age",
     ]
 
+    # Load the (value x outcome) counts of the studied columns
+    cube = load_count_cube()
+
         
     st.markdown(
         """
@@ -80,70 +82,74 @@ def page_project_hypotheses_body():
         """
     )
 
-# Create a filtered DataFrame based on vars_to_study
-    df_eda = df.filter(vars_to_study + ["Live birth occurrence"])
-    
     # Checkbox to display the radio buttons for data visualization
     if st.checkbox("Visualize Data"):
         # Select a variable for exploration
         selected_variable = st.radio("Select a variable to explore:", vars_to_study, index=0)
         # Display plots based on selected variable
         st.write(f"### Plots for: {selected_variable}")
-        display_selected_plots(df_eda, selected_variable, "Live birth occurrence")
+        display_selected_plots(cube, selected_variable, "Live birth occurrence")
 
-def display_selected_plots(df, col, target_var):
+def display_selected_plots(cube, col, target_var):
     """Displays count, proportion, and pie charts based on the selected column."""
-    # Count distribution plot
+    # Counts of each value of the column per outcome, from the count cube
+    counts = variable_counts(cube, col, target_var)
+
+    # Count distribution plot, rendered once per variable and dataset
     st.write(f"**Count Distribution for {col}**")
-    plot_count_distribution(df, col, target_var)
+    show_pyplot(
+        figure_key("hypotheses", col, "count"),
+        lambda: plot_count_distribution(counts, col, target_var),
+    )
 
     # Proportional distribution plot
     st.write(f"**Proportional Distribution for {col}**")
-    plot_proportion_distribution(df, col, target_var)
+    show_pyplot(
+        figure_key("hypotheses", col, "proportion"),
+        lambda: plot_proportion_distribution(counts, col, target_var),
+    )
 
     # Pie chart
     st.write(f"**Pie Chart for {col}**")
-    plot_pie_chart(df, col, target_var)
+    show_pyplot(
+        figure_key("hypotheses", col, "pie"),
+        lambda: plot_pie_chart(counts, col, target_var),
+    )
 
-def plot_count_distribution(df, col, target_var):
-    plt.figure(figsize=(15, 6))
+def plot_count_distribution(counts, col, target_var):
+    fig = plt.figure(figsize=(15, 6))
 
     order = sorted(
         # Sort other categorical columns in ascending order as strings
-        df[col].unique(),
+        counts.index,
         key=str,
     )
 
-    sns.countplot(data=df, x=col, hue=target_var, order=order)
+    # Bars of the precomputed counts, drawn like a countplot of the rows
+    sns.barplot(
+        data=long_counts(counts, col, target_var),
+        x=col,
+        y="count",
+        hue=target_var,
+        order=order,
+        errorbar=None,
+    )
     plt.xticks(rotation=90)
     plt.title(f"{col}", fontsize=20, y=1.05)
     plt.ylabel(f"Number of Cases")
-    st.pyplot(plt.gcf())
+    return fig
 
 
 # Function to plot proportional distributions
-def plot_proportion_distribution(df, col, target_var):
-    plt.figure(figsize=(15, 6))
+def plot_proportion_distribution(counts, col, target_var):
+    fig = plt.figure(figsize=(15, 6))
 
-    order = sorted(
-        df[col].unique(), key=str
-    )  # Sort other categorical columns in ascending order as strings
-
-    # Filter order to match only existing categories
-    unique_values = df[col].unique()
-    order = [x for x in order if x in unique_values]
-
-    # Calculate proportions
-    df_prop = df.groupby([col, target_var]).size().reset_index(name="count")
-    df_prop["proportion"] = df_prop.groupby(col)["count"].transform(
-        lambda x: x / x.sum()
-    )
+    # Sort categorical columns in ascending order as strings
+    order = sorted(counts.index, key=str)
 
-    # Pivot the data to have proportions for each target
-    # variable as separate columns
-    df_pivot = df_prop.pivot(index=col, columns=target_var, values="proportion").fillna(
-        0
-    )
+    # Proportions of each target variable within each category, as
+    # separate columns
+    df_pivot = counts.div(counts.sum(axis=1), axis=0)
     df_pivot = df_pivot.reindex(
         # Reorder according to the predefined order
         order, fill_value=0
@@ -205,7 +211,7 @@ def plot_proportion_distribution(df, col, target_var):
                 fontsize=9,
             )
 
-    st.pyplot(plt.gcf())
+    return fig
 
 
 # Choose color palette
@@ -213,12 +219,15 @@ palette = sns.color_palette("colorblind")
 
 
 # Function to plot pie charts
-def plot_pie_chart(df, col, target_var):
-    # Filter the data to include only successful cases
-    df_successful = df[df[target_var] == 1]
-
-    # Aggregate counts within each category for successful cases
-    df_pie = df_successful.groupby([col]).size().reset_index(name="count")
+def plot_pie_chart(counts, col, target_var):
+    # Counts within each category for successful cases, leaving out the
+    # categories without any
+    successful = counts[1]
+    df_pie = (
+        successful[successful > 0]
+        .rename_axis(col)
+        .reset_index(name="count")
+    )
 
     # Calculate total count for percentage calculations
     total_count = df_pie["count"].sum()
@@ -240,7 +249,7 @@ def plot_pie_chart(df, col, target_var):
     else:
         colors = palette
     # Plot pie chart for successful cases
-    plt.figure(figsize=(15, 6)) 
+    fig = plt.figure(figsize=(15, 6))
     wedges, texts, autotexts = plt.pie(
         df_pie["count"],
         startangle=90,
@@ -266,4 +275,4 @@ def plot_pie_chart(df, col, target_var):
     )
 
     plt.title(f"Distribution of {col} in Successful IVF Cases", fontsize=20, y=1.05)
-    st.pyplot(plt.gcf())
\ No newline at end of file
+    return fig
@@ -0,0 +1,724 @@
+"""
+Performance checks for the IVF Success Predictor.
+
+Run from the repository root, e.g.
+    python -m scripts.benchmarks transformers
+
+The transformers, cleaning-engines and compiled-predictor benchmarks first
+check that the rewritten code gives the same output as the code it
+replaces on the real dataset, and raise an AssertionError on the first
+difference, so they are also the equivalence tests of those rewrites.
+They live here rather than in a test suite because the project has none
+and does not depend on a test runner; run the matching subcommand after
+changing the code it covers.
+"""
+import argparse
+import gzip
+import os
+import pickle
+import time
+import tracemalloc
+
+import joblib
+import pandas as pd
+
+from src.bitmap_index import BitmapIndex
+from src.count_cube import (
+    build_count_cube,
+    category_paths,
+    variable_counts,
+)
+from src.data_cleaning import (
+    PipelineDataCleaning,
+    clean_with_codes,
+    copy_free_pipeline,
+    read_raw_for_codes,
+)
+from src.data_management import read_dataset
+from src.data_schema import apply_schema, schema_memory_report
+from src.machine_learning.batch_scoring import ScoredCasesWriter, score_cases
+from src.machine_learning.compiled_predictor import (
+    CompiledPredictor,
+    pipeline_features,
+    verify_compiled_predictor,
+)
+from src.machine_learning.model_artifact import (
+    ARTIFACT_FILE_NAME,
+    load_model_artifact,
+)
+from src.machine_learning.prediction_live import predict_outcomes
+from src.machine_learning.tree_ensemble import FlatTreeEnsemble, numba
+from src.model_registry import DEFAULT_VERSION, MODEL_ROOT
+from src.widget_manifest import (
+    make_widget_manifest,
+    manifest_key,
+    read_widget_manifest,
+    widget_manifest_path,
+)
+
+
+RAW_DATA_PATH = "outputs/datasets/collection/FertilityTreatmentData.csv.gz"
+CLEANED_DATA_PATH = (
+    "outputs/datasets/cleaned/FertilityTreatmentDataCleaned.csv"
+)
+MODEL_DIR = f"{MODEL_ROOT}/{DEFAULT_VERSION}"
+
+
+def _best_time(func, repeat=3):
+    """Returns the best wall time of func over repeat runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_schema_memory():
+    """
+    Memory of each column of the cleaned dataset as parsed by read_csv and
+    with the categorical schema.
+    """
+    report = schema_memory_report(pd.read_csv(CLEANED_DATA_PATH))
+    report[["before", "after"]] = (report[["before", "after"]] / 2 ** 20)
+    print(report.round(2).rename(columns={
+        "before": "before (MiB)", "after": "after (MiB)"
+    }).to_string())
+
+
+# Row-wise implementations the vectorized transformers replaced, kept here
+# as the reference for the equivalence check
+def _legacy_fill_sperm_source(X):
+    def fill(row):
+        if pd.isna(row["Sperm source"]):
+            if not pd.isna(row["Sperm donor age at registration"]):
+                return "Donor"
+            else:
+                return "Partner"
+        return row["Sperm source"]
+
+    return "Sperm source", X.apply(fill, axis=1)
+
+
+def _legacy_replace_missing(X):
+    def replace(row):
+        value = row["Date of embryo transfer"]
+        if value == -1 and row["Embryos transferred"] == 0:
+            return "NT"
+        elif value == -1:
+            return "Missing"
+        return value
+
+    return "Date of embryo transfer", X.apply(replace, axis=1)
+
+
+def _legacy_append_cycle_type(X):
+    def append(row):
+        value = row["Date of embryo transfer"]
+        if value not in ["NT", "Missing"]:
+            if row["Fresh cycle"] == 1:
+                value = f"{value} - fresh"
+            elif row["Frozen cycle"] == 1:
+                value = f"{value} - frozen"
+            else:
+                value = f"{value} - Mixed fresh/frozen"
+        return value
+
+    return "Date of embryo transfer", X.apply(append, axis=1)
+
+
+def _legacy_append_e(X):
+    def append(row):
+        if (
+            row["Embryos transferred"] == 1
+            and row["Elective single embryo transfer"] == 1
+        ):
+            return "1e"
+        else:
+            return row["Embryos transferred"]
+
+    return "Embryos transferred", X.apply(append, axis=1)
+
+
+LEGACY_STEPS = {
+    "fill_sperm_source": _legacy_fill_sperm_source,
+    "replace_missing_values": _legacy_replace_missing,
+    "append_cycle_type": _legacy_append_cycle_type,
+    "e_flagging": _legacy_append_e,
+}
+
+
+def _step_inputs(df):
+    """
+    Runs the data cleaning pipeline and returns the fitted step and the
+    frame it received, for each step with a row-wise reference.
+    """
+    inputs = {}
+    X = df
+    for name, step in PipelineDataCleaning().steps:
+        if name in LEGACY_STEPS:
+            inputs[name] = (step, X)
+        X = step.fit_transform(X)
+    return inputs
+
+
+def benchmark_transformers(scales=(1, 10)):
+    """
+    Checks that the vectorized transformers reproduce the row-wise output
+    byte for byte on the real dataset, and times both implementations.
+    """
+    raw = pd.read_csv(RAW_DATA_PATH)
+    rows = []
+    for scale in scales:
+        df = pd.concat([raw] * scale, ignore_index=True)
+        for name, (step, X) in _step_inputs(df).items():
+            col, legacy_values = LEGACY_STEPS[name](X)
+            expected = X.copy()
+            expected[col] = legacy_values
+            result = step.transform(X)
+            pd.testing.assert_frame_equal(result, expected)
+            if result.to_csv(index=False) != expected.to_csv(index=False):
+                raise AssertionError(f"{name}: CSV output differs")
+
+            legacy_time = _best_time(
+                lambda: LEGACY_STEPS[name](X), repeat=1
+            )
+            vectorized_time = _best_time(lambda: step.transform(X))
+            rows.append({
+                "step": name,
+                "scale": f"{scale}x",
+                "rows": len(X),
+                "row-wise (s)": round(legacy_time, 3),
+                "vectorized (s)": round(vectorized_time, 4),
+                "speedup": round(legacy_time / vectorized_time, 1),
+            })
+    print("Vectorized output identical to the row-wise output.")
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def _load_model():
+    """Returns the best features, preprocessing pipeline and model."""
+    best_features = pd.read_csv(f"{MODEL_DIR}/best_features.csv")[
+        "feature"
+    ].tolist()
+    ml_pipe_fe = joblib.load(f"{MODEL_DIR}/clf_pipeline_pre_processing.pkl")
+    with gzip.open(f"{MODEL_DIR}/clf_pipeline_model.pkl.gz", "rb") as f:
+        ml_pipe_model = joblib.load(f)
+    return best_features, ml_pipe_fe, ml_pipe_model
+
+
+def _peak_memory(func):
+    """Returns the peak memory allocated while running func, in bytes."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_cleaning_memory():
+    """
+    Compares the peak memory of the cleaning pipeline with per-step copies
+    against the copy-free pipeline, relative to the size of the input.
+    """
+    raw = pd.read_csv(RAW_DATA_PATH)
+    input_bytes = raw.memory_usage(index=True, deep=True).sum()
+    pipeline = PipelineDataCleaning().fit(raw)
+
+    for label, candidate in [
+        ("copy per step", pipeline),
+        ("copy-free", copy_free_pipeline(pipeline)),
+    ]:
+        peak = _peak_memory(lambda: candidate.transform(raw))
+        print(
+            f"{label:>14}: peak {peak / 2 ** 20:7.1f} MiB "
+            f"({peak / input_bytes:.1f}x the input)"
+        )
+
+
+def benchmark_cleaning_engines(scales=(1, 10)):
+    """
+    Checks that the integer-code engine reproduces the pipeline output byte
+    for byte, and times both engines from the raw CSV to the cleaned frame.
+    """
+    rows = []
+    for scale in scales:
+        raw = pd.concat([pd.read_csv(RAW_DATA_PATH)] * scale, ignore_index=True)
+        coded_raw = pd.concat(
+            [read_raw_for_codes(RAW_DATA_PATH)] * scale, ignore_index=True
+        )
+        expected = PipelineDataCleaning().fit_transform(raw)
+        result = clean_with_codes(coded_raw)
+        pd.testing.assert_frame_equal(result, expected)
+        if result.to_csv(index=False) != expected.to_csv(index=False):
+            raise AssertionError(f"{scale}x: CSV output differs")
+
+        pipeline_time = _best_time(
+            lambda: PipelineDataCleaning().fit_transform(raw), repeat=1
+        )
+        codes_time = _best_time(lambda: clean_with_codes(coded_raw))
+        rows.append({
+            "scale": f"{scale}x",
+            "rows": len(raw),
+            "pipeline (s)": round(pipeline_time, 3),
+            "integer codes (s)": round(codes_time, 3),
+            "speedup": round(pipeline_time / codes_time, 1),
+        })
+    print("Integer-code engine output identical to the pipeline output.")
+    print(pd.DataFrame(rows).to_string(index=False))
+
+    # End to end, parsing included
+    parse_time = _best_time(lambda: pd.read_csv(RAW_DATA_PATH), repeat=1)
+    coded_parse_time = _best_time(
+        lambda: read_raw_for_codes(RAW_DATA_PATH), repeat=1
+    )
+    print(
+        f"Parsing the raw CSV: {parse_time:.2f} s in full, "
+        f"{coded_parse_time:.2f} s with the projected categorical read"
+    )
+
+
+def benchmark_compiled_predictor(n_rows=1000, n_timed=200):
+    """
+    Checks that the compiled predictor matches the pandas path on a sample
+    of the cleaned dataset, and times single-row predictions with both.
+    The compiled predictor of the compact artifact, which load_clf_model
+    returns when it exists, is checked and timed too.
+    """
+    best_features, ml_pipe_fe, ml_pipe_model = _load_model()
+    X = pd.read_csv(CLEANED_DATA_PATH, usecols=best_features)
+    X = X.sample(n=min(n_rows, len(X)), random_state=0)[best_features]
+    predictor = CompiledPredictor(best_features, ml_pipe_fe, ml_pipe_model)
+    verify_compiled_predictor(
+        predictor, X, best_features, ml_pipe_fe, ml_pipe_model
+    )
+    print(f"Compiled predictor identical to the pandas path on {len(X)} rows.")
+    compact = None
+    artifact_path = f"{MODEL_DIR}/{ARTIFACT_FILE_NAME}"
+    if os.path.exists(artifact_path):
+        compact_model = load_model_artifact(artifact_path)
+        compact = CompiledPredictor(best_features, ml_pipe_fe, compact_model)
+        verify_compiled_predictor(
+            compact, X, best_features, ml_pipe_fe, compact_model
+        )
+        print(
+            "Compiled predictor of the compact artifact identical to its "
+            f"pandas path on {len(X)} rows."
+        )
+
+    rows = [X.iloc[[i]] for i in range(min(n_timed, len(X)))]
+    records = [row.to_dict(orient="records")[0] for row in rows]
+
+    def pandas_path():
+        for row in rows:
+            ml_pipe_model.predict_proba(
+                pipeline_features(row, best_features, ml_pipe_fe, ml_pipe_model)
+            )
+
+    def encode_only():
+        for values in records:
+            predictor.features(values)
+
+    def compiled_path():
+        for values in records:
+            predictor.predict(values)
+
+    def compact_path():
+        for values in records:
+            compact.predict(values)
+
+    paths = [
+        ("pandas path", pandas_path),
+        ("compiled, encoding only", encode_only),
+        ("compiled, encoding + model", compiled_path),
+    ]
+    if compact is not None:
+        paths.append(("compiled, compact artifact", compact_path))
+    for label, func in paths:
+        per_row = _best_time(func) / len(rows)
+        print(f"{label:>27}: {per_row * 1e3:8.3f} ms per prediction")
+
+
+def benchmark_batch_scoring(n_rows=20_000, n_single=200):
+    """
+    Times chunked batch scoring of n_rows cases against looping the
+    single-row path, per row, and reports the peak memory of the batch.
+    """
+    best_features, ml_pipe_fe, ml_pipe_model = _load_model()
+    reference = pd.read_csv(CLEANED_DATA_PATH, usecols=best_features)
+    cases = reference.sample(
+        n=n_rows, replace=True, random_state=0
+    )[best_features].reset_index(drop=True)
+
+    def batch():
+        writer = ScoredCasesWriter()
+        chunks = (
+            cases.iloc[start:start + 5_000]
+            for start in range(0, len(cases), 5_000)
+        )
+        for scored in score_cases(
+            chunks, best_features, reference, ml_pipe_fe, ml_pipe_model
+        ):
+            writer.write(scored)
+        return writer
+
+    def single_rows():
+        for i in range(n_single):
+            predict_outcomes(
+                cases.iloc[[i]], best_features, ml_pipe_fe, ml_pipe_model
+            )
+
+    batch_per_row = _best_time(batch, repeat=1) / len(cases)
+    single_per_row = _best_time(single_rows, repeat=1) / n_single
+    peak = _peak_memory(batch)
+    print(f"   batch: {batch_per_row * 1e3:8.4f} ms per row")
+    print(f"  single: {single_per_row * 1e3:8.4f} ms per row")
+    print(f" speedup: {single_per_row / batch_per_row:.0f}x")
+    print(f"    peak: {peak / 2 ** 20:.1f} MiB for {len(cases)} cases")
+
+
+def benchmark_tree_ensemble(sizes=(1, 100, 10_000, 1_000_000)):
+    """
+    Compares the flattened tree ensemble with scikit-learn's predict_proba
+    on batches of the model's test set, for accuracy and speed.
+    """
+    _, _, ml_pipe_model = _load_model()
+    X_test = pd.read_csv(f"{MODEL_DIR}/X_test.csv")
+    engines = {"numpy": FlatTreeEnsemble(ml_pipe_model, use_numba=False)}
+    if numba is not None:
+        engines["numba"] = FlatTreeEnsemble(ml_pipe_model, use_numba=True)
+        # Compile outside the timings
+        engines["numba"].predict_proba(X_test.iloc[:1])
+    print(
+        f"{len(engines['numpy'].roots)} trees, "
+        f"{engines['numpy'].n_nodes:,} nodes"
+    )
+
+    rows = []
+    for size in sizes:
+        X = X_test.sample(n=size, replace=True, random_state=0)
+        expected = ml_pipe_model.predict_proba(X)
+        repeat = 3 if size <= 10_000 else 1
+        row = {
+            "rows": size,
+            "sklearn (ms)": round(
+                _best_time(lambda: ml_pipe_model.predict_proba(X), repeat)
+                * 1e3, 2
+            ),
+        }
+        for name, engine in engines.items():
+            result = engine.predict_proba(X)
+            row[f"{name} max diff"] = float(abs(result - expected).max())
+            row[f"{name} (ms)"] = round(
+                _best_time(lambda: engine.predict_proba(X), repeat) * 1e3, 2
+            )
+        rows.append(row)
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def _legacy_widget_inputs():
+    """
+    The data work DrawInputsWidgets did on every rerun before the widget
+    manifest: read the best features and the dataset, then scan each
+    feature for its options, bounds and notes.
+    """
+    best_features = pd.read_csv(f"{MODEL_DIR}/best_features.csv")[
+        "feature"
+    ].tolist()
+    df = read_dataset(
+        CLEANED_DATA_PATH, columns=best_features, prepare=apply_schema
+    )
+    for feature in best_features:
+        if not pd.api.types.is_numeric_dtype(df[feature]):
+            any(
+                "- frozen" in str(val) or "- fresh" in str(val)
+                for val in df[feature].unique()
+            )
+            sorted(df[feature].unique())
+        elif set(df[feature].unique()) != {0, 1}:
+            int(df[feature].min())
+            int(df[feature].max())
+            int(df[feature].mean())
+
+
+def benchmark_widget_manifest():
+    """
+    Times the data work of one rerun of the live predictor's inputs: the
+    legacy dataset scan, reading the manifest file, and the cached manifest
+    (what a rerun costs once load_widget_manifest has run in the process).
+    """
+    make_widget_manifest(DEFAULT_VERSION)
+    path = widget_manifest_path(DEFAULT_VERSION)
+    key = manifest_key(DEFAULT_VERSION)
+    manifest = read_widget_manifest(path, key)
+
+    for label, func in [
+        ("dataset scan (before)", _legacy_widget_inputs),
+        ("manifest file", lambda: read_widget_manifest(path, key)),
+        ("cached manifest", lambda: pickle.loads(pickle.dumps(manifest))),
+    ]:
+        print(f"{label:>22}: {_best_time(func, repeat=5) * 1e3:8.3f} ms")
+
+
+def _session_memory(n_sessions, open_session):
+    """
+    Returns the memory still allocated after n_sessions sessions opened
+    with open_session are all alive, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        sessions = [open_session() for _ in range(n_sessions)]
+        current = tracemalloc.get_traced_memory()[0]
+        del sessions
+        return current
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_dataset_sessions(session_counts=(1, 50)):
+    """
+    Memory held by concurrent sessions of the EDA page: each session with
+    its own copy of the dataset, as with st.cache_data and the former
+    df_eda copy and in-place string conversion, against every session
+    reading the one shared frame.
+    """
+    columns = [
+        "Date of embryo transfer",
+        "Elective single embryo transfer",
+        "Embryos transferred",
+        "Fresh eggs collected",
+        "Total eggs mixed",
+        "Total embryos created",
+        "Patient/Egg provider age",
+        "Partner/Sperm provider age",
+        "Live birth occurrence",
+    ]
+    shared = read_dataset(
+        CLEANED_DATA_PATH, columns=columns, prepare=apply_schema
+    )
+
+    def copied_session():
+        # st.cache_data hands every session an unpickled copy, which the
+        # page then filtered and converted in place
+        df = pickle.loads(pickle.dumps(shared))
+        df_eda = df.filter(columns)
+        df_eda["Total embryos created"] = (
+            df_eda["Total embryos created"].astype(str)
+        )
+        return df, df_eda
+
+    def shared_session():
+        return shared
+
+    print(f"Dataset: {len(shared)} rows, "
+          f"{shared.memory_usage(deep=True).sum() / 2 ** 20:.1f} MiB")
+    for n_sessions in session_counts:
+        for label, open_session in [
+            ("copy per session", copied_session),
+            ("shared", shared_session),
+        ]:
+            held = _session_memory(n_sessions, open_session)
+            print(f"{n_sessions:>3} sessions, {label:>16}: "
+                  f"{held / 2 ** 20:8.1f} MiB")
+
+
+def benchmark_count_cube(scales=(1, 10)):
+    """
+    Times the aggregation behind one variable's count, proportion and pie
+    plots, from the rows (as the plots did) and from the count cube, on
+    the cleaned dataset repeated scale times.
+    """
+    df = read_dataset(CLEANED_DATA_PATH, prepare=apply_schema)
+    col, target = "Patient/Egg provider age", "Live birth occurrence"
+    rows = []
+    for scale in scales:
+        scaled = pd.concat([df] * scale, ignore_index=True)
+        build_time = _best_time(lambda: build_count_cube(scaled), repeat=1)
+        cube = build_count_cube(scaled)
+
+        def from_rows():
+            scaled.groupby([col, target], observed=True).size()
+            scaled[scaled[target] == 1].groupby(col, observed=True).size()
+
+        rows.append({
+            "rows": len(scaled),
+            "cube build (s)": round(build_time, 2),
+            "plot data from rows (ms)": round(_best_time(from_rows) * 1e3, 2),
+            "plot data from cube (ms)": round(
+                _best_time(lambda: variable_counts(cube, col)) * 1e3, 2
+            ),
+        })
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def benchmark_cross_filter(scales=(1, 10)):
+    """
+    Times one filter change on the EDA page (the counts of the selected
+    cases and of the plotted variable per outcome) by scanning the rows and
+    with the bitmap index, on the cleaned dataset repeated scale times.
+    """
+    df = read_dataset(CLEANED_DATA_PATH, prepare=apply_schema)
+    col, target = "Fresh eggs collected", "Live birth occurrence"
+    filters = {
+        "Patient/Egg provider age": ["38-39"],
+        "Frozen cycle": ["1"],
+        "Embryos transferred": ["1e"],
+    }
+    rows = []
+    for scale in scales:
+        scaled = pd.concat([df] * scale, ignore_index=True)
+        build_time = _best_time(
+            lambda: BitmapIndex.from_frame(scaled), repeat=1
+        )
+        index = BitmapIndex.from_frame(scaled)
+
+        def from_rows():
+            mask = pd.Series(True, index=scaled.index)
+            for name, values in filters.items():
+                mask &= scaled[name].astype(str).isin(values)
+            selected = scaled[mask]
+            len(selected)
+            selected.groupby([col, target], observed=True).size()
+
+        def from_index():
+            index.count(filters)
+            index.variable_counts(col, filters)
+
+        rows.append({
+            "rows": len(scaled),
+            "index build (s)": round(build_time, 2),
+            "index (MiB)": round(index.bitmaps.nbytes / 2 ** 20, 1),
+            "filter from rows (ms)": round(_best_time(from_rows) * 1e3, 2),
+            "filter from index (ms)": round(
+                _best_time(from_index) * 1e3, 2
+            ),
+        })
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def benchmark_parallel_plot():
+    """
+    Payload and build time of the EDA parallel categories plot, from every
+    row with plotly express (as before) and from the weighted paths.
+    """
+    import plotly.express as px
+
+    from app_pages.page_eda_ivf_treatment import parallel_categories_figure
+
+    columns = [
+        "Date of embryo transfer",
+        "Elective single embryo transfer",
+        "Embryos transferred",
+        "Fresh eggs collected",
+        "Total eggs mixed",
+        "Total embryos created",
+        "Patient/Egg provider age",
+        "Partner/Sperm provider age",
+    ]
+    target = "Live birth occurrence"
+    df = read_dataset(
+        CLEANED_DATA_PATH, columns=columns + [target], prepare=apply_schema
+    )
+    df = df.assign(**{
+        "Total embryos created": df["Total embryos created"].astype(str),
+        target: df[target].astype("category").cat.codes,
+    })
+
+    def from_rows():
+        return px.parallel_categories(
+            df, color=target, color_continuous_scale="Viridis"
+        ).to_json()
+
+    def from_paths():
+        paths = category_paths(df, columns + [target])
+        return parallel_categories_figure(
+            paths, columns + [target], target
+        ).to_json()
+
+    print(f"{len(df)} rows, "
+          f"{len(category_paths(df, columns + [target]))} distinct paths")
+    for label, build in [("rows", from_rows), ("paths", from_paths)]:
+        payload = len(build())
+        build_time = _best_time(build)
+        print(f"{label:>6}: {payload / 2 ** 20:8.2f} MiB of JSON, "
+              f"built and serialised in {build_time * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    subparsers.add_parser(
+        "schema-memory",
+        help="Memory per column of the cleaned dataset, with the schema",
+    )
+    subparsers.add_parser(
+        "transformers",
+        help="Row-wise vs vectorized cleaning transformers",
+    )
+    subparsers.add_parser(
+        "cleaning-memory",
+        help="Peak memory of the cleaning pipeline, with and without copies",
+    )
+    subparsers.add_parser(
+        "cleaning-engines",
+        help="Cleaning pipeline vs the integer-code engine",
+    )
+    subparsers.add_parser(
+        "compiled-predictor",
+        help="Pandas vs compiled single-row prediction",
+    )
+    subparsers.add_parser(
+        "batch-scoring",
+        help="Chunked batch scoring vs looping the single-row path",
+    )
+    subparsers.add_parser(
+        "tree-ensemble",
+        help="scikit-learn vs the flattened tree ensemble",
+    )
+    subparsers.add_parser(
+        "cross-filter",
+        help="EDA filter change from the rows vs the bitmap index",
+    )
+    subparsers.add_parser(
+        "parallel-plot",
+        help="Parallel plot payload and build time, rows vs paths",
+    )
+    subparsers.add_parser(
+        "count-cube",
+        help="Plot aggregation from the rows vs the count cube",
+    )
+    subparsers.add_parser(
+        "dataset-sessions",
+        help="Memory of 1 vs 50 sessions, copied vs shared dataset",
+    )
+    subparsers.add_parser(
+        "widget-manifest",
+        help="Per-rerun data work of the live predictor's input widgets",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark == "schema-memory":
+        benchmark_schema_memory()
+    elif args.benchmark == "transformers":
+        benchmark_transformers()
+    elif args.benchmark == "cleaning-memory":
+        benchmark_cleaning_memory()
+    elif args.benchmark == "cleaning-engines":
+        benchmark_cleaning_engines()
+    elif args.benchmark == "compiled-predictor":
+        benchmark_compiled_predictor()
+    elif args.benchmark == "batch-scoring":
+        benchmark_batch_scoring()
+    elif args.benchmark == "tree-ensemble":
+        benchmark_tree_ensemble()
+    elif args.benchmark == "cross-filter":
+        benchmark_cross_filter()
+    elif args.benchmark == "parallel-plot":
+        benchmark_parallel_plot()
+    elif args.benchmark == "count-cube":
+        benchmark_count_cube()
+    elif args.benchmark == "dataset-sessions":
+        benchmark_dataset_sessions()
+    elif args.benchmark == "widget-manifest":
+        benchmark_widget_manifest()
@@ -0,0 +1,121 @@
+"""
+Import-time report for the dashboard and its pages.
+
+Run from the repository root, e.g.
+    python -m scripts.import_time_report --top 15
+
+Imports the app shell and each page module in a fresh interpreter with
+-X importtime, and reports the total import time and the slowest
+top-level packages of each, interpreter startup included. Exits with an
+error if the shell and the summary page import any of
+FORBIDDEN_FOR_SUMMARY that Streamlit itself does not import, or if a
+page exceeds --budget-ms.
+"""
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+
+
+# What the app imports before any page is selected
+APP_SHELL = ["app_pages.multipage", "src.warmup"]
+
+PAGES = {
+    "summary": "app_pages.page_summary",
+    "eda": "app_pages.page_eda_ivf_treatment",
+    "hypotheses": "app_pages.page_project_hypotheses",
+    "ml": "app_pages.page_ml_success_predictor",
+    "live": "app_pages.page_live_predictor",
+}
+
+# The landing page renders without the plotting and ML libraries. Streamlit
+# imports plotly on its own when it is installed (to register its plotly
+# theme), so packages imported by `import streamlit` are not held against
+# the page
+FORBIDDEN_FOR_SUMMARY = [
+    "sklearn",
+    "matplotlib",
+    "seaborn",
+    "plotly",
+    "feature_engine",
+    "tensorflow",
+    "keras",
+]
+
+
+def measure_imports(modules):
+    """
+    Imports the modules in a fresh interpreter. Returns the time spent in
+    each imported module itself (excluding its own imports), in
+    microseconds, keyed by module name.
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stderr
+    # Lines look like "import time:   self [us] | cumulative | name"
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(self_time)
+    return times
+
+
+def package_times(times):
+    """Returns the import time of each top-level package, in microseconds."""
+    packages = defaultdict(int)
+    for name, self_time in times.items():
+        packages[name.split(".")[0]] += self_time
+    return packages
+
+
+def report(label, times, top):
+    total = sum(times.values())
+    print(f"{label}: {total / 1e3:.0f} ms, {len(times)} modules")
+    packages = sorted(
+        package_times(times).items(), key=lambda item: item[1], reverse=True
+    )
+    for package, package_time in packages[:top]:
+        print(f"    {package_time / 1e3:8.1f} ms  {package}")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--top", type=int, default=10, help="Packages listed per page"
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=None,
+        help="Fail if a page, with the app shell, takes longer to import",
+    )
+    args = parser.parse_args()
+
+    failures = []
+    streamlit_packages = set(package_times(measure_imports(["streamlit"])))
+    shell = measure_imports(APP_SHELL)
+    report("app shell", shell, args.top)
+    for name, module in PAGES.items():
+        times = measure_imports(APP_SHELL + [module])
+        print()
+        total = report(f"{name} page ({module})", times, args.top)
+        if args.budget_ms is not None and total / 1e3 > args.budget_ms:
+            failures.append(
+                f"{name} page imports in {total / 1e3:.0f} ms, "
+                f"over the {args.budget_ms:.0f} ms budget"
+            )
+        if name == "summary":
+            imported = {imported.split(".")[0] for imported in times}
+            for package in FORBIDDEN_FOR_SUMMARY:
+                if package in imported - streamlit_packages:
+                    failures.append(f"summary page imports {package}")
+
+    if failures:
+        raise SystemExit("\n".join(["", *failures]))
@@ -0,0 +1,90 @@
+"""
+Load test for the inference service (src/inference_service.py).
+
+Start the service, then run from the repository root, e.g.
+    python -m scripts.load_test --url http://localhost:8000 --concurrency 32
+
+Sends single-case requests built from the cleaned dataset and reports the
+p50/p99 latency and the throughput.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import pandas as pd
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+
+CLEANED_DATA_PATH = (
+    "outputs/datasets/cleaned/FertilityTreatmentDataCleaned.csv"
+)
+BEST_FEATURES_PATH = (
+    "outputs/ml_pipeline/ivf_success_predictor/v1/best_features.csv"
+)
+
+
+def sample_cases(n_cases):
+    """Returns n_cases request bodies sampled from the cleaned dataset."""
+    best_features = pd.read_csv(BEST_FEATURES_PATH)["feature"].tolist()
+    cases = pd.read_csv(CLEANED_DATA_PATH, usecols=best_features).sample(
+        n=n_cases, replace=True, random_state=0
+    )
+    # Through JSON so numpy integers become plain numbers
+    return [
+        json.dumps(case)
+        for case in json.loads(cases.to_json(orient="records"))
+    ]
+
+
+async def run_load_test(url, bodies, concurrency):
+    """
+    Sends every body to /predict with at most `concurrency` requests in
+    flight. Returns the latency of each request in seconds, the number of
+    failed requests and the total wall time.
+    """
+    client = AsyncHTTPClient(max_clients=concurrency)
+    queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+    latencies = []
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        while not queue.empty():
+            body = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                await client.fetch(f"{url}/predict", method="POST", body=body)
+            except (HTTPClientError, OSError):
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, failures, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    bodies = sample_cases(args.requests)
+    latencies, failures, elapsed = asyncio.run(
+        run_load_test(args.url, bodies, args.concurrency)
+    )
+    if len(latencies) < 2:
+        raise SystemExit(f"Only {len(latencies)} requests succeeded")
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f"    requests: {len(latencies)} ok, {failures} failed")
+    print(f" concurrency: {args.concurrency}")
+    print(f"         p50: {percentiles[49] * 1e3:.1f} ms")
+    print(f"         p99: {percentiles[98] * 1e3:.1f} ms")
+    print(f"  throughput: {len(latencies) / elapsed:.0f} requests/s")
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+from src.count_cube import TARGET
+
+
+# Bump when the layout of the index changes, so stored indexes are rebuilt
+BITMAP_INDEX_VERSION = "1"
+# Columns with more distinct values than this are not indexed: each value
+# costs one bitmap of len(df) / 8 bytes
+MAX_INDEX_VALUES = 64
+
+# Number of set bits of every byte value, and of every pair of bytes
+POPCOUNT_TABLE = np.array(
+    [bin(byte).count("1") for byte in range(256)], dtype=np.uint8
+)
+POPCOUNT_TABLE_16 = (POPCOUNT_TABLE[:, None] + POPCOUNT_TABLE).ravel()
+
+
+def popcount(bits):
+    """Returns the number of set bits of a packed bitmap."""
+    if hasattr(np, "bitwise_count"):
+        # numpy >= 2.0 counts with the CPU's popcount instruction
+        return int(np.bitwise_count(bits).sum(dtype=np.int64))
+    # Two bytes per lookup (the table is symmetric, so byte order does
+    # not matter), and the odd last byte on its own
+    even = len(bits) & ~1
+    pairs = POPCOUNT_TABLE_16.take(bits[:even].view(np.uint16))
+    return int(
+        pairs.sum(dtype=np.int64)
+        + POPCOUNT_TABLE[bits[even:]].sum(dtype=np.int64)
+    )
+
+
+class BitmapIndex:
+    """
+    One bitmap per value of each indexed column of a dataset: bit i of the
+    bitmap of a value is set when row i has that value. The bitmaps are
+    packed eight rows per byte (np.packbits) in one 2D array, so the index
+    of the cleaned dataset takes len(df) / 8 bytes per value and can be
+    memory-mapped from the disk cache.
+
+    A filter is a dict of column: values. The values of one column are
+    combined with OR and the columns with AND, so any conjunction of
+    filters is evaluated with bitwise operations over the packed bitmaps,
+    and its counts with popcount, without scanning the rows.
+
+    Values are the labels of the count cube (the values as strings), in
+    the same order, so counts from either draw the same plots. Missing
+    values are not indexed, like they are not counted in the cube.
+    """
+
+    def __init__(self, n_rows, values, bitmaps):
+        self.n_rows = n_rows
+        # Column: list of value labels, in index order
+        self.values = values
+        self.bitmaps = bitmaps
+        # (column, label): row of the value's bitmap in bitmaps
+        self._positions = {}
+        for col, labels in values.items():
+            for label in labels:
+                self._positions[(col, label)] = len(self._positions)
+
+    @classmethod
+    def from_frame(cls, df, max_values=MAX_INDEX_VALUES):
+        """
+        Builds the index of every column of df with at most max_values
+        distinct values.
+        """
+        values = {}
+        bitmaps = []
+        for col in df.columns:
+            if df[col].nunique() > max_values:
+                continue
+            # Sorted like the groupby of the count cube: category order for
+            # categoricals, value order otherwise; missing values get -1
+            codes, uniques = pd.factorize(df[col], sort=True)
+            values[col] = [str(value) for value in uniques]
+            for code in range(len(uniques)):
+                bitmaps.append(np.packbits(codes == code))
+        n_bytes = (len(df) + 7) // 8
+        bitmaps = (
+            np.vstack(bitmaps) if bitmaps
+            else np.empty((0, n_bytes), dtype=np.uint8)
+        )
+        return cls(len(df), values, bitmaps)
+
+    @property
+    def columns(self):
+        return list(self.values)
+
+    def bitmap(self, col, label):
+        """Returns the bitmap of the rows where col has the value label."""
+        return self.bitmaps[self._positions[(col, label)]]
+
+    def select(self, filters, exclude=None):
+        """
+        Returns the bitmap of the rows matching every filter but the one on
+        the exclude column, or None when no filter applies (every row).
+        Columns filtered with no values are not filtered. Labels the index
+        does not hold match no rows, e.g. a value kept in a session's
+        filter after the dataset was refreshed without it.
+        """
+        selection = None
+        for col, labels in filters.items():
+            if col == exclude or not labels:
+                continue
+            matches = np.zeros(self.bitmaps.shape[1], dtype=np.uint8)
+            for label in labels:
+                position = self._positions.get((col, label))
+                if position is not None:
+                    np.bitwise_or(
+                        matches, self.bitmaps[position], out=matches
+                    )
+            if selection is None:
+                selection = matches
+            else:
+                np.bitwise_and(selection, matches, out=selection)
+        return selection
+
+    def count(self, filters):
+        """Returns the number of rows matching every filter."""
+        selection = self.select(filters)
+        if selection is None:
+            return self.n_rows
+        return popcount(selection)
+
+    def variable_counts(self, col, filters, target=TARGET):
+        """
+        Returns the counts of col per target value among the rows matching
+        the filters, in the layout of count_cube.variable_counts: indexed by
+        the value labels, one column per target value. The filter on col
+        itself is left out, so its plot shows every value of col among the
+        cases the other filters select. Values without any matching row
+        are dropped, as in the cube.
+        """
+        selection = self.select(filters, exclude=col)
+        selected = np.empty(self.bitmaps.shape[1], dtype=np.uint8)
+        buffer = np.empty_like(selected)
+        targets = [
+            self.bitmap(target, target_label)
+            for target_label in self.values[target]
+        ]
+
+        counts = np.zeros(
+            (len(self.values[col]), len(targets)), dtype=np.int64
+        )
+        for i, label in enumerate(self.values[col]):
+            # Restricted to the selection once per value, not once per
+            # value and target
+            value_rows = self.bitmap(col, label)
+            if selection is not None:
+                value_rows = np.bitwise_and(
+                    value_rows, selection, out=selected
+                )
+            for j, rows in enumerate(targets):
+                np.bitwise_and(value_rows, rows, out=buffer)
+                counts[i, j] = popcount(buffer)
+
+        counts = pd.DataFrame(
+            counts,
+            index=pd.Index(self.values[col], name="value"),
+            columns=pd.Index(
+                [int(label) for label in self.values[target]],
+                name=target,
+            ),
+        )
+        return counts[counts.sum(axis=1) > 0]
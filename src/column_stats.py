@@ -0,0 +1,119 @@
+import math
+
+import pandas as pd
+
+
+# Numeric columns with at most this many distinct values keep the list of
+# their values, so 0/1 flags can be told apart from counts
+MAX_TRACKED_VALUES = 2
+
+
+def column_stats(df):
+    """
+    Returns summary statistics of every column of df, as plain Python
+    values that can be stored as JSON and merged with merge_column_stats
+    without the rows they were computed from. Missing values are left out.
+    - numeric columns: the count, sum, minimum and maximum of the values,
+      and the sorted distinct values if there are at most
+      MAX_TRACKED_VALUES of them (None otherwise)
+    - other columns: the count and the sorted distinct labels, as strings
+    """
+    stats = {}
+    for col in df.columns:
+        values = df[col].dropna()
+        if pd.api.types.is_numeric_dtype(df[col]):
+            distinct = values.unique()
+            stats[col] = {
+                "kind": "numeric",
+                "count": int(len(values)),
+                "sum": values.sum().item(),
+                "min": values.min().item() if len(values) else None,
+                "max": values.max().item() if len(values) else None,
+                "values": (
+                    sorted(value.item() for value in distinct)
+                    if len(distinct) <= MAX_TRACKED_VALUES else None
+                ),
+            }
+        else:
+            stats[col] = {
+                "kind": "labels",
+                "count": int(len(values)),
+                "labels": sorted(str(value) for value in values.unique()),
+            }
+    return stats
+
+
+def merge_column_stats(stats, other):
+    """
+    Returns the statistics of the rows of stats and other together, e.g.
+    of a dataset and the rows appended to it, for the columns of stats.
+    Raises a ValueError if a column is numeric in one and not the other.
+    """
+    merged = {}
+    for col, current in stats.items():
+        if col not in other:
+            merged[col] = current
+            continue
+        new = other[col]
+        if new["kind"] != current["kind"]:
+            raise ValueError(
+                f"{col} is {current['kind']} in the dataset but "
+                f"{new['kind']} in the new rows"
+            )
+        if current["kind"] == "labels":
+            merged[col] = {
+                "kind": "labels",
+                "count": current["count"] + new["count"],
+                "labels": sorted(set(current["labels"]) | set(new["labels"])),
+            }
+            continue
+
+        values = None
+        if current["values"] is not None and new["values"] is not None:
+            values = sorted(set(current["values"]) | set(new["values"]))
+            if len(values) > MAX_TRACKED_VALUES:
+                values = None
+        merged[col] = {
+            "kind": "numeric",
+            "count": current["count"] + new["count"],
+            "sum": current["sum"] + new["sum"],
+            "min": _bound(min, current["min"], new["min"]),
+            "max": _bound(max, current["max"], new["max"]),
+            "values": values,
+        }
+    return merged
+
+
+def mean(column):
+    """Returns the mean of a numeric column from its statistics."""
+    if not column["count"]:
+        return math.nan
+    return column["sum"] / column["count"]
+
+
+def same_column_stats(stats, other):
+    """
+    True if two sets of statistics are equal, up to the rounding of the
+    sums of float columns, which depends on the order the rows are added.
+    """
+    if stats.keys() != other.keys():
+        return False
+    for col, current in stats.items():
+        new = other[col]
+        if current.keys() != new.keys():
+            return False
+        for field, value in current.items():
+            if field == "sum" and not math.isclose(
+                    value, new[field], rel_tol=1e-9, abs_tol=1e-9):
+                return False
+            if field != "sum" and value != new[field]:
+                return False
+    return True
+
+
+def _bound(func, current, new):
+    if current is None:
+        return new
+    if new is None:
+        return current
+    return func(current, new)
@@ -0,0 +1,135 @@
+import pandas as pd
+
+from src.data_schema import categorical_dtype
+
+
+TARGET = "Live birth occurrence"
+# Columns with more distinct values than this (continuous measurements)
+# are left out of the cube
+MAX_CUBE_VALUES = 1000
+
+
+def build_count_cube(df, target=TARGET, max_values=MAX_CUBE_VALUES):
+    """
+    Counts the rows of every (column value, target value) pair, for each
+    column of df but the target. Returns a long frame with the columns
+    "variable", "value" (the label of the value, as a string), the target
+    and "count". Only observed pairs are kept and missing values are not
+    counted, like a countplot or groupby of the rows would do; the values
+    of each variable are in groupby order (category order for
+    categoricals, sorted otherwise).
+    """
+    parts = []
+    for col in df.columns:
+        if col == target or df[col].nunique() > max_values:
+            continue
+        counts = (
+            df.groupby([col, target], observed=True)
+            .size()
+            .reset_index(name="count")
+        )
+        counts = counts[counts["count"] > 0]
+        parts.append(pd.DataFrame({
+            "variable": col,
+            "value": counts[col].astype(str).to_numpy(),
+            target: counts[target].astype("int64").to_numpy(),
+            "count": counts["count"].astype("int64").to_numpy(),
+        }))
+    if not parts:
+        return pd.DataFrame(columns=["variable", "value", target, "count"])
+    return pd.concat(parts, ignore_index=True)
+
+
+def merge_count_cubes(cube, other, target=TARGET):
+    """
+    Returns the counts of cube and other added up, e.g. the cube of a
+    dataset and the cube of the rows appended to it, as build_count_cube
+    would count their rows together. Only the variables of cube are kept:
+    a column left out of it stays out. Values new to a variable take their
+    place in the groupby order a rebuild would give them.
+    """
+    other = other[other["variable"].isin(pd.unique(cube["variable"]))]
+    merged = (
+        pd.concat([cube, other], ignore_index=True)
+        .groupby(["variable", "value", target], sort=False)["count"]
+        .sum()
+        .reset_index()
+    )
+    parts = []
+    for variable in pd.unique(cube["variable"]):
+        rows = merged[merged["variable"] == variable]
+        order = value_order(variable, pd.unique(rows["value"]))
+        rank = {value: i for i, value in enumerate(order)}
+        parts.append(
+            rows.assign(_rank=rows["value"].map(rank))
+            .sort_values(["_rank", target], kind="stable")
+            .drop(columns="_rank")
+        )
+    if not parts:
+        return merged
+    return pd.concat(parts, ignore_index=True)
+
+
+def value_order(variable, labels):
+    """
+    Returns the value labels of a variable in the order a groupby of the
+    cleaned dataset puts them: category order for the columns declared in
+    src/data_schema.py, numeric order for numbers, text order otherwise.
+    """
+    labels = pd.Series(labels)
+    dtype = categorical_dtype(variable, labels)
+    if dtype is not None:
+        present = set(labels)
+        return [value for value in dtype.categories if value in present]
+    numbers = pd.to_numeric(labels, errors="coerce")
+    if numbers.notna().all():
+        return list(labels.iloc[numbers.argsort(kind="stable")])
+    return sorted(labels)
+
+
+def variable_counts(cube, variable, target=TARGET):
+    """
+    Returns the counts of one variable as a frame indexed by its value
+    labels (in cube order) with one column per target value of the cube.
+    """
+    rows = cube[cube["variable"] == variable]
+    counts = rows.pivot(index="value", columns=target, values="count")
+    counts = counts.reindex(
+        index=pd.unique(rows["value"]),
+        columns=sorted(pd.unique(cube[target])),
+    )
+    return counts.fillna(0).astype("int64")
+
+
+def long_counts(counts, variable, target=TARGET):
+    """
+    Returns the counts of variable_counts as a long frame with the columns
+    variable, target and "count", e.g. for a seaborn bar plot.
+    """
+    return (
+        counts.rename_axis(index=variable, columns=target)
+        .stack()
+        .reset_index(name="count")
+    )
+
+
+def category_paths(df, columns):
+    """
+    Counts the rows of every distinct combination (path) of the values of
+    columns. Returns a frame with the columns and "count", one row per
+    path in order of first appearance, so each column's categories also
+    keep their order of first appearance. Missing values are counted as
+    a category of their own.
+    """
+    return (
+        df.groupby(columns, sort=False, observed=True, dropna=False)
+        .size()
+        .reset_index(name="count")
+    )
+
+
+def top_paths(paths, k):
+    """Returns the k most common paths, in their original order."""
+    if k is None or k >= len(paths):
+        return paths
+    return paths.nlargest(k, "count").sort_index()
@@ -1,39 +1,113 @@
+import numpy as np
 import pandas as pd
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.preprocessing import OrdinalEncoder
+from src.data_schema import apply_schema
 
 
+# DataFrame.attrs flag for frames shared through a cache; transformers never
+# modify such frames in place
+READ_ONLY_ATTR = "read_only"
 
 
-class FilterIVFTreatments(BaseEstimator, TransformerMixin):
+def mark_read_only(df):
+    """Flags a DataFrame as shared so no transformer modifies it in place."""
+    df.attrs[READ_ONLY_ATTR] = True
+    return df
+
+
+class InputOwnershipMixin:
+    """
+    Ownership model shared by the transformers in this module.
+
+    With copy=True (the default) a transformer never modifies its input.
+    With copy=False it modifies the input in place and returns it, which
+    avoids one full copy of the frame per pipeline step. Frames flagged with
+    mark_read_only are still copied, so shared cached frames are never
+    modified.
+    """
+
+    # Class default for transformers pickled before the parameter existed
+    copy = True
+
+    def _modifies_input(self, X):
+        return not self.copy and not X.attrs.get(READ_ONLY_ATTR, False)
+
+    def _own(self, X):
+        """Returns X itself if it may be modified in place, else a copy."""
+        if self._modifies_input(X):
+            return X
+        X = X.copy()
+        X.attrs = {k: v for k, v in X.attrs.items() if k != READ_ONLY_ATTR}
+        return X
+
+
+class CopyInput(BaseEstimator, TransformerMixin):
+    """
+    Copies the input once at the entrance of a copy-free pipeline (see
+    src.data_cleaning.copy_free_pipeline), so the steps after it can modify
+    the frame in place without touching the caller's data.
+    """
+
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        return X.query(
-            "`Main reason for producing embroys storing eggs` == 'Treatment - IVF'"
-        )
+        X = X.copy()
+        X.attrs = {k: v for k, v in X.attrs.items() if k != READ_ONLY_ATTR}
+        return X
 
 
-class DropErroneousEntries(BaseEstimator, TransformerMixin):
+class FilterIVFTreatments(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True):
+        self.copy = copy
+
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        return X.drop(
-            X[(X["Live birth occurrence"] == 1) & (X["Embryos transferred"] == 0)].index
+        if not self._modifies_input(X):
+            return X.query(
+                "`Main reason for producing embroys storing eggs` == "
+                "'Treatment - IVF'"
+            )
+        X.drop(
+            X.index[
+                X["Main reason for producing embroys storing eggs"]
+                != "Treatment - IVF"
+            ],
+            inplace=True,
         )
+        return X
+
+
+class DropErroneousEntries(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True):
+        self.copy = copy
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        erroneous = X[
+            (X["Live birth occurrence"] == 1) & (X["Embryos transferred"] == 0)
+        ].index
+        if not self._modifies_input(X):
+            return X.drop(erroneous)
+        X.drop(erroneous, inplace=True)
+        return X
 
 
-class ConvertToNumeric(BaseEstimator, TransformerMixin):
-    def __init__(self, columns):
+class ConvertToNumeric(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, columns, copy=True):
         self.columns = columns
+        self.copy = copy
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
+        X = self._own(X)
         for col in self.columns:
             # Replace '>3' with 4
             X[col] = X[col].replace(">3", 4)
@@ -42,46 +116,51 @@ class ConvertToNumeric(BaseEstimator, TransformerMixin):
         return X
 
 
-class ConvertToIntegers(BaseEstimator, TransformerMixin):
-    def __init__(self, columns):
+class ConvertToIntegers(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, columns, copy=True):
         self.columns = columns
+        self.copy = copy
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
+        X = self._own(X)
         for col in self.columns:
             # Replace '>3' with 4 and convert to int
             X[col] = X[col].replace(">3", 4).astype(float).astype(int)
         return X
 
 
-class FillSpermSource(BaseEstimator, TransformerMixin):
+class FillSpermSource(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True):
+        self.copy = copy
+
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
-        X["Sperm source"] = X.apply(self._fill_sperm_source, axis=1)
+        X = self._own(X)
+        # Missing sources are "Donor" if a donor age is recorded,
+        # otherwise "Partner"
+        missing_source = X["Sperm source"].isna()
+        has_donor_age = X["Sperm donor age at registration"].notna()
+        X["Sperm source"] = X["Sperm source"].mask(
+            missing_source, np.where(has_donor_age, "Donor", "Partner")
+        )
         return X
 
-    def _fill_sperm_source(self, row):
-        if pd.isna(row["Sperm source"]):
-            if not pd.isna(row["Sperm donor age at registration"]):
-                return "Donor"
-            else:
-                return "Partner"
-        return row["Sperm source"]
-
 
 # Convert float values to integers and handle NaN values
-class ConvertToIntAndReplace999(BaseEstimator, TransformerMixin):
+class ConvertToIntAndReplace999(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True):
+        self.copy = copy
+
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
+        X = self._own(X)
         # Fill NaN with -1 and convert to int
         X["Date of embryo transfer"] = (
             X["Date of embryo transfer"].fillna(-1).astype(int)
@@ -92,53 +171,59 @@ class ConvertToIntAndReplace999(BaseEstimator, TransformerMixin):
 
 
 # Replace missing values based on the "Embryos transferred" column
-class ReplaceMissingValues(BaseEstimator, TransformerMixin):
+class ReplaceMissingValues(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True):
+        self.copy = copy
+
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
-        X["Date of embryo transfer"] = X.apply(self._replace_missing, axis=1)
+        X = self._own(X)
+        # -1 marks a missing date: "NT" if no embryo was transferred,
+        # otherwise "Missing"
+        missing_date = X["Date of embryo transfer"] == -1
+        not_transferred = X["Embryos transferred"] == 0
+        X["Date of embryo transfer"] = (
+            X["Date of embryo transfer"]
+            .mask(missing_date & not_transferred, "NT")
+            .mask(missing_date & ~not_transferred, "Missing")
+        )
         return X
 
-    def _replace_missing(self, row):
-        value = row["Date of embryo transfer"]
-        if value == -1 and row["Embryos transferred"] == 0:
-            return "NT"
-        elif value == -1:
-            return "Missing"
-        return value
-
 
 # Append strings based on the "Fresh cycle" and "Frozen cycle" values
-class AppendCycleType(BaseEstimator, TransformerMixin):
+class AppendCycleType(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True):
+        self.copy = copy
+
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
-        X["Date of embryo transfer"] = X.apply(self._append_cycle_type, axis=1)
+        X = self._own(X)
+        dates = X["Date of embryo transfer"]
+        # Fresh takes precedence over frozen, anything else is mixed
+        cycle_type = np.select(
+            [X["Fresh cycle"] == 1, X["Frozen cycle"] == 1],
+            [" - fresh", " - frozen"],
+            default=" - Mixed fresh/frozen",
+        )
+        X["Date of embryo transfer"] = dates.where(
+            dates.isin(["NT", "Missing"]), dates.astype(str) + cycle_type
+        )
         return X
 
-    def _append_cycle_type(self, row):
-        value = row["Date of embryo transfer"]
-        if value not in ["NT", "Missing"]:
-            if row["Fresh cycle"] == 1:
-                value = f"{value} - fresh"
-            elif row["Frozen cycle"] == 1:
-                value = f"{value} - frozen"
-            else:
-                value = f"{value} - Mixed fresh/frozen"
-        return value
-
 
-class MicroInjectedEmbryos(BaseEstimator, TransformerMixin):
+class MicroInjectedEmbryos(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True):
+        self.copy = copy
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
+        X = self._own(X)
 
         # Embryos transferred from eggs micro-injected imputation
         missing_micro_injected = X[
@@ -158,8 +243,9 @@ class MicroInjectedEmbryos(BaseEstimator, TransformerMixin):
         return X
 
 
-class DonorAgeImputer(BaseEstimator, TransformerMixin):
-    def __init__(self):
+class DonorAgeImputer(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True):
+        self.copy = copy
         # Mapping from donor age ranges to patient/partner age ranges
         self.egg_age_map = {
             "Between 21 and 25": "18-34",
@@ -182,7 +268,7 @@ class DonorAgeImputer(BaseEstimator, TransformerMixin):
         return self
 
     def transform(self, X):
-        X = X.copy()
+        X = self._own(X)
 
         # Egg donor age imputation
         X["Egg donor age at registration"] = X["Egg donor age at registration"].map(
@@ -224,9 +310,19 @@ class DonorAgeImputer(BaseEstimator, TransformerMixin):
         return X
 
 
-class FloatToIntTransformer(BaseEstimator, TransformerMixin):
-    def __init__(self):
+class FloatToIntTransformer(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    """
+    Converts the columns that were float at fit time to integers.
+
+    The float columns are learned once in fit and reused by every later
+    transform. When the data is cleaned in chunks (see
+    src/data_cleaning.py) all chunks are read with file-wide dtypes, so the
+    same columns are converted in every chunk.
+    """
+
+    def __init__(self, copy=True):
         self.float_vars = None
+        self.copy = copy
 
     def fit(self, X, y=None):
         # Identify float columns
@@ -234,42 +330,42 @@ class FloatToIntTransformer(BaseEstimator, TransformerMixin):
         return self
 
     def transform(self, X):
-        X = X.copy()
+        X = self._own(X)
         for var in self.float_vars:
             X[var] = X[var].astype(int)
         return X
 
 
-class EFlaggingTransformer(BaseEstimator, TransformerMixin):
+class EFlaggingTransformer(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, copy=True):
+        self.copy = copy
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
+        X = self._own(X)
 
-        X["Embryos transferred"] = X.apply(self.append_e, axis=1)
+        # A single embryo electively transferred is flagged as "1e"
+        elective_single = (X["Embryos transferred"] == 1) & (
+            X["Elective single embryo transfer"] == 1
+        )
+        X["Embryos transferred"] = X["Embryos transferred"].mask(
+            elective_single, "1e"
+        )
         return X
 
-    def append_e(self, row):
-        if (
-            row["Embryos transferred"] == 1
-            and row["Elective single embryo transfer"] == 1
-        ):
-            return "1e"
-        else:
-            return row["Embryos transferred"]
-
 
-class TypeOfCycleAppender(BaseEstimator, TransformerMixin):
-    def __init__(self, columns_to_update):
+class TypeOfCycleAppender(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, columns_to_update, copy=True):
         self.columns_to_update = columns_to_update
+        self.copy = copy
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
+        X = self._own(X)
 
         # Ensure columns have the correct data type to avoid issues
         for column in self.columns_to_update:
@@ -291,31 +387,51 @@ class TypeOfCycleAppender(BaseEstimator, TransformerMixin):
         return X
 
 
-class DropRowsWith999(BaseEstimator, TransformerMixin):
+class DropRowsWith999(InputOwnershipMixin, BaseEstimator, TransformerMixin):
     """
     Custom transformer to drop rows with the value "999" in any column.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, copy=True):
+        self.copy = copy
 
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
-        X = X.copy()
-
         # Drop rows where any column has the value "999"
-        X_filtered = X[(X != "999").all(axis=1)]
+        keep = (X != "999").all(axis=1)
+        if not self._modifies_input(X):
+            # Boolean indexing already returns a new frame
+            return X[keep]
+        X.drop(X.index[~keep], inplace=True)
+        return X
 
-        return X_filtered
+
+class ApplyCategoricalSchema(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    """
+    Casts the cleaned columns to the dtypes declared in src/data_schema.py
+    (ordered categoricals for the binned columns, int8 for flags), so the
+    cleaning pipeline emits the same schema the app loads. Meant as the last
+    step of the data cleaning pipeline.
+    """
+
+    def __init__(self, copy=True):
+        self.copy = copy
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        return apply_schema(X, copy=not self._modifies_input(X))
 
 
 # For Ordinal Enconding to have a proper order:
-class OrdinalEncoderWithCategories(BaseEstimator, TransformerMixin):
-    def __init__(self, categories, columns):
+class OrdinalEncoderWithCategories(InputOwnershipMixin, BaseEstimator, TransformerMixin):
+    def __init__(self, categories, columns, copy=True):
         self.categories = categories
         self.columns = columns
+        self.copy = copy
         self.encoder = OrdinalEncoder(categories=categories)
 
     def fit(self, X, y=None):
@@ -330,6 +446,7 @@ class OrdinalEncoderWithCategories(BaseEstimator, TransformerMixin):
         return self
 
     def transform(self, X):
+        X = self._own(X)
         transformed = self.encoder.transform(X[self.columns])
         # Return a DataFrame with the original column names
         X[self.columns] = pd.DataFrame(
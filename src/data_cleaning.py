@@ -0,0 +1,572 @@
+import argparse
+import os
+from copy import deepcopy
+
+import joblib
+import numpy as np
+import pandas as pd
+from feature_engine.imputation import ArbitraryNumberImputer, DropMissingData
+from feature_engine.selection import DropFeatures
+from sklearn.exceptions import NotFittedError
+from sklearn.pipeline import Pipeline
+from sklearn.utils.validation import check_is_fitted
+
+# Custom Transformers saved under src/custom_transformers.py
+from src.custom_transformers import (
+    CopyInput,
+    InputOwnershipMixin,
+    FilterIVFTreatments,
+    DropErroneousEntries,
+    ConvertToNumeric,
+    ConvertToIntegers,
+    FillSpermSource,
+    ConvertToIntAndReplace999,
+    ReplaceMissingValues,
+    AppendCycleType,
+    MicroInjectedEmbryos,
+    DonorAgeImputer,
+    FloatToIntTransformer,
+    EFlaggingTransformer,
+    TypeOfCycleAppender,
+    DropRowsWith999
+)
+
+
+# Rows per chunk; peak memory is a small multiple of one chunk
+DEFAULT_CHUNKSIZE = 20_000
+# Fitted in "02 - Data Cleaning.ipynb"
+DATA_CLEANING_PIPELINE_PATH = (
+    "outputs/ivf_success_predictor/data_cleaning_pipeline/v1/"
+    "data_cleaning_pipeline.pkl"
+)
+
+# Columns to drop, as in "02 - Data Cleaning.ipynb"
+COLUMNS_TO_DROP = [
+    "Total number of previous DI cycles",
+    "Main reason for producing embroys storing eggs",
+    "Type of treatment - IVF or DI",
+    "Donated embryo",
+    "Eggs thawed (0/1)",
+    "Year of treatment",
+    "Number of live births",
+    "Embryos stored for use by patient",
+    "Fresh eggs stored (0/1)",
+    "Heart three birth congenital abnormalities",
+    "Heart two birth congenital abnormalities",
+    "Heart three delivery date",
+    "Heart three sex",
+    "Heart three birth weight",
+    "Heart three weeks gestation",
+    "Heart three birth outcome",
+    "Heart one birth congenital abnormalities",
+    "Heart two birth weight",
+    "Heart two delivery date",
+    "Heart two sex",
+    "Heart two weeks gestation",
+    "Heart two birth outcome",
+    "Heart one birth weight",
+    "Heart one weeks gestation",
+    "Heart one delivery date",
+    "Heart one sex",
+    "Heart one birth outcome",
+    "Number of foetal sacs with fetal pulsation",
+    "Early outcome",
+    "Partner ethnicity",
+    "Partner Type"
+]
+
+# Columns to be updated with the type of cycle
+COLUMNS_TO_UPDATE = [
+    "Fresh eggs collected",
+    "Total eggs mixed",
+    "Total embryos created",
+]
+
+# Counts reported as ">3" in the raw data
+PREVIOUS_OUTCOME_COLUMNS = [
+    "Total number of previous pregnancies - IVF and DI",
+    "Total number of previous live births - IVF or DI",
+]
+
+
+def PipelineDataCleaning():
+    """
+    Returns the unfitted data cleaning pipeline defined in
+    "02 - Data Cleaning.ipynb".
+    """
+    pipeline_base = Pipeline(
+        [
+            ("filter_ivf", FilterIVFTreatments()),
+            ("drop_erroneous", DropErroneousEntries()),
+            ("drop_columns", DropFeatures(features_to_drop=COLUMNS_TO_DROP)),
+            (
+                "convert_to_numeric",
+                ConvertToNumeric(columns=PREVIOUS_OUTCOME_COLUMNS),
+            ),
+            (
+                "zeros_imputer",
+                ArbitraryNumberImputer(
+                    arbitrary_number=0,
+                    variables=PREVIOUS_OUTCOME_COLUMNS,
+                ),
+            ),
+            (
+                "convert_to_int",
+                ConvertToIntegers(columns=PREVIOUS_OUTCOME_COLUMNS),
+            ),
+            ("fill_sperm_source", FillSpermSource()),
+            ("dot_to_int_999", ConvertToIntAndReplace999()),
+            ("replace_missing_values", ReplaceMissingValues()),
+            ("append_cycle_type", AppendCycleType()),
+            ("micro_injected", MicroInjectedEmbryos()),
+            ("donor_age", DonorAgeImputer()),
+            ("float_to_int", FloatToIntTransformer()),
+            ("e_flagging", EFlaggingTransformer()),
+            (
+                "type_of_cycle",
+                TypeOfCycleAppender(columns_to_update=COLUMNS_TO_UPDATE),
+            ),
+            ("drop_999", DropRowsWith999()),
+            ("drop_missing_data", DropMissingData()),
+        ]
+    )
+
+    return pipeline_base
+
+
+def copy_free_pipeline(pipeline):
+    """
+    Returns a copy of a fitted or unfitted cleaning pipeline that copies its
+    input once at the entrance and lets every custom step modify that frame
+    in place, instead of copying the whole frame at every step. Frames
+    flagged read-only are still never modified.
+    """
+    steps = deepcopy(pipeline.steps)
+    for _, step in steps:
+        if isinstance(step, InputOwnershipMixin):
+            step.copy = False
+    return Pipeline([("copy_input", CopyInput())] + steps)
+
+
+def clean_in_chunks(
+        pipeline,
+        source_path,
+        destination_path,
+        chunksize=DEFAULT_CHUNKSIZE,
+        dtype=None
+        ):
+    """
+    Streams a raw treatment CSV through the data cleaning pipeline and
+    appends each cleaned chunk to the destination CSV, so peak memory is
+    bounded by the chunk size instead of the dataset size.
+
+    Every chunk is read with the same file-wide dtypes (see
+    scan_csv_dtypes), so a chunk without missing values is typed exactly
+    as it would be in a full read. Steps that learn state keep the state of
+    a fitted pipeline (e.g. the float columns picked by
+    FloatToIntTransformer). An unfitted pipeline is fitted once on the first
+    chunk and then only transforms the remaining chunks. The chunks run
+    through a copy-free version of the pipeline, so the caller's pipeline
+    is left as it was.
+
+    Returns the number of cleaned rows written.
+    """
+    if dtype is None:
+        dtype = scan_csv_dtypes(source_path, chunksize=chunksize)
+
+    fitted = _is_fitted(pipeline)
+    pipeline = copy_free_pipeline(pipeline)
+    # Write next to the destination and swap at the end, so a failed run
+    # never leaves a truncated cleaned dataset behind
+    tmp_path = f"{destination_path}.tmp"
+    n_rows = 0
+    write_header = True
+
+    for chunk in pd.read_csv(source_path, chunksize=chunksize, dtype=dtype):
+        if not fitted:
+            pipeline.fit(chunk)
+            fitted = True
+        cleaned = pipeline.transform(chunk)
+        cleaned.to_csv(
+            tmp_path,
+            mode="w" if write_header else "a",
+            header=write_header,
+            index=False,
+        )
+        write_header = False
+        n_rows += len(cleaned)
+
+    os.replace(tmp_path, destination_path)
+    return n_rows
+
+
+def scan_csv_dtypes(source_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Infers the dtype a full pd.read_csv would give each column by reading
+    the file chunk by chunk and widening the per-chunk dtypes.
+    """
+    dtypes = {}
+    for chunk in pd.read_csv(source_path, chunksize=chunksize):
+        for col, chunk_dtype in chunk.dtypes.items():
+            dtypes[col] = _widen_dtype(dtypes.get(col), chunk_dtype)
+    return dtypes
+
+
+def read_appended_rows(source_path, start, dtype):
+    """
+    Reads the rows of a CSV after its first start rows (header excluded),
+    e.g. a year of records appended to the collection dataset. dtype holds
+    the file-wide dtypes of the first rows (see scan_csv_dtypes); the new
+    rows are parsed with those dtypes widened by their own, as a full read
+    of the file would parse them.
+
+    Returns the rows and the widened dtypes. Where the widened dtype of a
+    column differs from dtype, a full read would also parse the first rows
+    differently than they were.
+    """
+    skiprows = range(1, start + 1)
+    rows = pd.read_csv(source_path, skiprows=skiprows)
+    widened = {
+        col: _widen_dtype(dtype.get(col), new)
+        for col, new in rows.dtypes.items()
+    }
+    if any(rows[col].dtype != widened[col] for col in rows.columns):
+        # Parse again rather than cast, so e.g. numbers in a text column
+        # are read as text like in the first rows
+        rows = pd.read_csv(source_path, skiprows=skiprows, dtype=widened)
+    return rows, widened
+
+
+def _widen_dtype(current, new):
+    """Returns the narrowest dtype able to hold values of both dtypes."""
+    if current is None or current == new:
+        return new
+    numeric = (
+        pd.api.types.is_numeric_dtype(current)
+        and pd.api.types.is_numeric_dtype(new)
+        and not pd.api.types.is_bool_dtype(current)
+        and not pd.api.types.is_bool_dtype(new)
+    )
+    if numeric:
+        # A column is only integer if it is integer in every chunk
+        if (pd.api.types.is_float_dtype(current)
+                or pd.api.types.is_float_dtype(new)):
+            return np.dtype("float64")
+        return np.dtype("int64")
+    return np.dtype(object)
+
+
+# Text columns of the raw data the integer-code engine reads as
+# categoricals, i.e. factorized once while parsing
+RAW_TEXT_COLUMNS = [
+    "Main reason for producing embroys storing eggs",
+    "Patient age at treatment",
+    "Total number of previous IVF cycles",
+    "Total number of previous live births - IVF or DI",
+    "Specific treatment type",
+    "Egg source",
+    "Sperm source",
+    "Egg donor age at registration",
+    "Sperm donor age at registration",
+    "Partner age",
+    "Fresh eggs collected",
+    "Total eggs mixed",
+    "Total embryos created",
+    "Total embryos thawed",
+    "Patient ethnicity",
+]
+
+CYCLE_TYPE_SUFFIXES = [" - fresh", " - frozen", " - Mixed fresh/frozen"]
+
+
+def read_raw_for_codes(source_path):
+    """
+    Reads the raw CSV for clean_with_codes: only the columns the cleaning
+    keeps (plus the treatment filter), with the text columns parsed
+    straight into categoricals.
+    """
+    return pd.read_csv(
+        source_path,
+        usecols=lambda col: (
+            col not in COLUMNS_TO_DROP
+            or col == "Main reason for producing embroys storing eggs"
+        ),
+        dtype={col: "category" for col in RAW_TEXT_COLUMNS},
+    )
+
+
+def clean_csv_with_codes(source_path, destination_path):
+    """
+    Cleans a whole raw treatment CSV with the integer-code engine and
+    writes the cleaned CSV. Returns the number of cleaned rows written.
+    """
+    cleaned = clean_with_codes(read_raw_for_codes(source_path))
+    tmp_path = f"{destination_path}.tmp"
+    cleaned.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, destination_path)
+    return len(cleaned)
+
+
+def clean_with_codes(raw):
+    """
+    Integer-code engine for the data cleaning pipeline: returns the same
+    frame as PipelineDataCleaning().fit_transform(raw), index included.
+
+    Every text column is factorized once into integer codes (-1 for a
+    missing value) and its distinct labels. The cleaning rules are then
+    evaluated once per distinct label and applied to the rows as lookups
+    on the code arrays, the row filters only combine boolean masks, and
+    the labels of the surviving rows are materialised at the very end.
+    Columns may be plain or categorical (see read_raw_for_codes).
+    """
+    # filter_ivf and drop_erroneous
+    reason_codes, reason_labels = _encode(
+        raw["Main reason for producing embroys storing eggs"]
+    )
+    keep = _lookup(reason_codes, reason_labels == "Treatment - IVF", False)
+    live_birth = raw["Live birth occurrence"].to_numpy()
+    embryos = raw["Embryos transferred"].to_numpy(dtype=float)
+    keep &= ~((live_birth == 1) & (embryos == 0))
+    rows = np.flatnonzero(keep)
+
+    columns = [
+        col for col in raw.columns
+        if col not in COLUMNS_TO_DROP and col != "Partner age"
+    ]
+    text_cols = {col for col in columns if _is_text(raw[col])}
+    coded = {
+        col: _encode(raw[col], rows) for col in text_cols
+        if col not in PREVIOUS_OUTCOME_COLUMNS
+    }
+    numeric = {
+        col: raw[col].to_numpy()[rows] for col in columns
+        if col not in text_cols
+    }
+    embryos = embryos[rows]
+    fresh = numeric["Fresh cycle"] == 1
+    frozen = numeric["Frozen cycle"] == 1
+
+    # convert_to_numeric, zeros_imputer and convert_to_int
+    for col in PREVIOUS_OUTCOME_COLUMNS:
+        codes, labels = _encode(raw[col], rows)
+        values = [4.0 if label == ">3" else float(label) for label in labels]
+        numeric[col] = _lookup(codes, values, 0.0).astype(int)
+
+    # fill_sperm_source
+    codes, labels = coded["Sperm source"]
+    sperm_donor_codes, _ = coded["Sperm donor age at registration"]
+    filled = np.where(sperm_donor_codes >= 0, len(labels), len(labels) + 1)
+    coded["Sperm source"] = (
+        np.where(codes >= 0, codes, filled),
+        np.append(labels, ["Donor", "Partner"]),
+    )
+
+    # dot_to_int_999, replace_missing_values and append_cycle_type: codes
+    # 0 and 1 are "NT" and "Missing", then one code per day and cycle type
+    days = numeric.pop("Date of embryo transfer")
+    days = np.where(np.isnan(days), -1, days).astype(int)
+    days[days == 999] = 0
+    known_days = np.unique(days[days >= 0])
+    cycle_type = np.select([fresh, frozen], [0, 1], default=2)
+    date_codes = np.where(
+        days >= 0,
+        2 + np.searchsorted(known_days, days) * len(CYCLE_TYPE_SUFFIXES)
+        + cycle_type,
+        np.where(embryos == 0, 0, 1),
+    )
+    coded["Date of embryo transfer"] = (
+        date_codes,
+        np.array(
+            ["NT", "Missing"] + [
+                f"{day}{suffix}"
+                for day in known_days for suffix in CYCLE_TYPE_SUFFIXES
+            ],
+            dtype=object,
+        ),
+    )
+
+    # micro_injected
+    col = "Embryos transferred from eggs micro-injected"
+    micro = numeric[col].astype(float)
+    codes, labels = coded["Specific treatment type"]
+    icsi = _lookup(codes, ["ICSI" in str(label) for label in labels], False)
+    missing = np.isnan(micro)
+    micro[missing & icsi] = embryos[missing & icsi]
+    micro[missing & ~icsi] = 0
+    numeric[col] = micro
+
+    # donor_age
+    age_maps = DonorAgeImputer()
+    for donor_col, source_col, source, fallback_col, age_map in [
+        (
+            "Egg donor age at registration", "Egg source", "Patient",
+            "Patient age at treatment", age_maps.egg_age_map,
+        ),
+        (
+            "Sperm donor age at registration", "Sperm source", "Partner",
+            "Partner age", age_maps.sperm_age_map,
+        ),
+    ]:
+        codes, labels = _map_labels(*coded[donor_col], age_map)
+        source_codes, source_labels = coded[source_col]
+        use_fallback = (codes < 0) & _lookup(
+            source_codes, source_labels == source, False
+        )
+        fallback_codes, fallback_labels = (
+            coded[fallback_col] if fallback_col in coded
+            else _encode(raw[fallback_col], rows)
+        )
+        coded[donor_col] = (
+            np.where(
+                use_fallback,
+                np.where(fallback_codes >= 0, fallback_codes + len(labels), -1),
+                codes,
+            ),
+            np.concatenate([labels, fallback_labels]),
+        )
+
+    # float_to_int
+    for col, values in numeric.items():
+        if values.dtype.kind == "f":
+            if np.isnan(values).any():
+                raise ValueError(
+                    f"Cannot convert {col} to integers: missing values left"
+                )
+            numeric[col] = values.astype(int)
+
+    # e_flagging: 1e gets the code after the transferred counts
+    counts = numeric["Embryos transferred"]
+    elective_single = (counts == 1) & (
+        numeric["Elective single embryo transfer"] == 1
+    )
+    if elective_single.any():
+        known_counts = np.unique(counts)
+        codes = np.searchsorted(known_counts, counts)
+        codes[elective_single] = len(known_counts)
+        coded["Embryos transferred"] = (
+            codes, np.array(known_counts.tolist() + ["1e"], dtype=object)
+        )
+        del numeric["Embryos transferred"]
+
+    # type_of_cycle: missing values become the "nan" label, like astype(str)
+    for col, cycle, label in (
+        [(col, frozen, "0 - frozen cycle") for col in COLUMNS_TO_UPDATE]
+        + [("Total embryos thawed", fresh, "0 - fresh cycle")]
+    ):
+        codes, labels = coded[col]
+        labels = np.array(
+            [str(value) for value in labels] + ["nan", label], dtype=object
+        )
+        codes = np.where(codes >= 0, codes, len(labels) - 2)
+        is_zero = _lookup(codes, labels == "0", False)
+        codes[cycle & is_zero] = len(labels) - 1
+        coded[col] = (codes, labels)
+
+    # drop_999 and drop_missing_data
+    drop = np.zeros(len(rows), dtype=bool)
+    for codes, labels in coded.values():
+        drop |= (codes < 0) | _lookup(codes, labels == "999", False)
+    kept = ~drop
+
+    renamed = {
+        "Egg donor age at registration": "Patient/Egg provider age",
+        "Sperm donor age at registration": "Partner/Sperm provider age",
+    }
+    data = {}
+    for col in columns:
+        if col in coded:
+            codes, labels = coded[col]
+            values = _lookup(codes[kept], labels, np.nan)
+        else:
+            values = numeric[col][kept]
+        data[renamed.get(col, col)] = values
+    return pd.DataFrame(data, index=raw.index[rows[kept]])
+
+
+def _is_text(values):
+    return values.dtype == object or isinstance(
+        values.dtype, pd.CategoricalDtype
+    )
+
+
+def _encode(values, rows=None):
+    """
+    Returns the integer codes of a column (-1 for a missing value) and the
+    label of each code, optionally restricted to the given row positions.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        labels = np.asarray(values.cat.categories, dtype=object)
+    else:
+        codes, labels = pd.factorize(values)
+        labels = np.asarray(labels, dtype=object)
+    if rows is not None:
+        codes = codes[rows]
+    return codes, labels
+
+
+def _lookup(codes, table, missing):
+    """
+    Looks every code up in a per-label table. The missing value is stored
+    after the last label so that code -1 picks it up.
+    """
+    table = np.asarray(table)
+    if table.dtype == object:
+        table = np.append(table, np.array([missing], dtype=object))
+    else:
+        table = np.append(table, missing)
+    return table[codes]
+
+
+def _map_labels(codes, labels, mapping):
+    """
+    Maps every label through a dict, like Series.map: labels missing from
+    the dict become missing values.
+    """
+    targets = np.array(sorted(set(mapping.values())), dtype=object)
+    positions = {target: i for i, target in enumerate(targets)}
+    table = [positions.get(mapping.get(label), -1) for label in labels]
+    return _lookup(codes, np.array(table, dtype=np.int64), -1), targets
+
+
+def _is_fitted(pipeline):
+    try:
+        check_is_fitted(pipeline)
+    except NotFittedError:
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Clean a raw treatment CSV in bounded memory."
+    )
+    parser.add_argument("source", help="Raw CSV (optionally gzipped)")
+    parser.add_argument("destination", help="Cleaned CSV to write")
+    parser.add_argument(
+        "--pipeline",
+        default=DATA_CLEANING_PIPELINE_PATH,
+        help="Fitted data cleaning pipeline",
+    )
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument(
+        "--engine",
+        choices=["pipeline", "codes"],
+        default="pipeline",
+        help=(
+            "'pipeline' streams chunks through the fitted pipeline, 'codes' "
+            "cleans the whole file at once with the integer-code engine"
+        ),
+    )
+    args = parser.parse_args()
+
+    if args.engine == "codes":
+        rows = clean_csv_with_codes(args.source, args.destination)
+    else:
+        rows = clean_in_chunks(
+            joblib.load(args.pipeline),
+            args.source,
+            args.destination,
+            chunksize=args.chunksize,
+        )
+    print(f"{rows} cleaned rows written to {args.destination}")
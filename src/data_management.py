@@ -1,51 +1,385 @@
 import streamlit as st
 import pandas as pd
 import joblib
-import gzip
+import json
+import os
 
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.ipc as ipc
+
+from src.bitmap_index import BITMAP_INDEX_VERSION, BitmapIndex
+from src.column_stats import column_stats
+from src.count_cube import build_count_cube
+from src.disk_cache import cache_key, disk_cache
+from src.data_schema import SCHEMA_VERSION, apply_schema, categorical_dtype
+from src.model_registry import (
+    DEFAULT_VERSION,
+    file_sha256,
+    read_gzip_pickle,
+    registry,
+)
+
+
+RAW_DATA_PATH = "outputs/datasets/collection/FertilityTreatmentData.csv.gz"
+CLEANED_DATA_PATH = (
+    "outputs/datasets/cleaned/FertilityTreatmentDataCleaned.csv"
+)
+# Columnar copies of the datasets above, rebuilt whenever the source changes
+DATASET_CACHE_DIR = "outputs/datasets/cache"
+# Bump when the layout of the cached tables changes to force a rebuild;
+# a new dataset schema also invalidates the cached tables
+CACHE_FORMAT_VERSION = f"2-{SCHEMA_VERSION}"
+
+
+# Cached entries per loader and dataset version: the column subsets the
+# pages ask for. Entries of a replaced dataset are evicted as the new one
+# is loaded
+MAX_CACHED_ENTRIES = 8
 
 
 # Load IVF treatment data
-@st.cache_data
-def load_ifv_treatment_data():
-    """Loads the cleaned IVF treatment data from a CSV file."""
-    df = pd.read_csv(
-        "outputs/datasets/cleaned/FertilityTreatmentDataCleaned.csv"
-        )
-    return df
+def load_ifv_treatment_data(columns=None):
+    """
+    Loads the cleaned IVF treatment data, optionally restricted to the
+    given columns. Binned columns are ordered categoricals as declared in
+    src/data_schema.py.
+
+    The frame is shared by every session, without a copy per call, and
+    must not be modified: take a copy (e.g. with filter) to change it.
+    It is cached per version of the dataset file, so a new cleaned
+    dataset (e.g. from src/incremental_refresh.py) is loaded by a running
+    server.
+    """
+    return _load_ifv_treatment_data(
+        file_fingerprint(CLEANED_DATA_PATH), columns
+    )
+
+
+@st.cache_resource(max_entries=MAX_CACHED_ENTRIES)
+def _load_ifv_treatment_data(fingerprint, columns):
+    return read_dataset(
+        CLEANED_DATA_PATH, columns=columns, prepare=apply_schema
+    )
+
+
+def load_count_cube():
+    """
+    Loads the (value x Live birth occurrence) counts of every column of the
+    cleaned IVF treatment data, see src/count_cube.py. Cached per version
+    of the dataset, like load_ifv_treatment_data.
+    """
+    return _load_count_cube(file_fingerprint(CLEANED_DATA_PATH))
+
+
+@st.cache_resource(max_entries=1)
+def _load_count_cube(fingerprint):
+    return read_count_cube(CLEANED_DATA_PATH, prepare=apply_schema)
+
+
+def load_bitmap_index():
+    """
+    Loads the bitmap index of the cleaned IVF treatment data, see
+    src/bitmap_index.py. Built once per version of the dataset and kept in
+    the disk cache, where every process memory-maps it. Cached per version
+    of the dataset, like load_ifv_treatment_data.
+    """
+    return _load_bitmap_index(file_fingerprint(CLEANED_DATA_PATH))
 
-@st.cache_data
-def load_ifv_treatment_data_before_cleaning():
-    """Loads the IVF treatment data from a CSV file before cleaning."""
-    df = pd.read_csv(
-        "outputs/datasets/collection/FertilityTreatmentData.csv.gz"
+
+@st.cache_resource(max_entries=1)
+def _load_bitmap_index(fingerprint):
+    return read_bitmap_index(CLEANED_DATA_PATH, prepare=apply_schema)
+
+
+def load_ifv_treatment_data_before_cleaning(columns=None):
+    """
+    Loads the IVF treatment data before cleaning. Shared and cached per
+    version of the file like load_ifv_treatment_data, so it must not be
+    modified.
+    """
+    return _load_ifv_treatment_data_before_cleaning(
+        file_fingerprint(RAW_DATA_PATH), columns
+    )
+
+
+@st.cache_resource(max_entries=MAX_CACHED_ENTRIES)
+def _load_ifv_treatment_data_before_cleaning(fingerprint, columns):
+    # The cleaning transformers expect plain strings, not categoricals
+    return read_dataset(RAW_DATA_PATH, columns=columns, categorical=False)
+
+
+def read_dataset(source_path, columns=None, categorical=True, prepare=None):
+    """
+    Reads a CSV dataset through its columnar cache.
+
+    The first read parses the CSV, applies prepare (e.g. a dtype schema) if
+    given and stores it as an Arrow IPC file with the text columns
+    dictionary-encoded, tagged with a fingerprint of the source file. Later
+    reads memory-map that file and only materialise the requested columns.
+    The cache is rebuilt when the source file changes.
+    """
+    fingerprint = file_fingerprint(source_path)
+    cache_path = dataset_cache_path(source_path)
+
+    if cached_fingerprint(cache_path) != fingerprint:
+        # One dtype per column over the whole file, as chunked inference
+        # can mix numbers and strings in a column Arrow cannot store
+        df = pd.read_csv(source_path, low_memory=False)
+        if prepare is not None:
+            df = prepare(df)
+        table = _dataframe_to_table(df, fingerprint)
+        try:
+            _write_table(table, cache_path)
+        except OSError:
+            # A read-only file system only costs the cache, not the data
+            pass
+        if columns is not None:
+            table = table.select(list(columns))
+    else:
+        table = feather.read_table(
+            cache_path,
+            columns=None if columns is None else list(columns),
+            memory_map=True,
         )
+
+    # Numeric columns of a memory-mapped table stay views of the file
+    df = table.to_pandas(split_blocks=True)
+    if not categorical:
+        for col in df.select_dtypes(include="category").columns:
+            df[col] = df[col].astype(object)
     return df
 
+
+def read_count_cube(source_path, prepare=None):
+    """
+    Reads the count cube of a CSV dataset, stored next to its columnar
+    cache and rebuilt from the dataset when the source file changes.
+    """
+    fingerprint = file_fingerprint(source_path)
+    cube_path = count_cube_path(source_path)
+    if cached_fingerprint(cube_path) == fingerprint:
+        cube = feather.read_table(cube_path).to_pandas()
+        # Labels are stored dictionary-encoded; the plots want plain text
+        return cube.astype({"variable": object, "value": object})
+
+    cube = build_count_cube(read_dataset(source_path, prepare=prepare))
+    try:
+        write_count_cube(cube, source_path, fingerprint)
+    except OSError:
+        pass
+    return cube
+
+
+def write_count_cube(cube, source_path, fingerprint):
+    """
+    Stores the count cube of a CSV dataset, tagged with the fingerprint of
+    the source file it counts.
+    """
+    _write_table(
+        _dataframe_to_table(cube, fingerprint), count_cube_path(source_path)
+    )
+
+
+def read_bitmap_index(source_path, prepare=None):
+    """
+    Reads the bitmap index of a CSV dataset from the disk cache, building
+    it from the dataset when the source file changes.
+    """
+    key = cache_key(
+        "bitmap_index",
+        file_fingerprint(source_path),
+        CACHE_FORMAT_VERSION,
+        BITMAP_INDEX_VERSION,
+    )
+    return disk_cache.get_or_compute(
+        key,
+        lambda: BitmapIndex.from_frame(
+            read_dataset(source_path, prepare=prepare)
+        ),
+    )
+
+
+def count_cube_path(source_path):
+    """Returns the path of the count cube of a CSV dataset."""
+    return dataset_cache_path(source_path).replace(".arrow", "-counts.arrow")
+
+
+def read_column_stats(source_path, prepare=None):
+    """
+    Reads the column statistics of a CSV dataset (see src/column_stats.py),
+    stored next to its columnar cache and rebuilt from the dataset when
+    the source file changes.
+    """
+    fingerprint = file_fingerprint(source_path)
+    try:
+        with open(column_stats_path(source_path)) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        stored = {}
+    if (stored.get("cache_format") == CACHE_FORMAT_VERSION
+            and stored.get("source_fingerprint") == fingerprint):
+        return stored["stats"]
+
+    stats = column_stats(read_dataset(source_path, prepare=prepare))
+    try:
+        write_column_stats(stats, source_path, fingerprint)
+    except OSError:
+        pass
+    return stats
+
+
+def write_column_stats(stats, source_path, fingerprint):
+    """
+    Stores the column statistics of a CSV dataset atomically, tagged with
+    the fingerprint of the source file they describe.
+    """
+    path = column_stats_path(source_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "cache_format": CACHE_FORMAT_VERSION,
+            "source_fingerprint": fingerprint,
+            "stats": stats,
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def column_stats_path(source_path):
+    """Returns the path of the column statistics of a CSV dataset."""
+    return dataset_cache_path(source_path).replace(".arrow", "-stats.json")
+
+
+def append_to_dataset_cache(df, new_rows, source_path, fingerprint):
+    """
+    Replaces the columnar cache of a CSV dataset with its rows df followed
+    by new_rows (both prepared by read_dataset's prepare), tagged with the
+    fingerprint of the source file holding them all, so the next read does
+    not parse the whole CSV again. Categorical columns get the categories
+    a read of the whole file would give them.
+    """
+    new_rows = new_rows[list(df.columns)]
+    for col in df.columns:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        values = pd.unique(pd.concat([
+            pd.Series(df[col].cat.categories),
+            new_rows[col].dropna().astype(str),
+        ]))
+        dtype = categorical_dtype(col, values)
+        if dtype is None:
+            # Text columns not declared in the schema, whose categories
+            # are sorted when the cache is written
+            dtype = pd.CategoricalDtype(sorted(values))
+        df = df.assign(**{col: df[col].astype(dtype)})
+        new_rows = new_rows.assign(**{col: new_rows[col].astype(dtype)})
+    rows = pd.concat([df, new_rows], ignore_index=True)
+    _write_table(
+        _dataframe_to_table(rows, fingerprint), dataset_cache_path(source_path)
+    )
+
+
+def dataset_cache_path(source_path):
+    """Returns the path of the columnar cache for a CSV dataset."""
+    name = os.path.basename(source_path).split(".")[0]
+    return os.path.join(DATASET_CACHE_DIR, f"{name}.arrow")
+
+
+def file_fingerprint(file_path):
+    """Returns a SHA-256 fingerprint of the file contents."""
+    return file_sha256(file_path)
+
+
+def cached_fingerprint(cache_path):
+    """
+    Returns the source fingerprint stored in a columnar cache file, or None
+    if the file is missing, unreadable or written by another cache format.
+    """
+    try:
+        with pa.memory_map(cache_path) as source:
+            metadata = ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if metadata.get(b"cache_format") != CACHE_FORMAT_VERSION.encode():
+        return None
+    fingerprint = metadata.get(b"source_fingerprint")
+    return fingerprint.decode() if fingerprint else None
+
+
+def _dataframe_to_table(df, fingerprint):
+    """
+    Converts a DataFrame into an Arrow table with an explicit schema, where
+    the binned text columns become dictionaries of their labels.
+    """
+    df = df.copy()
+    fields = []
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype("category")
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            n_categories = len(df[col].cat.categories)
+            index_type = pa.int8() if n_categories < 2 ** 7 else pa.int32()
+            arrow_type = pa.dictionary(
+                index_type, pa.string(), ordered=df[col].cat.ordered
+            )
+        else:
+            arrow_type = pa.from_numpy_dtype(df[col].dtype)
+        fields.append(pa.field(col, arrow_type))
+
+    table = pa.Table.from_pandas(
+        df, schema=pa.schema(fields), preserve_index=False
+    )
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"source_fingerprint"] = fingerprint.encode()
+    metadata[b"cache_format"] = CACHE_FORMAT_VERSION.encode()
+    return table.replace_schema_metadata(metadata)
+
+
+def _write_table(table, cache_path):
+    """Writes the table atomically so concurrent readers never see a stub."""
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    # Uncompressed so the file can be memory-mapped without decoding
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, cache_path)
+
+
 # Load a pickle file using joblib
-@st.cache_data
+@st.cache_resource
 def load_pkl_file(file_path):
-    """Loads a pickle file using joblib."""
+    """
+    Loads a pickle file using joblib. The object is shared by every
+    session and must not be modified.
+    """
     return joblib.load(file_path)
 
 
 # Load a gzip-compressed pickle file using joblib
-@st.cache_data
+@st.cache_resource
 def load_gzip_file(file_path):
-    """Loads a gzip-compressed pickle file using joblib."""
-    with gzip.open(file_path, "rb") as f:
-        return joblib.load(f)
+    """
+    Loads a gzip-compressed pickle file using joblib, through the disk
+    cache: the decompressed copy is shared by every process of the host
+    and survives restarts. The object is shared by every session and must
+    not be modified.
+    """
+    return read_gzip_pickle(file_path)
 
 
-def load_best_features(version="v1"):
+def load_clf_model(version=DEFAULT_VERSION):
+    """
+    Loads the classification model of a version through the model
+    registry, from its compact artifact if it was exported.
+    """
+    return registry.load_model(version)
+
+
+def load_best_features(version=DEFAULT_VERSION):
     """Load best features from the CSV file saved in the output directory."""
     try:
-        best_features_df = pd.read_csv(
-            f"outputs/ml_pipeline/ivf_success_predictor/"
-            f"{version}/best_features.csv"
-        )
-        # Convert DataFrame column to a list
-        best_features = best_features_df["feature"].tolist()
+        # Cached by the model registry; copied so callers may modify it
+        best_features = list(registry.get("best_features", version))
 
     except FileNotFoundError:
         st.error(
@@ -57,4 +391,3 @@ def load_best_features(version="v1"):
         best_features = []
 
     return best_features
-
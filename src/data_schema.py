@@ -0,0 +1,131 @@
+import pandas as pd
+
+
+# Bump when any of the declarations below change
+SCHEMA_VERSION = "1"
+
+AGE_BANDS = ["18-34", "35-37", "38-39", "40-42", "43-44", "45-50"]
+EGG_BINS = [
+    "0", "0 - frozen cycle", "1-5", "6-10", "11-15", "16-20", "21-25",
+    "26-30", "31-35", "36-40", ">40",
+]
+
+# Same category orders as the ordinal encoder in
+# "05 - Modeling and Evaluation Predict Success.ipynb"
+ORDERED_CATEGORIES = {
+    "Patient age at treatment": AGE_BANDS,
+    "Total number of previous IVF cycles": [
+        "0", "1", "2", "3", "4", "5", ">5"
+    ],
+    "Patient/Egg provider age": AGE_BANDS,
+    "Partner/Sperm provider age": AGE_BANDS + ["51-55", "56-60", ">60"],
+    "Fresh eggs collected": EGG_BINS,
+    "Total eggs mixed": EGG_BINS,
+    "Total embryos created": [
+        "0", "0 - frozen cycle", "1-5", "6-10", "11-15", "16-20", "21-25",
+        "26-30", ">30",
+    ],
+    "Embryos transferred": ["0", "1", "1e", "2", "3"],
+    "Total embryos thawed": [
+        "0 - fresh cycle", "0 - frozen cycle", "1-5", "6-10", ">10"
+    ],
+    # Same order as the count plot on the EDA page
+    "Date of embryo transfer": [
+        "0 - fresh", "1 - fresh", "2 - fresh", "3 - fresh", "4 - fresh",
+        "5 - fresh", "6 - fresh", "7 - fresh",
+        "0 - frozen", "1 - frozen", "2 - frozen", "3 - frozen", "4 - frozen",
+        "5 - frozen", "6 - frozen", "7 - frozen",
+        "2 - Mixed fresh/frozen", "3 - Mixed fresh/frozen",
+        "5 - Mixed fresh/frozen", "6 - Mixed fresh/frozen",
+        "Missing", "NT",
+    ],
+}
+
+NOMINAL_CATEGORIES = {
+    "Specific treatment type": [
+        "ICSI", "ICSI:IVF", "ICSI:Unknown", "IVF", "IVF:Unknown", "Unknown"
+    ],
+    "Egg source": ["Donor", "Patient"],
+    "Sperm source": ["Donor", "Partner"],
+    "Patient ethnicity": ["Asian", "Black", "Mixed", "Other", "White"],
+}
+
+# 0/1 flags and small counts
+INT8_COLUMNS = [
+    "Total number of previous pregnancies - IVF and DI",
+    "Total number of previous live births - IVF or DI",
+    "Causes of infertility - tubal disease",
+    "Causes of infertility - ovulatory disorder",
+    "Causes of infertility - male factor",
+    "Causes of infertility - patient unexplained",
+    "Causes of infertility - endometriosis",
+    "Stimulation used",
+    "PGT-M treatment",
+    "PGT-A treatment",
+    "Elective single embryo transfer",
+    "Fresh cycle",
+    "Frozen cycle",
+    "Embryos transferred from eggs micro-injected",
+    "Live birth occurrence",
+]
+
+
+def categorical_dtype(col, extra_values=()):
+    """
+    Returns the declared CategoricalDtype of a column, or None if the
+    column is not categorical. Values missing from the declaration are
+    appended after the declared categories so no data is lost.
+    """
+    if col in ORDERED_CATEGORIES:
+        categories, ordered = ORDERED_CATEGORIES[col], True
+    elif col in NOMINAL_CATEGORIES:
+        categories, ordered = NOMINAL_CATEGORIES[col], False
+    else:
+        return None
+    extra = sorted(set(extra_values) - set(categories))
+    return pd.CategoricalDtype(categories + extra, ordered=ordered)
+
+
+def apply_schema(df, copy=True):
+    """
+    Casts the cleaned dataset columns to their declared dtypes. Columns that
+    are not declared are left untouched. With copy=False the columns of df
+    are replaced in place.
+    """
+    if copy:
+        df = df.copy()
+    for col in df.columns:
+        values = df[col]
+        if col in ORDERED_CATEGORIES or col in NOMINAL_CATEGORIES:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                # Labels can be mixed with numbers, e.g. 1 and "1e"
+                values = values.astype(str).mask(values.isna())
+            dtype = categorical_dtype(col, values.dropna().unique())
+            df[col] = values.astype(dtype)
+        elif col in INT8_COLUMNS and _fits_int8(values):
+            df[col] = values.astype("int8")
+    return df
+
+
+def _fits_int8(values):
+    return (
+        pd.api.types.is_numeric_dtype(values)
+        and values.notna().all()
+        and (values.empty or (values.min() >= -128 and values.max() <= 127))
+    )
+
+
+def schema_memory_report(df):
+    """
+    Returns the memory used by each column before and after applying the
+    schema, in bytes, largest columns first.
+    """
+    before = df.memory_usage(index=False, deep=True)
+    after = apply_schema(df).memory_usage(index=False, deep=True)
+    report = pd.DataFrame({"before": before, "after": after})
+    report["ratio"] = (report["before"] / report["after"]).round(1)
+    report = report.sort_values(by="before", ascending=False)
+    report.loc["Total"] = [
+        before.sum(), after.sum(), round(before.sum() / after.sum(), 1)
+    ]
+    return report
@@ -0,0 +1,232 @@
+"""
+Disk-backed cache shared by the processes of one host.
+
+Show the counters and contents, or empty the cache, from the repository
+root, e.g.
+    python -m src.disk_cache stats
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import joblib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+DISK_CACHE_DIR = "outputs/cache"
+# Upper bound of the size of the cache directory, in bytes
+DEFAULT_MAX_BYTES = 2 * 2 ** 30
+# Entries older than this are rebuilt, in seconds
+DEFAULT_TTL = 7 * 24 * 3600
+# DataFrames are stored as Arrow IPC files, anything else with joblib
+SUFFIXES = (".arrow", ".joblib")
+
+# Returned by get when there is no valid entry
+MISSING = object()
+
+
+def cache_key(*parts):
+    """
+    Returns the key of a cache entry from what its value is computed
+    from, e.g. a loader name and the content hash of its source file.
+    """
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Cache of DataFrames and other objects in a directory, keyed by content
+    hash and shared by every process of the host.
+
+    Entries are written to a temporary file and renamed into place, so
+    other processes only ever see complete files. DataFrames are read by
+    memory-mapping their Arrow file: numeric columns without missing
+    values are read-only views of the file rather than copies. Other
+    objects are loaded with joblib and their numpy arrays memory-mapped
+    read-only. A value from the cache must therefore not be modified.
+
+    Entries expire ttl seconds after they were written. When the directory
+    grows over max_bytes the least recently read entries are removed;
+    readers that already mapped a removed file keep their view of it.
+    hits, misses and evictions count the lookups of this process.
+    """
+
+    def __init__(
+            self,
+            directory=DISK_CACHE_DIR,
+            max_bytes=DEFAULT_MAX_BYTES,
+            ttl=DEFAULT_TTL
+            ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value of a key, or MISSING."""
+        for suffix in SUFFIXES:
+            path = self._path(key, suffix)
+            try:
+                stat = os.stat(path)
+                if time.time() - stat.st_mtime > self.ttl:
+                    self._remove(path)
+                    break
+                value = _read(path, suffix)
+            except (OSError, pa.ArrowInvalid, EOFError, ValueError):
+                # Missing, evicted by another process or unreadable
+                continue
+            # The access time orders the eviction; the modification time,
+            # left as it was, is the age of the entry
+            try:
+                os.utime(path, (time.time(), stat.st_mtime))
+            except OSError:
+                pass
+            self._count("hits")
+            return value
+        self._count("misses")
+        return MISSING
+
+    def put(self, key, value):
+        """
+        Stores a value, then evicts entries if the cache is over its size.
+        Returns the path of the entry.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        suffix = ".arrow" if isinstance(value, pd.DataFrame) else ".joblib"
+        path = self._path(key, suffix)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if suffix == ".arrow":
+                try:
+                    # Uncompressed so the file can be memory-mapped
+                    feather.write_feather(
+                        value, tmp_path, compression="uncompressed"
+                    )
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    # Columns Arrow cannot type, e.g. mixed objects
+                    suffix = ".joblib"
+                    path = self._path(key, suffix)
+            if suffix == ".joblib":
+                joblib.dump(value, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+        return path
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value of a key, computing and storing it on a
+        miss. A cache that cannot be written (e.g. a read-only file system)
+        only costs the caching, not the value.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        value = compute()
+        try:
+            path = self.put(key, value)
+        except OSError:
+            return value
+        # Read back so every process gets the same memory-mapped value
+        suffix = os.path.splitext(path)[1]
+        try:
+            return _read(path, suffix)
+        except (OSError, pa.ArrowInvalid, EOFError, ValueError):
+            return value
+
+    def evict(self):
+        """
+        Removes the expired entries, then the least recently read ones
+        until the cache fits in max_bytes.
+        """
+        now = time.time()
+        entries = []
+        for stat, path in self._entries():
+            if now - stat.st_mtime > self.ttl:
+                self._remove(path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for _, path in self._entries():
+            self._remove(path)
+
+    def stats(self):
+        """Returns the counters of this process and the size of the cache."""
+        entries = list(self._entries())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(stat.st_size for stat, _ in entries),
+        }
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(SUFFIXES):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                yield os.stat(path), path
+            except FileNotFoundError:
+                continue
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Already removed by another process
+            return
+        self._count("evictions")
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def _read(path, suffix):
+    if suffix == ".arrow":
+        table = feather.read_table(path, memory_map=True)
+        return table.to_pandas(split_blocks=True)
+    return joblib.load(path, mmap_mode="r")
+
+
+# Shared by the loaders of the app process
+disk_cache = DiskCache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("command", choices=["stats", "clear"])
+    args = parser.parse_args()
+
+    if args.command == "clear":
+        disk_cache.clear()
+    stats = disk_cache.stats()
+    print(f"{stats['entries']} entries, {stats['bytes'] / 2 ** 20:.1f} MiB "
+          f"in {disk_cache.directory}")
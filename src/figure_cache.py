@@ -0,0 +1,135 @@
+import io
+import threading
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+import streamlit as st
+
+from src.data_management import CLEANED_DATA_PATH, file_fingerprint
+
+
+# Upper bound of the memory held by the rendered figures, in bytes
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+# Same resolution as st.pyplot
+PNG_DPI = 200
+# Style of the seaborn plots; part of the key so a new style re-renders
+FIGURE_STYLE = "whitegrid"
+
+
+class FigureCache:
+    """
+    Process-wide LRU cache of rendered figures: PNG bytes of matplotlib
+    figures and JSON of plotly figures. When the rendered figures take
+    more than max_bytes, the least recently shown ones are evicted.
+
+    Matplotlib figures are closed as soon as they are rendered, whether
+    the rendering succeeded or not, so pyplot does not keep a reference
+    to every figure drawn since the worker started.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def cached_bytes(self):
+        return self._bytes
+
+    def png(self, key, draw):
+        """
+        Returns the PNG bytes of the figure drawn by draw(), which returns
+        a matplotlib Figure, rendering it on a miss.
+        """
+        return self._get(key, lambda: _render_png(draw))
+
+    def plotly_json(self, key, draw):
+        """
+        Returns the JSON of the plotly figure returned by draw(), building
+        it on a miss.
+        """
+        return self._get(key, lambda: draw().to_json())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _get(self, key, render):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # Rendered outside the lock; two sessions asking for the same new
+        # figure at once may both render it
+        value = render()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = value
+                self._bytes += len(value)
+                self._evict()
+        return value
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, value = self._entries.popitem(last=False)
+            self._bytes -= len(value)
+            self.evictions += 1
+
+
+def _render_png(draw):
+    # pyplot keeps one current figure for the whole process, so sessions
+    # draw one at a time
+    with _pyplot_lock:
+        open_figures = set(plt.get_fignums())
+        try:
+            fig = draw()
+        except Exception:
+            # Close whatever draw opened before failing, or the figures
+            # would stay registered with pyplot for the life of the process
+            for number in set(plt.get_fignums()) - open_figures:
+                plt.close(number)
+            raise
+        try:
+            buffer = io.BytesIO()
+            fig.savefig(
+                buffer, format="png", dpi=PNG_DPI, bbox_inches="tight"
+            )
+            return buffer.getvalue()
+        finally:
+            plt.close(fig)
+
+
+def figure_key(page, variable, plot_type, filters=()):
+    """
+    Returns the cache key of a plot: the page, the plotted variable, the
+    kind of plot, the filters of the plotted cases (a hashable value, e.g.
+    a tuple of (column, values) pairs), the dataset it is drawn from and
+    the theme.
+    """
+    theme = (FIGURE_STYLE, st.get_option("theme.base"))
+    dataset = file_fingerprint(CLEANED_DATA_PATH)
+    return (page, variable, plot_type, filters, dataset, theme)
+
+
+def show_pyplot(key, draw):
+    """Displays a matplotlib figure, drawn only if it is not cached."""
+    st.image(figure_cache.png(key, draw))
+
+
+def show_plotly(key, draw):
+    """Displays a plotly figure, built only if it is not cached."""
+    import plotly.io as pio
+
+    st.plotly_chart(pio.from_json(figure_cache.plotly_json(key, draw)))
+
+
+# Shared by every session of the app process
+figure_cache = FigureCache()
+_pyplot_lock = threading.Lock()
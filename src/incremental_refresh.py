@@ -0,0 +1,328 @@
+"""
+Incremental refresh of the cleaned dataset and its EDA aggregates.
+
+When a year of records is appended to the collection dataset, run from the
+repository root
+    python -m src.incremental_refresh
+to clean only the appended rows with the fitted cleaning pipeline, append
+them to the cleaned dataset and add their counts and column statistics to
+the stored ones. --full cleans the whole collection dataset and rebuilds
+everything (needed once, to record which rows have been cleaned), and
+--check compares the result with a full rebuild, which it runs in a
+temporary directory each time. The widget manifest is rewritten as well;
+the running app picks it up on its next rerun.
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import joblib
+import pandas as pd
+
+from src.column_stats import (
+    column_stats,
+    merge_column_stats,
+    same_column_stats,
+)
+from src.count_cube import build_count_cube, merge_count_cubes
+from src.data_cleaning import (
+    DATA_CLEANING_PIPELINE_PATH,
+    DEFAULT_CHUNKSIZE,
+    clean_in_chunks,
+    copy_free_pipeline,
+    read_appended_rows,
+    scan_csv_dtypes,
+)
+from src.data_management import (
+    CLEANED_DATA_PATH,
+    RAW_DATA_PATH,
+    append_to_dataset_cache,
+    file_fingerprint,
+    read_column_stats,
+    read_count_cube,
+    read_dataset,
+    write_column_stats,
+    write_count_cube,
+)
+from src.data_schema import apply_schema
+from src.model_registry import DEFAULT_VERSION
+from src.widget_manifest import make_widget_manifest
+
+
+# Which raw rows the cleaned dataset holds, kept next to it
+REFRESH_STATE_PATH = os.path.join(
+    os.path.dirname(CLEANED_DATA_PATH), "refresh_state.json"
+)
+# Bump when the fields of the state change; an older state needs a full
+# refresh
+REFRESH_STATE_FORMAT = 1
+
+
+class RefreshError(ValueError):
+    """Raised when the cleaned dataset cannot be refreshed incrementally."""
+
+
+def read_refresh_state(path=REFRESH_STATE_PATH):
+    """Returns the saved refresh state, or None if there is none."""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("format") != REFRESH_STATE_FORMAT:
+        return None
+    return state
+
+
+def write_refresh_state(raw_rows, raw_dtypes, cleaned_path,
+                        path=REFRESH_STATE_PATH):
+    """
+    Records that the cleaned dataset holds the first raw_rows rows of the
+    collection dataset, parsed with raw_dtypes, atomically.
+    """
+    state = {
+        "format": REFRESH_STATE_FORMAT,
+        "raw_rows": raw_rows,
+        "raw_dtypes": {col: str(dtype) for col, dtype in raw_dtypes.items()},
+        "cleaned_fingerprint": file_fingerprint(cleaned_path),
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def full_refresh(pipeline, raw_path=RAW_DATA_PATH,
+                 cleaned_path=CLEANED_DATA_PATH):
+    """
+    Cleans the whole collection dataset in chunks, rebuilds the columnar
+    cache, count cube, column statistics and widget manifest from it and
+    records which rows were cleaned. Returns the number of raw and cleaned
+    rows.
+    """
+    dtype = scan_csv_dtypes(raw_path)
+    n_cleaned = clean_in_chunks(pipeline, raw_path, cleaned_path, dtype=dtype)
+    # The cached aggregates are tagged with the fingerprint of the old
+    # dataset, so reading them rebuilds them
+    read_dataset(cleaned_path, prepare=apply_schema)
+    read_count_cube(cleaned_path, prepare=apply_schema)
+    read_column_stats(cleaned_path, prepare=apply_schema)
+    _refresh_widget_manifest()
+
+    n_raw = sum(
+        len(chunk) for chunk in pd.read_csv(
+            raw_path, usecols=[0], chunksize=DEFAULT_CHUNKSIZE
+        )
+    )
+    write_refresh_state(n_raw, dtype, cleaned_path)
+    return {"raw rows": n_raw, "cleaned rows": n_cleaned}
+
+
+def incremental_refresh(pipeline, raw_path=RAW_DATA_PATH,
+                        cleaned_path=CLEANED_DATA_PATH):
+    """
+    Cleans the rows appended to the collection dataset since the last
+    refresh with the fitted pipeline, appends them to the cleaned dataset
+    and adds them to its columnar cache, count cube and column statistics,
+    without reading or cleaning the earlier rows again. The widget
+    manifest is then rebuilt from the column statistics.
+
+    Every update is computed before any file is written. Raises a
+    RefreshError when the appended rows cannot be added on their own,
+    e.g. when they change the dtype a column is parsed with; a full
+    refresh is needed then. Returns the number of raw and cleaned rows
+    appended.
+    """
+    state = read_refresh_state()
+    if state is None:
+        raise RefreshError(
+            "No refresh state: run a full refresh (--full) once"
+        )
+    if file_fingerprint(cleaned_path) != state["cleaned_fingerprint"]:
+        raise RefreshError(
+            f"{cleaned_path} changed since the last refresh: run a full "
+            "refresh (--full)"
+        )
+
+    dtype = {
+        col: pd.api.types.pandas_dtype(name)
+        for col, name in state["raw_dtypes"].items()
+    }
+    raw, widened = read_appended_rows(raw_path, state["raw_rows"], dtype)
+    if raw.empty:
+        return {"raw rows": 0, "cleaned rows": 0}
+    changed = [
+        col for col, new in widened.items()
+        if str(new) != state["raw_dtypes"].get(col)
+    ]
+    if changed:
+        raise RefreshError(
+            "The appended rows change how the collection dataset is "
+            f"parsed ({', '.join(changed)}): run a full refresh (--full)"
+        )
+
+    # The appended rows as a full read of the cleaned CSV would parse them
+    cleaned = copy_free_pipeline(pipeline).transform(raw)
+    header = pd.read_csv(cleaned_path, nrows=0).columns
+    text = cleaned[header].to_csv(index=False)
+    new_rows = apply_schema(pd.read_csv(io.StringIO(text)))
+    if new_rows.empty:
+        # Every appended row was filtered out by the cleaning
+        write_refresh_state(
+            state["raw_rows"] + len(raw), widened, cleaned_path
+        )
+        return {"raw rows": len(raw), "cleaned rows": 0}
+
+    df = read_dataset(cleaned_path, prepare=apply_schema)
+    cube = merge_count_cubes(
+        read_count_cube(cleaned_path, prepare=apply_schema),
+        build_count_cube(new_rows),
+    )
+    try:
+        stats = merge_column_stats(
+            read_column_stats(cleaned_path, prepare=apply_schema),
+            column_stats(new_rows),
+        )
+    except ValueError as e:
+        raise RefreshError(f"{e}: run a full refresh (--full)") from e
+
+    _append_csv_rows(cleaned_path, text)
+    fingerprint = file_fingerprint(cleaned_path)
+    append_to_dataset_cache(df, new_rows, cleaned_path, fingerprint)
+    write_count_cube(cube, cleaned_path, fingerprint)
+    write_column_stats(stats, cleaned_path, fingerprint)
+    _refresh_widget_manifest()
+    write_refresh_state(state["raw_rows"] + len(raw), widened, cleaned_path)
+    return {"raw rows": len(raw), "cleaned rows": len(new_rows)}
+
+
+def check_refresh(pipeline, raw_path=RAW_DATA_PATH,
+                  cleaned_path=CLEANED_DATA_PATH):
+    """
+    Cleans the whole collection dataset into a temporary directory, builds
+    its aggregates and compares them with the stored ones. Returns the
+    names of the artifacts that differ, empty when the stored ones match a
+    full rebuild.
+    """
+    differences = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rebuilt_path = os.path.join(tmp_dir, os.path.basename(cleaned_path))
+        clean_in_chunks(pipeline, raw_path, rebuilt_path)
+        if file_fingerprint(rebuilt_path) != file_fingerprint(cleaned_path):
+            differences.append("cleaned dataset")
+        rebuilt = apply_schema(pd.read_csv(rebuilt_path))
+
+    if not _same_rows(read_dataset(cleaned_path, prepare=apply_schema),
+                      rebuilt):
+        differences.append("columnar dataset cache")
+    if not _same_rows(read_count_cube(cleaned_path, prepare=apply_schema),
+                      build_count_cube(rebuilt)):
+        differences.append("count cube")
+    if not same_column_stats(
+            read_column_stats(cleaned_path, prepare=apply_schema),
+            column_stats(rebuilt)):
+        differences.append("column statistics")
+    return differences
+
+
+def _append_csv_rows(path, text):
+    """
+    Appends the rows of a CSV text, header excluded, to a CSV file. Written
+    to a copy that replaces the file, so a failed run leaves it as it was.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.copyfile(path, tmp_path)
+    try:
+        with open(tmp_path, "a", newline="") as f:
+            f.write(text.split("\n", 1)[1])
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _refresh_widget_manifest():
+    try:
+        make_widget_manifest(DEFAULT_VERSION)
+    except FileNotFoundError:
+        # No model artifacts here; the manifest is built on first use
+        pass
+
+
+def _same_rows(df, other):
+    """
+    True if two frames hold the same values in the same order, and their
+    categorical columns the same categories.
+    """
+    if list(df.columns) != list(other.columns) or len(df) != len(other):
+        return False
+    for col in df.columns:
+        dtypes = (df[col].dtype, other[col].dtype)
+        if all(isinstance(d, pd.CategoricalDtype) for d in dtypes):
+            if list(dtypes[0].categories) != list(dtypes[1].categories):
+                return False
+    try:
+        pd.testing.assert_frame_equal(
+            _as_objects(df), _as_objects(other), check_dtype=False
+        )
+    except AssertionError:
+        return False
+    return True
+
+
+def _as_objects(df):
+    df = df.reset_index(drop=True)
+    categorical = df.select_dtypes(include="category").columns
+    return df.astype({col: object for col in categorical})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Clean the whole collection dataset and rebuild everything",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help=(
+            "Compare the refreshed artifacts with a full rebuild: cleans "
+            "the whole collection dataset into a temporary directory, "
+            "which takes as long as --full"
+        ),
+    )
+    parser.add_argument(
+        "--pipeline",
+        default=DATA_CLEANING_PIPELINE_PATH,
+        help="Fitted data cleaning pipeline",
+    )
+    args = parser.parse_args()
+
+    pipeline = joblib.load(args.pipeline)
+    start = time.perf_counter()
+    try:
+        if args.full:
+            counts = full_refresh(pipeline)
+        else:
+            counts = incremental_refresh(pipeline)
+    except RefreshError as e:
+        raise SystemExit(str(e))
+    print(f"{'Full' if args.full else 'Incremental'} refresh: "
+          f"{counts['raw rows']} raw rows, {counts['cleaned rows']} cleaned "
+          f"rows in {time.perf_counter() - start:.1f} s")
+
+    if args.check:
+        start = time.perf_counter()
+        differences = check_refresh(pipeline)
+        print(f"Full rebuild for the check in "
+              f"{time.perf_counter() - start:.1f} s")
+        if differences:
+            raise SystemExit(
+                "Differs from a full rebuild: " + ", ".join(differences)
+            )
+        print("Matches a full rebuild")
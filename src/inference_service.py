@@ -0,0 +1,265 @@
+"""
+Headless HTTP scoring service for the IVF success model.
+
+Run from the repository root, e.g.
+    python -m src.inference_service --port 8000 --workers 4
+
+Endpoints:
+    POST /predict        one case, a JSON object of feature values
+    POST /predict/batch  {"cases": [{...}, ...]}
+    GET  /health
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import pandas as pd
+import tornado.netutil
+from tornado.log import app_log
+import tornado.process
+import tornado.web
+from tornado.httpserver import HTTPServer
+
+from src.machine_learning.batch_scoring import (
+    allowed_labels,
+    prepare_cases,
+    validate_cases,
+)
+from src.machine_learning.prediction_live import predict_outcomes
+from src.model_registry import DEFAULT_VERSION, registry
+
+
+CLEANED_DATA_PATH = (
+    "outputs/datasets/cleaned/FertilityTreatmentDataCleaned.csv"
+)
+# Concurrent single requests are coalesced for up to MAX_BATCH_DELAY
+# seconds, or until MAX_BATCH_SIZE requests are waiting
+MAX_BATCH_DELAY = 0.005
+MAX_BATCH_SIZE = 256
+
+
+class ModelArtifacts:
+    """The model artifacts of one version, loaded once per service."""
+
+    def __init__(self, version=DEFAULT_VERSION):
+        self.version = version
+        self.best_features = list(registry.get("best_features", version))
+        self.ml_pipe_fe = registry.get("pre_processing", version)
+        self.ml_pipe_model = registry.load_model(version)
+        # Distinct input rows of the cleaned data: the dtypes and labels
+        # requests are validated against
+        self.reference = pd.read_csv(
+            CLEANED_DATA_PATH, usecols=self.best_features
+        ).drop_duplicates()
+        self.labels = allowed_labels(self.best_features, self.reference)
+
+    def score(self, cases):
+        """
+        Validates and scores a DataFrame of cases in one model call.
+        Raises a ValueError if any case is invalid.
+        """
+        errors = validate_cases(
+            cases, self.best_features, self.reference, self.labels
+        )
+        if errors:
+            raise ValueError("; ".join(errors))
+        return predict_outcomes(
+            prepare_cases(cases, self.best_features, self.reference),
+            self.best_features,
+            self.ml_pipe_fe,
+            self.ml_pipe_model,
+            model_version=self.version,
+        )
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-case requests into one model call. The
+    first waiting case opens a batch that closes after max_delay seconds
+    or max_size cases, whichever comes first.
+
+    Batches are scored in the loop's default executor, so the event loop
+    keeps accepting requests meanwhile. A batch that fails only fails its
+    own requests: the batcher keeps serving the next ones.
+    """
+
+    def __init__(
+            self,
+            artifacts,
+            max_delay=MAX_BATCH_DELAY,
+            max_size=MAX_BATCH_SIZE
+            ):
+        self.artifacts = artifacts
+        self.max_delay = max_delay
+        self.max_size = max_size
+        self.queue = asyncio.Queue()
+
+    async def predict(self, case):
+        """Returns (label, probability of success) for one case."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((case, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self.queue.get(), timeout)
+                    )
+                except asyncio.TimeoutError:
+                    break
+            await self._score(batch)
+
+    async def _score(self, batch):
+        cases = pd.DataFrame([case for case, _ in batch])
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, self.artifacts.score, cases
+            )
+        except Exception as error:
+            if len(batch) > 1:
+                # Score the cases one by one so only the failing ones fail
+                for item in batch:
+                    await self._score([item])
+                return
+            if not isinstance(error, ValueError):
+                app_log.exception("Scoring a case failed")
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(error)
+            return
+        for (_, future), label, proba in zip(
+            batch, result.labels, result.probabilities
+        ):
+            if not future.done():
+                future.set_result((int(label), float(proba)))
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, artifacts, batcher):
+        self.artifacts = artifacts
+        self.batcher = batcher
+
+    def read_json(self):
+        """Returns the decoded JSON body, or None if it is not valid JSON."""
+        try:
+            return json.loads(self.request.body)
+        except ValueError:
+            return None
+
+    def bad_request(self, message):
+        # The message goes in the body; request values are not safe to
+        # echo in the status line
+        self.set_status(400)
+        self.finish({"error": message})
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"error": self._reason})
+
+
+class PredictHandler(BaseHandler):
+    async def post(self):
+        case = self.read_json()
+        if not isinstance(case, dict):
+            self.bad_request("Expected a JSON object of feature values")
+            return
+        try:
+            label, proba = await self.batcher.predict(case)
+        except ValueError as error:
+            self.bad_request(str(error))
+            return
+        self.write({
+            "label": label,
+            "probability": proba,
+            "model_version": self.artifacts.version,
+        })
+
+
+class BatchPredictHandler(BaseHandler):
+    async def post(self):
+        body = self.read_json()
+        cases = body.get("cases") if isinstance(body, dict) else None
+        if not isinstance(cases, list) or not cases:
+            self.bad_request('Expected {"cases": [...]} with at least one case')
+            return
+        try:
+            # Scored off the event loop, like the micro-batches
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, self.artifacts.score, pd.DataFrame(cases)
+            )
+        except ValueError as error:
+            self.bad_request(str(error))
+            return
+        self.write({
+            "labels": result.labels.tolist(),
+            "probabilities": result.probabilities.tolist(),
+            "model_version": result.model_version,
+            "elapsed_ms": result.elapsed_ms,
+        })
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.write({
+            "status": "ok",
+            "model_version": self.artifacts.version,
+            "pid": os.getpid(),
+        })
+
+
+def make_app(artifacts, batcher):
+    handler_args = {"artifacts": artifacts, "batcher": batcher}
+    return tornado.web.Application([
+        (r"/predict", PredictHandler, handler_args),
+        (r"/predict/batch", BatchPredictHandler, handler_args),
+        (r"/health", HealthHandler, handler_args),
+    ])
+
+
+async def serve(sockets, artifacts):
+    """Serves the app on the bound sockets until the process is stopped."""
+    batcher = MicroBatcher(artifacts)
+    batch_task = asyncio.create_task(batcher.run())
+    server = HTTPServer(make_app(artifacts, batcher))
+    server.add_sockets(sockets)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        batch_task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the IVF success model over HTTP."
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes; 0 starts one per CPU",
+    )
+    parser.add_argument("--version", default=DEFAULT_VERSION)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    # Loaded before forking, so the workers share the model's memory pages
+    # copy-on-write instead of each loading its own copy
+    artifacts = ModelArtifacts(args.version)
+    print(
+        f"Model {artifacts.version} loaded in "
+        f"{time.perf_counter() - start:.1f} s"
+    )
+    sockets = tornado.netutil.bind_sockets(args.port)
+    if args.workers != 1:
+        tornado.process.fork_processes(args.workers)
+    asyncio.run(serve(sockets, artifacts))
@@ -0,0 +1,172 @@
+import io
+import zipfile
+
+import pandas as pd
+
+from src.machine_learning.prediction_live import (
+    DEFAULT_THRESHOLD,
+    predict_outcomes,
+)
+from src.model_registry import DEFAULT_VERSION
+
+
+# Rows scored per call to the model; bounds the memory of the one-hot
+# encoded copy of the cases
+BATCH_CHUNKSIZE = 5_000
+
+PROBABILITY_COLUMN = "Success probability (%)"
+OUTCOME_COLUMN = "Predicted outcome"
+
+
+def read_cases(uploaded_file, chunksize=BATCH_CHUNKSIZE):
+    """
+    Returns the approximate number of uploaded cases, for progress
+    reporting, and an iterator over chunks of the cases. CSV files are
+    parsed chunk by chunk; Excel files cannot be streamed and are read at
+    once, then split into chunks. Only .xlsx workbooks are read (with
+    openpyxl); legacy .xls files would need xlrd. Raises a ValueError if
+    the workbook cannot be read.
+    """
+    file_name = getattr(uploaded_file, "name", str(uploaded_file))
+    if file_name.lower().endswith(".xlsx"):
+        try:
+            cases = pd.read_excel(uploaded_file, engine="openpyxl")
+        except zipfile.BadZipFile:
+            # A corrupt workbook, or another file renamed to .xlsx
+            raise ValueError(
+                f"{file_name} is not a valid .xlsx workbook"
+            ) from None
+        except KeyError as error:
+            # A workbook missing one of its parts, e.g. a sheet
+            raise ValueError(
+                f"{file_name} is an incomplete .xlsx workbook ({error})"
+            ) from None
+        chunks = (
+            cases.iloc[start:start + chunksize]
+            for start in range(0, len(cases), chunksize)
+        )
+        return len(cases), chunks
+
+    # One line per case after the header (quoted line breaks aside)
+    n_cases = max(uploaded_file.getvalue().count(b"\n") - 1, 1)
+    uploaded_file.seek(0)
+    return n_cases, pd.read_csv(uploaded_file, chunksize=chunksize)
+
+
+def allowed_labels(best_features, reference):
+    """
+    Returns the labels each non-numeric feature takes in the reference
+    data, as sets of strings, for validate_cases.
+    """
+    return {
+        feature: set(reference[feature].dropna().astype(str).unique())
+        for feature in best_features
+        if not pd.api.types.is_numeric_dtype(reference[feature])
+    }
+
+
+def validate_cases(cases, best_features, reference, labels=None):
+    """
+    Checks a chunk of cases against the model inputs. Numeric features must
+    be numbers and the other features must take values seen in the
+    reference data (the cleaned dataset). Returns a list of error messages,
+    empty if the chunk is valid.
+
+    labels are the allowed labels of allowed_labels(best_features,
+    reference); callers validating many chunks compute them once.
+    """
+    if labels is None:
+        labels = allowed_labels(best_features, reference)
+    missing = [feature for feature in best_features if feature not in cases]
+    if missing:
+        return [f"Missing columns: {', '.join(missing)}"]
+
+    errors = []
+    for feature in best_features:
+        values = cases[feature]
+        if values.isna().any():
+            errors.append(f"{feature}: {values.isna().sum()} empty values")
+        elif pd.api.types.is_numeric_dtype(reference[feature]):
+            if pd.to_numeric(values, errors="coerce").isna().any():
+                errors.append(f"{feature}: non-numeric values")
+        else:
+            unknown = set(values.astype(str).unique()) - labels[feature]
+            if unknown:
+                errors.append(
+                    f"{feature}: unknown values {', '.join(sorted(unknown))}"
+                )
+    return errors
+
+
+def prepare_cases(cases, best_features, reference):
+    """
+    Returns the model inputs of a chunk of cases with the dtypes of the
+    reference data: a category read as a number from the file (e.g. 2
+    embryos transferred) becomes the label the encoders expect ("2").
+    """
+    cases = cases[best_features].copy()
+    for feature in best_features:
+        if pd.api.types.is_numeric_dtype(reference[feature]):
+            cases[feature] = pd.to_numeric(cases[feature])
+        else:
+            cases[feature] = cases[feature].astype(str)
+    return cases
+
+
+def score_cases(
+        chunks,
+        best_features,
+        reference,
+        ml_pipe_fe,
+        ml_pipe_model,
+        model_version=DEFAULT_VERSION,
+        threshold=DEFAULT_THRESHOLD
+        ):
+    """
+    Validates and scores the chunks of cases one at a time, yielding each
+    chunk with the success probability and predicted outcome appended.
+    Raises a ValueError naming the rows of the first invalid chunk.
+    """
+    labels = allowed_labels(best_features, reference)
+    first_row = 0
+    for chunk in chunks:
+        errors = validate_cases(chunk, best_features, reference, labels)
+        if errors:
+            last_row = first_row + len(chunk)
+            raise ValueError(
+                f"Rows {first_row + 1}-{last_row}: " + "; ".join(errors)
+            )
+        result = predict_outcomes(
+            prepare_cases(chunk, best_features, reference),
+            best_features,
+            ml_pipe_fe,
+            ml_pipe_model,
+            model_version=model_version,
+            threshold=threshold,
+        )
+        chunk = chunk.copy()
+        chunk[PROBABILITY_COLUMN] = (result.probabilities * 100).round(1)
+        chunk[OUTCOME_COLUMN] = [
+            "Success" if label == 1 else "No success"
+            for label in result.labels
+        ]
+        first_row += len(chunk)
+        yield chunk
+
+
+class ScoredCasesWriter:
+    """
+    Accumulates scored chunks as CSV text, so only the text of the results
+    is kept in memory rather than every scored frame.
+    """
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.n_rows = 0
+
+    def write(self, chunk):
+        chunk.to_csv(self.buffer, header=self.n_rows == 0, index=False)
+        self.n_rows += len(chunk)
+
+    def getvalue(self):
+        return self.buffer.getvalue().encode("utf-8")
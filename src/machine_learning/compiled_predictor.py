@@ -0,0 +1,225 @@
+import copy
+
+import numpy as np
+
+from src.machine_learning.model_artifact import Standardizer
+from src.machine_learning.tree_ensemble import FlatTreeEnsemble
+
+
+class CompiledPredictor:
+    """
+    Single-row inference path compiled from the fitted preprocessing
+    pipeline and model.
+
+    The ordinal and one-hot encoders and the scaler in front of the
+    estimator are folded into one lookup table per input feature, mapping
+    each raw value straight to its scaled entries in the model's feature
+    vector. A prediction is then a handful of dict lookups and a single
+    predict_proba call on a numpy row, with no pandas in between. Tree
+    ensembles are evaluated with their flattened form (tree_ensemble.py),
+    which returns the same probabilities without scikit-learn's per-call
+    input validation and thread pool; other estimators are called as they
+    are.
+
+    Supports the structure of the saved pipelines: ordinal encoders with a
+    `columns` list and a fitted `encoder.categories_`, feature-engine
+    one-hot encoders (`encoder_dict_`) and an optional StandardScaler in
+    front of the estimator. The model can also be the FlatTreeEnsemble of
+    a compact artifact (model_artifact.py), whose Standardizer is folded
+    the same way. Any other step raises a TypeError when compiling.
+    """
+
+    def __init__(self, best_features, ml_pipe_fe, ml_pipe_model):
+        self.best_features = list(best_features)
+        self.feature_names = model_feature_names(ml_pipe_model, best_features)
+        if isinstance(ml_pipe_model, FlatTreeEnsemble):
+            # Already flattened; a copy without its scaler, which is folded
+            # into the tables, shares the node arrays
+            self.model = copy.copy(ml_pipe_model)
+            self.model.preprocessing = []
+        else:
+            try:
+                # The scaler is folded into the tables, so only the
+                # estimator is flattened
+                self.model = FlatTreeEnsemble(ml_pipe_model.steps[-1][1])
+            except TypeError:
+                self.model = ml_pipe_model.steps[-1][1]
+        self.classes = self.model.classes_
+        mean, scale = _scaler_parameters(
+            ml_pipe_model, len(self.feature_names)
+        )
+
+        position = {name: i for i, name in enumerate(self.feature_names)}
+        ordinal_codes = _ordinal_codes(ml_pipe_fe)
+        one_hot = _one_hot_categories(ml_pipe_fe)
+
+        # Scaled vector of a row whose one-hot entries are all 0; the tables
+        # only overwrite the entries that depend on the input
+        self.base = (np.zeros(len(self.feature_names)) - mean) / scale
+        self.tables = {}
+        self.one_hot_tables = {}
+        self.numeric = {}
+        for feature in self.best_features:
+            if feature in one_hot:
+                table = {}
+                for category in one_hot[feature]:
+                    name = f"{feature}_{category}"
+                    if name in position:
+                        j = position[name]
+                        table[str(category)] = (j, (1 - mean[j]) / scale[j])
+                self.one_hot_tables[feature] = table
+            elif feature in ordinal_codes:
+                j = position[feature]
+                self.tables[feature] = {
+                    str(category): (j, (code - mean[j]) / scale[j])
+                    for category, code in ordinal_codes[feature].items()
+                }
+            elif feature in position:
+                j = position[feature]
+                self.numeric[feature] = (j, mean[j], scale[j])
+            else:
+                raise ValueError(f"{feature} is not an input of the model")
+
+    def features(self, values):
+        """Returns the scaled model input for a dict of raw feature values."""
+        x = self.base.copy()
+        for feature, table in self.tables.items():
+            value = values[feature]
+            try:
+                j, scaled = table[str(value)]
+            except KeyError:
+                raise ValueError(
+                    f"Unknown value {value!r} for {feature}"
+                ) from None
+            x[j] = scaled
+        # Like the one-hot encoder, an unseen value sets no dummy, and so do
+        # the dummies the model does not use
+        for feature, table in self.one_hot_tables.items():
+            entry = table.get(str(values[feature]))
+            if entry is not None:
+                x[entry[0]] = entry[1]
+        for feature, (j, mean, scale) in self.numeric.items():
+            x[j] = (float(values[feature]) - mean) / scale
+        return x
+
+    def predict(self, values):
+        """
+        Returns the predicted class and the probability of each class for a
+        dict of raw feature values.
+        """
+        proba = self.model.predict_proba(
+            self.features(values).reshape(1, -1)
+        )[0]
+        return self.classes[np.argmax(proba)], proba
+
+
+def model_feature_names(ml_pipe_model, best_features):
+    """
+    Returns the columns the model was fitted on, in order. Models fitted on
+    a numpy array do not record them, in which case the best features are
+    assumed to be the model input.
+    """
+    names = getattr(ml_pipe_model, "feature_names_in_", None)
+    return list(best_features) if names is None else list(names)
+
+
+def pipeline_features(X_live, best_features, ml_pipe_fe, ml_pipe_model):
+    """
+    Pandas path: preprocesses the live data and selects the model input.
+    """
+    X_live_fe = ml_pipe_fe.transform(X_live.filter(best_features))
+    return X_live_fe[model_feature_names(ml_pipe_model, best_features)]
+
+
+def verify_compiled_predictor(
+        predictor,
+        X_live,
+        best_features,
+        ml_pipe_fe,
+        ml_pipe_model
+        ):
+    """
+    Checks that the compiled predictor returns exactly the feature vectors,
+    probabilities and classes of the pandas path for every row of X_live.
+    Raises an AssertionError on the first difference.
+    """
+    X_model = pipeline_features(
+        X_live, best_features, ml_pipe_fe, ml_pipe_model
+    )
+    # Same scaling as the model pipeline, applied to the whole frame at once
+    expected_features = X_model
+    for step in _scaling_steps(ml_pipe_model):
+        expected_features = step.transform(expected_features)
+    expected_features = np.asarray(expected_features, dtype=float)
+    expected_proba = ml_pipe_model.predict_proba(X_model)
+    expected_classes = ml_pipe_model.predict(X_model)
+
+    for i, values in enumerate(X_live.to_dict(orient="records")):
+        features = predictor.features(values)
+        label, proba = predictor.predict(values)
+        if not np.array_equal(features, expected_features[i]):
+            raise AssertionError(f"Row {i}: feature vectors differ")
+        if not np.array_equal(proba, expected_proba[i]):
+            raise AssertionError(f"Row {i}: probabilities differ")
+        if label != expected_classes[i]:
+            raise AssertionError(f"Row {i}: predicted classes differ")
+
+
+def _ordinal_codes(ml_pipe_fe):
+    """Returns {column: {category: code}} for the ordinal encoders."""
+    codes = {}
+    for _, step in ml_pipe_fe.steps:
+        encoder = getattr(step, "encoder", None)
+        if hasattr(encoder, "categories_") and hasattr(step, "columns"):
+            for col, categories in zip(step.columns, encoder.categories_):
+                codes[col] = {
+                    category: float(code)
+                    for code, category in enumerate(categories)
+                }
+        elif not hasattr(step, "encoder_dict_"):
+            raise TypeError(f"Cannot compile preprocessing step {step!r}")
+    return codes
+
+
+def _one_hot_categories(ml_pipe_fe):
+    """Returns {column: categories} for the one-hot encoders."""
+    categories = {}
+    for _, step in ml_pipe_fe.steps:
+        if hasattr(step, "encoder_dict_"):
+            categories.update(step.encoder_dict_)
+    return categories
+
+
+def _scaling_steps(ml_pipe_model):
+    """
+    Returns the steps applied before the estimator: those of the pipeline,
+    or the preprocessing of a flattened ensemble.
+    """
+    if isinstance(ml_pipe_model, FlatTreeEnsemble):
+        return list(ml_pipe_model.preprocessing)
+    return [step for _, step in ml_pipe_model.steps[:-1]]
+
+
+def _scaler_parameters(ml_pipe_model, n_features):
+    """
+    Returns the mean and scale applied before the estimator, as arrays; a
+    model without a scaler gets a mean of 0 and a scale of 1.
+    """
+    steps = _scaling_steps(ml_pipe_model)
+    if len(steps) > 1:
+        raise TypeError(
+            "Only a single scaler before the estimator is supported"
+        )
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+    for step in steps:
+        if isinstance(step, Standardizer):
+            mean, scale = step.mean, step.scale
+            continue
+        if not hasattr(step, "scale_"):
+            raise TypeError(f"Cannot compile model step {step!r}")
+        if getattr(step, "with_mean", True) and step.mean_ is not None:
+            mean = step.mean_
+        if getattr(step, "with_std", True) and step.scale_ is not None:
+            scale = step.scale_
+    return mean, scale
@@ -0,0 +1,289 @@
+"""
+Compact, memory-mappable artifact for the scaler + tree ensemble model.
+
+Export and compare with the pickled model from the repository root, e.g.
+    python -m src.machine_learning.model_artifact export --version v1
+
+Layout (little endian):
+    8 bytes   magic b"IVFMODEL"
+    uint32    format version
+    uint32    length of the JSON index
+    JSON index: model metadata and the dtype, shape and offset of each array
+    arrays, each starting on a 64-byte boundary after the index
+"""
+import argparse
+import gzip
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import psutil
+from sklearn.dummy import DummyClassifier
+
+from src.machine_learning.tree_ensemble import ARRAY_NAMES, FlatTreeEnsemble
+from src.model_registry import DEFAULT_VERSION, MODEL_ROOT
+
+
+MAGIC = b"IVFMODEL"
+# Bump when the layout or the meaning of the arrays changes
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sII")
+ALIGNMENT = 64
+ARTIFACT_FILE_NAME = "clf_pipeline_model.ivfm"
+
+
+class Standardizer:
+    """StandardScaler.transform from its mean and scale arrays."""
+
+    def __init__(self, mean, scale):
+        self.mean = mean
+        self.scale = scale
+
+    def transform(self, X):
+        # Same operations as StandardScaler, on a float64 copy
+        X = np.array(X, dtype=np.float64)
+        X -= self.mean
+        X /= self.scale
+        return X
+
+
+def export_model_artifact(ml_pipe_model, path):
+    """
+    Writes a fitted Pipeline of an optional StandardScaler and a tree
+    ensemble to the compact format. Returns the size of the file in bytes.
+
+    Thresholds are stored as float32, rounded down to the largest float32
+    not above the float64 threshold: the trees only ever compare float32
+    inputs, and no float32 lies between the two, so every split takes the
+    same branch. Feature ids are stored in the smallest unsigned integer
+    type that fits them. Leaf values stay float64 so the probabilities are
+    unchanged.
+    """
+    ensemble = FlatTreeEnsemble(ml_pipe_model, use_numba=False)
+    n_features = ensemble.estimator.n_features_in_
+    mean, scale = _scaler_arrays(ml_pipe_model, n_features)
+
+    init_raw = None
+    if ensemble.boosting:
+        init_raw = _constant_init_raw(ensemble.estimator, n_features)
+
+    threshold = ensemble.threshold.astype(np.float32)
+    too_high = threshold.astype(np.float64) > ensemble.threshold
+    threshold[too_high] = np.nextafter(
+        threshold[too_high], np.float32(-np.inf)
+    )
+    feature_type = np.uint8 if n_features <= 2 ** 8 else np.uint16
+    arrays = {
+        "feature": ensemble.feature.astype(feature_type),
+        "threshold": threshold,
+        "left": ensemble.left.astype(np.int32),
+        "right": ensemble.right.astype(np.int32),
+        "value": ensemble.value.astype(np.float64),
+        "roots": ensemble.roots.astype(np.int32),
+        "columns": ensemble.columns.astype(np.int32),
+        "scaler_mean": np.asarray(mean, dtype=np.float64),
+        "scaler_scale": np.asarray(scale, dtype=np.float64),
+    }
+
+    feature_names = getattr(ml_pipe_model, "feature_names_in_", None)
+    index = {
+        "boosting": ensemble.boosting,
+        "max_depth": int(ensemble.max_depth),
+        "classes": np.asarray(ensemble.classes_).tolist(),
+        "feature_names": (
+            None if feature_names is None else list(feature_names)
+        ),
+        "init_raw": None if init_raw is None else init_raw.tolist(),
+        "arrays": {},
+    }
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        index["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset += array.nbytes
+    index_bytes = json.dumps(index).encode("utf-8")
+    data_start = _align(HEADER.size + len(index_bytes))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(index_bytes)))
+        f.write(index_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + index["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def load_model_artifact(path, use_numba=None):
+    """
+    Memory-maps a compact model artifact. Returns a FlatTreeEnsemble over
+    read-only views of the file, with the scaler as its preprocessing and
+    the classes_ and feature_names_in_ of the original model, so it can
+    stand in for the pickled pipeline. Nothing is copied: pages are read
+    on first use and shared by every process mapping the same file.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, index_length = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a model artifact")
+    if version != FORMAT_VERSION:
+        raise ValueError(
+            f"{path} has format version {version}, expected {FORMAT_VERSION}"
+        )
+    index = json.loads(buffer[HEADER.size:HEADER.size + index_length])
+    data_start = _align(HEADER.size + index_length)
+
+    arrays = {}
+    for name, spec in index["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arrays[name] = np.frombuffer(
+            buffer,
+            dtype=dtype,
+            count=count,
+            offset=data_start + spec["offset"],
+        ).reshape(spec["shape"])
+
+    ensemble = FlatTreeEnsemble.from_arrays(
+        {name: arrays[name] for name in ARRAY_NAMES},
+        classes=index["classes"],
+        boosting=index["boosting"],
+        max_depth=index["max_depth"],
+        preprocessing=[
+            Standardizer(arrays["scaler_mean"], arrays["scaler_scale"])
+        ],
+        init_raw=index["init_raw"],
+        use_numba=use_numba,
+    )
+    if index["feature_names"] is not None:
+        ensemble.feature_names_in_ = np.array(
+            index["feature_names"], dtype=object
+        )
+    return ensemble
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _scaler_arrays(ml_pipe_model, n_features):
+    steps = getattr(ml_pipe_model, "steps", [])[:-1]
+    if len(steps) > 1 or any(not hasattr(s, "scale_") for _, s in steps):
+        raise TypeError("Only a single StandardScaler before the trees")
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+    for _, scaler in steps:
+        if scaler.with_mean:
+            mean = scaler.mean_
+        if scaler.with_std:
+            scale = scaler.scale_
+    return mean, scale
+
+
+def _constant_init_raw(estimator, n_features):
+    """
+    Returns the raw score boosting starts from, which must not depend on
+    the input (the default prior or "zero" init).
+    """
+    if estimator.init_ != "zero" and not isinstance(
+        estimator.init_, DummyClassifier
+    ):
+        raise TypeError("Only constant init estimators can be exported")
+    X = np.zeros((1, n_features), dtype=np.float32)
+    return estimator._raw_predict_init(X)[0]
+
+
+def _measure_load(kind, path):
+    """
+    Loads a model in a fresh interpreter and returns the load time and the
+    memory of that process, before and after scoring the test set.
+    """
+    output = subprocess.run(
+        [sys.executable, "-m", __spec__.name, "measure", kind, path],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def _measure_in_this_process(kind, path):
+    process = psutil.Process()
+    X_test = pd.read_csv(os.path.join(os.path.dirname(path), "X_test.csv"))
+    start = time.perf_counter()
+    if kind == "pickle":
+        with gzip.open(path, "rb") as f:
+            model = joblib.load(f)
+    else:
+        model = load_model_artifact(path)
+    load_seconds = time.perf_counter() - start
+    after_load = process.memory_full_info()
+    model.predict_proba(X_test)
+    after_predict = process.memory_full_info()
+    print(json.dumps({
+        "load_seconds": load_seconds,
+        "rss_after_load": after_load.rss,
+        "uss_after_load": after_load.uss,
+        "rss_after_predict": after_predict.rss,
+        "uss_after_predict": after_predict.uss,
+    }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser(
+        "export", help="Export a model version and compare with its pickle"
+    )
+    export_parser.add_argument("--version", default=DEFAULT_VERSION)
+    measure_parser = subparsers.add_parser(
+        "measure", help="Load one model and print its load time and memory"
+    )
+    measure_parser.add_argument("kind", choices=["pickle", "compact"])
+    measure_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "measure":
+        _measure_in_this_process(args.kind, args.path)
+    else:
+        model_dir = f"{MODEL_ROOT}/{args.version}"
+        pickle_path = os.path.join(model_dir, "clf_pipeline_model.pkl.gz")
+        artifact_path = os.path.join(model_dir, ARTIFACT_FILE_NAME)
+        with gzip.open(pickle_path, "rb") as f:
+            ml_pipe_model = joblib.load(f)
+        export_model_artifact(ml_pipe_model, artifact_path)
+
+        X_test = pd.read_csv(os.path.join(model_dir, "X_test.csv"))
+        difference = np.abs(
+            load_model_artifact(artifact_path).predict_proba(X_test)
+            - ml_pipe_model.predict_proba(X_test)
+        ).max()
+        print(f"Max probability difference on the test set: {difference}")
+
+        mib = 2 ** 20
+        for kind, path in [
+            ("pickle", pickle_path), ("compact", artifact_path)
+        ]:
+            stats = _measure_load(kind, path)
+            print(
+                f"{kind:>8}: {os.path.getsize(path) / mib:7.1f} MiB on disk, "
+                f"load {stats['load_seconds'] * 1e3:8.1f} ms, "
+                f"RSS {stats['rss_after_load'] / mib:6.1f} MiB "
+                f"(USS {stats['uss_after_load'] / mib:6.1f}) after load, "
+                f"RSS {stats['rss_after_predict'] / mib:6.1f} MiB "
+                f"(USS {stats['uss_after_predict'] / mib:6.1f}) after "
+                "scoring the test set"
+            )
@@ -1,43 +1,109 @@
+import time
+from dataclasses import dataclass
+
+import numpy as np
 import streamlit as st
 
+from src.machine_learning.compiled_predictor import pipeline_features
+from src.model_registry import DEFAULT_VERSION
 
-def predict_success(
+
+# Probability of success above which a treatment is predicted to succeed;
+# 0.5 gives the same labels as the model's own predict
+DEFAULT_THRESHOLD = 0.5
+
+
+@dataclass
+class PredictionResult:
+    """Outcome of scoring N rows with the IVF success model."""
+
+    # 1 if the treatment is predicted to be successful, else 0, per row
+    labels: np.ndarray
+    # Probability of success per row
+    probabilities: np.ndarray
+    threshold: float
+    model_version: str
+    # Wall time of preprocessing and scoring, in milliseconds
+    elapsed_ms: float
+
+
+def predict_outcomes(
         X_live,
         best_features,
         ml_pipe_fe,
-        ml_pipe_model
+        ml_pipe_model,
+        model_version=DEFAULT_VERSION,
+        threshold=DEFAULT_THRESHOLD,
+        table=None
         ):
+    """
+    Scores every row of X_live, evaluating the preprocessing pipeline and
+    the model once. The labels are derived from the probabilities with the
+    decision threshold.
 
-    # from live data, subset features related to this pipeline
-    X_live_ivf = X_live.filter(best_features)
-
-
-    # # Ensure X_live_ivf contains all expected columns, filling missing
-    # # ones with 0
-    # X_live_ivf = X_live.reindex(columns=expected_columns, fill_value=0)
+    With a PredictionTable (see prediction_table.py) the rows it covers
+    are answered from the table and only the other rows go through the
+    pipeline.
+    """
+    start = time.perf_counter()
+    if table is None:
+        probabilities = np.full(len(X_live), np.nan)
+    else:
+        probabilities = table.lookup(X_live)
+    missing = np.isnan(probabilities)
+    if missing.any():
+        X_model = pipeline_features(
+            X_live[missing], best_features, ml_pipe_fe, ml_pipe_model
+        )
+        proba = ml_pipe_model.predict_proba(X_model)
+        success_index = list(ml_pipe_model.classes_).index(1)
+        probabilities[missing] = proba[:, success_index]
+    # Strictly above, so that a tie goes to "no success" like argmax does
+    labels = (probabilities > threshold).astype(int)
+    elapsed_ms = (time.perf_counter() - start) * 1e3
 
-    # Apply preprocessing pipeline to the live data
-    X_live_ivf_dc_fe = ml_pipe_fe.transform(X_live_ivf)
-    
+    return PredictionResult(
+        labels=labels,
+        probabilities=probabilities,
+        threshold=threshold,
+        model_version=model_version,
+        elapsed_ms=elapsed_ms,
+    )
 
-    # Subset the transformed data to best features before prediction
-    X_live_ivf_dc_fe_best = X_live_ivf_dc_fe[best_features]
 
-    # Predict using the model
-    success_prediction = ml_pipe_model.predict(X_live_ivf_dc_fe_best)
-    success_prediction_proba = ml_pipe_model.predict_proba(
-        X_live_ivf_dc_fe_best
+def predict_success(
+        X_live,
+        best_features,
+        ml_pipe_fe,
+        ml_pipe_model,
+        model_version=DEFAULT_VERSION,
+        threshold=DEFAULT_THRESHOLD,
+        table=None
+        ):
+    """
+    Scores the live data and displays the outcome of each row. Returns the
+    PredictionResult.
+    """
+    result = predict_outcomes(
+        X_live,
+        best_features,
+        ml_pipe_fe,
+        ml_pipe_model,
+        model_version=model_version,
+        threshold=threshold,
+        table=table,
     )
 
-    # Calculate success probability
-    success_prob = success_prediction_proba[0, success_prediction][0] * 100
-    success_result = 'will' if success_prediction == 1 else 'will not'
+    for label, success_proba in zip(result.labels, result.probabilities):
+        # Probability of the predicted outcome
+        proba = success_proba if label == 1 else 1 - success_proba
+        success_result = 'will' if label == 1 else 'will not'
 
-    # Display results
-    statement = (
-        f'### There is {success_prob.round(1)}% probability '
-        f'that the treatment **{success_result} be successful**.'
-    )
-    st.write(statement)
+        # Display results
+        statement = (
+            f'### There is {proba * 100:.1f}% probability '
+            f'that the treatment **{success_result} be successful**.'
+        )
+        st.write(statement)
 
-    return success_prediction
+    return result
@@ -0,0 +1,289 @@
+"""
+Precomputed prediction table over the inputs offered by the live predictor.
+
+Build from the repository root, e.g.
+    python -m src.machine_learning.prediction_table --version v1
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data_management import file_fingerprint
+from src.machine_learning.prediction_live import predict_outcomes
+from src.model_registry import DEFAULT_VERSION, MODEL_ROOT, registry
+
+
+# Input spaces up to this size are enumerated in full; larger ones are
+# restricted to the combinations observed in the cleaned data
+MAX_DENSE_SIZE = 2_000_000
+# Rows per scoring call while building the table
+BUILD_BATCH_SIZE = 50_000
+TABLE_FILE_NAME = "prediction_table.npz"
+# Below this many rows, values are looked up one by one: factorizing a
+# column costs more than the lookups it saves
+FACTORIZE_MIN_ROWS = 64
+
+
+def input_domains(reference, best_features):
+    """
+    Returns the values each feature can take in DrawInputsWidgets: every
+    integer between the minimum and maximum of a numeric feature (0 and 1
+    for the Yes/No flags) and the distinct labels of the other features.
+    """
+    domains = {}
+    for feature in best_features:
+        values = reference[feature]
+        if pd.api.types.is_numeric_dtype(values):
+            domains[feature] = list(
+                range(int(values.min()), int(values.max()) + 1)
+            )
+        else:
+            domains[feature] = sorted(values.dropna().astype(str).unique())
+    return domains
+
+
+def model_checksum(model_dir):
+    """
+    Returns a checksum of the artifacts the table is computed from, so a
+    retrained model invalidates the table.
+    """
+    return "-".join(
+        file_fingerprint(os.path.join(model_dir, name))[:16]
+        for name in [
+            "clf_pipeline_pre_processing.pkl",
+            "clf_pipeline_model.pkl.gz",
+            "best_features.csv",
+        ]
+    )
+
+
+class PredictionTable:
+    """
+    Probability of success for every combination of input codes.
+
+    Each feature value has a code (its position in the feature's domain)
+    and a combination is keyed by the mixed-radix number of its codes. A
+    dense table stores one probability per key of the whole input space,
+    so a lookup is one array access. A sparse table stores the sorted keys
+    of the combinations it covers next to their probabilities and looks
+    keys up by binary search.
+    """
+
+    def __init__(self, domains, probabilities, checksum, keys=None):
+        self.features = list(domains)
+        self.domains = domains
+        self.probabilities = probabilities
+        self.checksum = checksum
+        self.keys = keys
+        # Lookup of the code of each value, keyed by label
+        self.codes = [
+            {_value_key(value): code for code, value in enumerate(values)}
+            for values in domains.values()
+        ]
+        radices = [len(values) for values in domains.values()]
+        # Stride of each feature; the last feature varies fastest
+        self.strides = np.cumprod(
+            [1] + radices[:0:-1], dtype=np.int64
+        )[::-1]
+        self.size = int(np.prod(radices, dtype=np.int64))
+
+    @property
+    def dense(self):
+        return self.keys is None
+
+    @property
+    def nbytes(self):
+        keys_bytes = 0 if self.keys is None else self.keys.nbytes
+        return self.probabilities.nbytes + keys_bytes
+
+    def encode(self, X):
+        """
+        Returns the key of every row of X, or -1 for rows with a value
+        outside the domains.
+        """
+        # One column of codes per feature; the key is their mixed-radix
+        # number
+        codes = np.column_stack([
+            _feature_codes(X[feature], feature_codes)
+            for feature, feature_codes in zip(self.features, self.codes)
+        ])
+        keys = codes @ self.strides
+        return np.where((codes >= 0).all(axis=1), keys, -1)
+
+    def lookup(self, X):
+        """
+        Returns the probability of success of every row of X, NaN for the
+        rows the table does not cover.
+        """
+        keys = self.encode(X)
+        proba = np.full(len(X), np.nan)
+        if self.dense:
+            found = keys >= 0
+            proba[found] = self.probabilities[keys[found]]
+            return proba
+        if len(self.keys) == 0:
+            return proba
+        positions = np.searchsorted(self.keys, keys)
+        positions = np.minimum(positions, len(self.keys) - 1)
+        found = (keys >= 0) & (self.keys[positions] == keys)
+        proba[found] = self.probabilities[positions[found]]
+        return proba
+
+    def save(self, path):
+        """Saves the table as an uncompressed .npz file."""
+        metadata = {"domains": self.domains, "checksum": self.checksum}
+        arrays = {"probabilities": self.probabilities}
+        if self.keys is not None:
+            arrays["keys"] = self.keys
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, metadata=json.dumps(metadata), **arrays)
+        os.replace(tmp_path, path)
+
+
+def load_prediction_table(path, checksum):
+    """
+    Loads a saved table. Returns None if there is no table or it was built
+    from other model artifacts than the given checksum.
+    """
+    try:
+        with np.load(path) as data:
+            metadata = json.loads(str(data["metadata"]))
+            if metadata["checksum"] != checksum:
+                return None
+            keys = data["keys"] if "keys" in data else None
+            return PredictionTable(
+                metadata["domains"], data["probabilities"], checksum, keys
+            )
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def build_prediction_table(
+        reference,
+        best_features,
+        ml_pipe_fe,
+        ml_pipe_model,
+        checksum,
+        max_dense_size=MAX_DENSE_SIZE,
+        batch_size=BUILD_BATCH_SIZE
+        ):
+    """
+    Scores the input space of the live predictor and returns it as a
+    PredictionTable. The whole cartesian product of the input domains is
+    enumerated if it has at most max_dense_size combinations; otherwise
+    only the distinct combinations present in the reference data are.
+    """
+    domains = input_domains(reference, best_features)
+    table = PredictionTable(
+        domains, np.empty(0), checksum, keys=np.empty(0, dtype=np.int64)
+    )
+
+    if table.size <= max_dense_size:
+        keys = None
+        combinations = itertools.product(*domains.values())
+        n_combinations = table.size
+    else:
+        observed = reference[best_features].drop_duplicates()
+        keys = np.unique(table.encode(observed))
+        keys = keys[keys >= 0]
+        combinations = (_decode(key, domains, table.strides) for key in keys)
+        n_combinations = len(keys)
+
+    probabilities = np.empty(n_combinations)
+    for start in range(0, n_combinations, batch_size):
+        batch = pd.DataFrame(
+            list(itertools.islice(combinations, batch_size)),
+            columns=best_features,
+        )
+        probabilities[start:start + len(batch)] = predict_outcomes(
+            batch, best_features, ml_pipe_fe, ml_pipe_model
+        ).probabilities
+
+    return PredictionTable(domains, probabilities, checksum, keys)
+
+
+def _decode(key, domains, strides):
+    """Returns the feature values of a mixed-radix key."""
+    values = []
+    for domain, stride in zip(domains.values(), strides):
+        code, key = divmod(int(key), int(stride))
+        values.append(domain[code])
+    return values
+
+
+def _feature_codes(values, codes):
+    """
+    Returns the code of every value of a column, -1 for the values outside
+    the domain. The column is factorized first, so the labels are only
+    looked up once per distinct value.
+    """
+    if len(values) < FACTORIZE_MIN_ROWS:
+        return np.array(
+            [codes.get(_value_key(value), -1) for value in values],
+            dtype=np.int64,
+        )
+    positions, uniques = pd.factorize(np.asarray(values))
+    unique_codes = np.array(
+        [codes.get(_value_key(value), -1) for value in uniques] + [-1],
+        dtype=np.int64,
+    )
+    # Missing values have position -1, which picks the trailing -1
+    return unique_codes[positions]
+
+
+def _value_key(value):
+    # Integral numbers are keyed like their label ("2" for 2, 2.0 and
+    # np.int64(2)), so numbers read from files match the widget labels
+    if isinstance(value, (int, float, np.integer, np.floating)) and not (
+        isinstance(value, bool)
+    ):
+        if float(value).is_integer():
+            return str(int(value))
+    return str(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the precomputed prediction table of a model."
+    )
+    parser.add_argument("--version", default=DEFAULT_VERSION)
+    parser.add_argument(
+        "--data",
+        default="outputs/datasets/cleaned/FertilityTreatmentDataCleaned.csv",
+        help="Cleaned dataset the input domains are taken from",
+    )
+    args = parser.parse_args()
+
+    model_dir = f"{MODEL_ROOT}/{args.version}"
+    best_features = registry.get("best_features", args.version)
+    ml_pipe_fe = registry.get("pre_processing", args.version)
+    ml_pipe_model = registry.get("model", args.version)
+    reference = pd.read_csv(args.data, usecols=best_features)
+
+    start = time.perf_counter()
+    table = build_prediction_table(
+        reference,
+        best_features,
+        ml_pipe_fe,
+        ml_pipe_model,
+        model_checksum(model_dir),
+    )
+    build_time = time.perf_counter() - start
+    path = os.path.join(model_dir, TABLE_FILE_NAME)
+    table.save(path)
+
+    covered = len(table.probabilities)
+    print(f"   input space: {table.size:,} combinations")
+    print(
+        f"         table: {'dense' if table.dense else 'sparse'}, "
+        f"{covered:,} combinations ({covered / table.size:.2%})"
+    )
+    print(f"          size: {table.nbytes / 2 ** 20:.1f} MiB in memory, "
+          f"{os.path.getsize(path) / 2 ** 20:.1f} MiB on disk")
+    print(f"    build time: {build_time:.1f} s")
+    print(f"      checksum: {table.checksum}")
@@ -0,0 +1,217 @@
+import numpy as np
+from scipy.special import expit, softmax
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Rows traversed at once by the numpy evaluator; bounds the memory of the
+# (rows x trees) node matrix
+NUMPY_CHUNKSIZE = 10_000
+# Rows per parallel task of the numba kernel; each task walks the trees one
+# after the other over its rows
+NUMBA_BLOCKSIZE = 8192
+
+# Node and tree arrays of a flattened ensemble
+ARRAY_NAMES = [
+    "feature", "threshold", "left", "right", "value", "roots", "columns"
+]
+
+
+class FlatTreeEnsemble:
+    """
+    A fitted RandomForestClassifier or GradientBoostingClassifier, or a
+    Pipeline ending in one, flattened into contiguous node arrays.
+
+    All the trees share one set of arrays (split feature, threshold, left
+    and right child, leaf value), with each tree's nodes at an offset.
+    Leaves point to themselves and never fail their split, so every tree
+    can be walked for a fixed number of steps without tracking which rows
+    reached a leaf. The ensemble is evaluated for a whole batch at once,
+    with numpy or, if installed, a numba kernel.
+
+    predict_proba follows scikit-learn: the inputs are cast to float32
+    like the fitted trees expect, forest leaves hold normalised class
+    fractions averaged over the trees, and boosting stages add up raw
+    scores from the init estimator's prediction before the logistic (or
+    softmax) link.
+    """
+
+    def __init__(self, model, use_numba=None):
+        steps = getattr(model, "steps", None)
+        self.preprocessing = [step for _, step in steps[:-1]] if steps else []
+        estimator = steps[-1][1] if steps else model
+        if not hasattr(estimator, "estimators_"):
+            raise TypeError(f"Cannot flatten {estimator!r}")
+        self.estimator = estimator
+        self.classes_ = estimator.classes_
+        # Raw score every boosting stage starts from, when it is the same
+        # for all rows; None means it is asked from the estimator
+        self.init_raw = None
+        self.use_numba = _resolve_use_numba(use_numba)
+
+        if hasattr(estimator, "learning_rate"):
+            # Gradient boosting: estimators_ is (n_stages, K) regression
+            # trees, each adding learning_rate * leaf value to column k
+            self.boosting = True
+            trees = [
+                (tree.tree_, k, estimator.learning_rate)
+                for stage in estimator.estimators_
+                for k, tree in enumerate(stage)
+            ]
+        else:
+            self.boosting = False
+            trees = [(tree.tree_, 0, None) for tree in estimator.estimators_]
+        self._flatten(trees)
+
+    def _flatten(self, trees):
+        features, thresholds, lefts, rights, values = [], [], [], [], []
+        roots, columns = [], []
+        offset = 0
+        self.max_depth = 0
+        for tree, column, learning_rate in trees:
+            n_nodes = tree.node_count
+            nodes = np.arange(n_nodes)
+            leaf = tree.children_left == -1
+
+            features.append(np.where(leaf, 0, tree.feature))
+            # Leaves compare against +inf and lead back to themselves
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+
+            if learning_rate is None:
+                value = tree.value[:, 0, :]
+                normalizer = value.sum(axis=1, keepdims=True)
+                normalizer[normalizer == 0.0] = 1.0
+                values.append(value / normalizer)
+            else:
+                values.append(learning_rate * tree.value[:, 0, :1])
+
+            roots.append(offset)
+            columns.append(column)
+            self.max_depth = max(self.max_depth, tree.max_depth)
+            offset += n_nodes
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds).astype(np.float64)
+        self.left = np.concatenate(lefts).astype(np.intp)
+        self.right = np.concatenate(rights).astype(np.intp)
+        self.value = np.ascontiguousarray(np.concatenate(values))
+        self.roots = np.array(roots, dtype=np.intp)
+        self.columns = np.array(columns, dtype=np.intp)
+
+    @classmethod
+    def from_arrays(
+            cls,
+            arrays,
+            classes,
+            boosting,
+            max_depth,
+            preprocessing=(),
+            init_raw=None,
+            use_numba=None
+            ):
+        """
+        Rebuilds an ensemble from the node arrays of a flattened one (see
+        model_artifact.py), without the scikit-learn estimator. A boosting
+        ensemble needs the constant init_raw score.
+        """
+        ensemble = cls.__new__(cls)
+        ensemble.preprocessing = list(preprocessing)
+        ensemble.estimator = None
+        ensemble.classes_ = np.asarray(classes)
+        ensemble.init_raw = None if init_raw is None else np.asarray(init_raw)
+        ensemble.use_numba = _resolve_use_numba(use_numba)
+        ensemble.boosting = boosting
+        ensemble.max_depth = max_depth
+        for name in ARRAY_NAMES:
+            setattr(ensemble, name, arrays[name])
+        return ensemble
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def predict_proba(self, X):
+        """Returns the class probabilities of every row of X."""
+        for step in self.preprocessing:
+            X = step.transform(X)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+
+        if self.boosting and self.init_raw is not None:
+            raw = np.tile(self.init_raw, (X.shape[0], 1)).astype(np.float64)
+        elif self.boosting:
+            raw = self.estimator._raw_predict_init(X).astype(np.float64)
+        else:
+            raw = np.zeros((X.shape[0], self.value.shape[1]))
+
+        if self.use_numba:
+            _accumulate_numba(
+                X, self.roots, self.columns, self.feature, self.threshold,
+                self.left, self.right, self.value, raw, NUMBA_BLOCKSIZE,
+            )
+        else:
+            for start in range(0, X.shape[0], NUMPY_CHUNKSIZE):
+                stop = start + NUMPY_CHUNKSIZE
+                self._accumulate_numpy(X[start:stop], raw[start:stop])
+
+        if not self.boosting:
+            return raw / len(self.roots)
+        if raw.shape[1] == 1:
+            proba = expit(raw[:, 0])
+            return np.column_stack([1 - proba, proba])
+        return softmax(raw, axis=1)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def _accumulate_numpy(self, X, out):
+        """Adds the leaf value of every tree to out, tree by tree."""
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.repeat(self.roots[None, :], X.shape[0], axis=0)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        width = self.value.shape[1]
+        # Same order of additions as scikit-learn, one tree at a time
+        for t, column in enumerate(self.columns):
+            out[:, column:column + width] += self.value[nodes[:, t]]
+
+
+def _resolve_use_numba(use_numba):
+    if use_numba is None:
+        return numba is not None
+    if use_numba and numba is None:
+        raise ImportError("numba is not installed")
+    return use_numba
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _accumulate_numba(
+            X, roots, columns, feature, threshold, left, right, value, out,
+            block
+            ):
+        # Within a block, tree by tree like scikit-learn, so the nodes of a
+        # tree stay in cache while the rows walk it; walking every tree for
+        # one row at a time reads the whole ensemble per row and is several
+        # times slower on large batches
+        width = value.shape[1]
+        n_rows = X.shape[0]
+        for b in numba.prange((n_rows + block - 1) // block):
+            stop = min((b + 1) * block, n_rows)
+            for t in range(roots.shape[0]):
+                for i in range(b * block, stop):
+                    node = roots[t]
+                    while left[node] != node:
+                        if X[i, feature[node]] <= threshold[node]:
+                            node = left[node]
+                        else:
+                            node = right[node]
+                    for c in range(width):
+                        out[i, columns[t] + c] += value[node, c]
+else:
+    _accumulate_numba = None
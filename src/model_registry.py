@@ -0,0 +1,354 @@
+"""
+Registry of the model versions and their artifacts.
+
+Write the manifest of a version from the repository root, e.g.
+    python -m src.model_registry write-manifest --version v1
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import types
+from collections import OrderedDict
+from functools import lru_cache
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.disk_cache import cache_key, disk_cache
+
+
+DEFAULT_VERSION = "v1"
+MODEL_ROOT = "outputs/ml_pipeline/ivf_success_predictor"
+MANIFEST_FILE_NAME = "manifest.json"
+# Upper bound of the memory held by the registry cache, in bytes
+DEFAULT_CACHE_BYTES = 512 * 2 ** 20
+
+# Where each component of a version lives by default, and how it is loaded
+DEFAULT_COMPONENTS = {
+    "data_cleaning_pipeline": (
+        "outputs/ivf_success_predictor/data_cleaning_pipeline/{version}/"
+        "data_cleaning_pipeline.pkl",
+        "pickle",
+    ),
+    "pre_processing": (
+        MODEL_ROOT + "/{version}/clf_pipeline_pre_processing.pkl", "pickle"
+    ),
+    "model": (
+        MODEL_ROOT + "/{version}/clf_pipeline_model.pkl.gz", "gzip_pickle"
+    ),
+    "compact_model": (
+        MODEL_ROOT + "/{version}/clf_pipeline_model.ivfm", "compact_model"
+    ),
+    "best_features": (
+        MODEL_ROOT + "/{version}/best_features.csv", "feature_list"
+    ),
+    "X_train": (MODEL_ROOT + "/{version}/X_train.csv", "csv"),
+    "X_test": (MODEL_ROOT + "/{version}/X_test.csv", "csv"),
+    "y_train": (MODEL_ROOT + "/{version}/y_train.csv", "csv_values"),
+    "y_test": (MODEL_ROOT + "/{version}/y_test.csv", "csv_values"),
+    "feature_importance": (
+        MODEL_ROOT + "/{version}/features_importance.png", "image"
+    ),
+}
+
+
+class ModelIntegrityError(ValueError):
+    """An artifact does not match the content hash of its manifest."""
+
+
+def file_sha256(file_path):
+    """Returns the SHA-256 hex digest of the file contents."""
+    stat = os.stat(file_path)
+    return _hash_file(file_path, stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=64)
+def _hash_file(file_path, size, mtime_ns):
+    # size and mtime are part of the key so edits invalidate the memo
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(version):
+    return os.path.join(MODEL_ROOT, version, MANIFEST_FILE_NAME)
+
+
+def build_manifest(version):
+    """
+    Describes the components of a version found at their default paths,
+    with the content hash of each file.
+    """
+    components = {}
+    for name, (path, loader) in DEFAULT_COMPONENTS.items():
+        path = path.format(version=version)
+        if os.path.exists(path):
+            components[name] = {
+                "path": path,
+                "loader": loader,
+                "sha256": file_sha256(path),
+                "bytes": os.path.getsize(path),
+            }
+    return {"version": version, "components": components}
+
+
+def write_manifest(version):
+    """Writes the manifest of a version next to its artifacts."""
+    manifest = build_manifest(version)
+    path = manifest_path(version)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of the components of every model version.
+
+    Components are described by the manifest of their version and loaded
+    on first use. Loaded components are keyed by their loader and content
+    hash, so versions sharing an identical file share one loaded object,
+    and switching versions only loads what changed. Each file is checked
+    against its manifest hash the first time it is loaded in the process.
+    When the cache holds more than max_bytes, the least recently used
+    components are evicted, by their estimated size in memory (see
+    _size_of).
+
+    A version without a manifest falls back to the default layout; its
+    files are hashed on first load, only to key the cache.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._sizes = {}
+        self._verified = set()
+        self._manifests = {}
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def cached_bytes(self):
+        return sum(self._sizes.values())
+
+    def manifest(self, version=DEFAULT_VERSION):
+        """Returns the manifest of a version, re-read when it changes."""
+        path = manifest_path(version)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return self._default_manifest(version)
+        cached = self._manifests.get(version)
+        if cached is None or cached[0] != mtime_ns:
+            with open(path) as f:
+                cached = (mtime_ns, json.load(f))
+            self._manifests[version] = cached
+        return cached[1]
+
+    def has(self, component, version=DEFAULT_VERSION):
+        entry = self.manifest(version)["components"].get(component)
+        return entry is not None and os.path.exists(entry["path"])
+
+    def get(self, component, version=DEFAULT_VERSION):
+        """
+        Returns a component of a model version, loading it on first use.
+        Raises FileNotFoundError if the version has no such component and
+        ModelIntegrityError if the file differs from its manifest.
+        """
+        entry = self.manifest(version)["components"].get(component)
+        if entry is None:
+            raise FileNotFoundError(
+                f"Model version {version} has no {component}"
+            )
+        with self._lock:
+            sha256 = entry.get("sha256") or file_sha256(entry["path"])
+            # The same file read by two loaders (e.g. "csv" and
+            # "csv_values") gives two different objects
+            key = (entry["loader"], sha256)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+            self._verify(entry["path"], sha256)
+            value = LOADERS[entry["loader"]](entry["path"])
+            self.loads += 1
+            self._cache[key] = value
+            self._sizes[key] = _size_of(value)
+            self._evict(keep=key)
+            return value
+
+    def load_model(self, version=DEFAULT_VERSION):
+        """
+        Returns the classification model of a version, memory-mapped from
+        its compact artifact when it was exported.
+        """
+        if self.has("compact_model", version):
+            return self.get("compact_model", version)
+        return self.get("model", version)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._sizes.clear()
+
+    def _verify(self, path, sha256):
+        if (path, sha256) in self._verified:
+            return
+        actual = file_sha256(path)
+        if actual != sha256:
+            raise ModelIntegrityError(
+                f"{path} does not match its manifest "
+                f"(sha256 {actual[:12]}, expected {sha256[:12]})"
+            )
+        self._verified.add((path, sha256))
+
+    def _evict(self, keep):
+        while self.cached_bytes > self.max_bytes and len(self._cache) > 1:
+            key = next(iter(self._cache))
+            if key == keep:
+                break
+            del self._cache[key]
+            del self._sizes[key]
+            self.evictions += 1
+
+    def _default_manifest(self, version):
+        components = {}
+        for name, (path, loader) in DEFAULT_COMPONENTS.items():
+            components[name] = {
+                "path": path.format(version=version),
+                "loader": loader,
+            }
+        return {"version": version, "components": components}
+
+
+def read_gzip_pickle(path):
+    """
+    Reads a gzip-compressed pickle through the disk cache, keyed by the
+    content of the file, so the decompression is paid once per host
+    rather than once per process start.
+    """
+    def decompress():
+        with gzip.open(path, "rb") as f:
+            return joblib.load(f)
+
+    key = cache_key("gzip_pickle", file_sha256(path))
+    return disk_cache.get_or_compute(key, decompress)
+
+
+def read_csv(path):
+    """Reads a CSV file through the disk cache, as a memory-mapped frame."""
+    key = cache_key("csv", file_sha256(path))
+    return disk_cache.get_or_compute(key, lambda: pd.read_csv(path))
+
+
+def _load_compact_model(path):
+    # Imported on first use, so pages without a model skip numba
+    from src.machine_learning.model_artifact import load_model_artifact
+
+    return load_model_artifact(path)
+
+
+def _load_image(path):
+    import matplotlib.pyplot as plt
+
+    return plt.imread(path)
+
+
+LOADERS = {
+    "pickle": joblib.load,
+    "gzip_pickle": read_gzip_pickle,
+    "compact_model": _load_compact_model,
+    "feature_list": lambda path: pd.read_csv(path)["feature"].tolist(),
+    "csv": read_csv,
+    "csv_values": lambda path: read_csv(path).values,
+    "image": _load_image,
+}
+
+
+def _size_of(value):
+    """
+    Estimates the memory held by a loaded component: the buffers of its
+    numpy arrays and frames, each counted once, plus the Python objects
+    that reference them. The object graph is walked as pickle would, so
+    the tree arrays of a fitted scikit-learn ensemble are counted, where
+    the size of its compressed file would undercount them many times.
+    """
+    size = 0
+    seen = set()
+    # The pickled states are built on the fly: they are kept alive until
+    # the walk ends, so their ids are not reused by later objects
+    states = []
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, pd.DataFrame):
+            size += int(obj.memory_usage(index=True, deep=True).sum())
+        elif isinstance(obj, np.ndarray):
+            # Views share the buffer of the array they were taken from
+            base = obj
+            while isinstance(base.base, np.ndarray):
+                base = base.base
+            if id(base) not in seen or base is obj:
+                seen.add(id(base))
+                size += base.nbytes
+            if obj.dtype == object:
+                stack.extend(obj.ravel())
+        elif isinstance(obj, dict):
+            size += sys.getsizeof(obj)
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            size += sys.getsizeof(obj)
+            stack.extend(obj)
+        elif isinstance(obj, (str, bytes, int, float, bool, type(None))):
+            size += sys.getsizeof(obj)
+        elif isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+            # Code shared with the rest of the process, e.g. a dtype
+            # parameter holding np.float64
+            continue
+        elif hasattr(obj, "__dict__"):
+            size += sys.getsizeof(obj)
+            stack.append(vars(obj))
+        else:
+            # Extension types, e.g. sklearn's Tree, expose their arrays
+            # through their pickled state
+            size += sys.getsizeof(obj)
+            try:
+                reduced = obj.__reduce_ex__(4)
+            except Exception:
+                continue
+            if isinstance(reduced, tuple):
+                states.append(reduced)
+                stack.extend(reduced[1:])
+    return size
+
+
+# Shared by every session of the app process
+registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    write_parser = subparsers.add_parser(
+        "write-manifest", help="Hash the artifacts of a version"
+    )
+    write_parser.add_argument("--version", default=DEFAULT_VERSION)
+    args = parser.parse_args()
+
+    manifest = write_manifest(args.version)
+    for name, entry in manifest["components"].items():
+        print(f"{name:>24}: {entry['sha256'][:12]}  {entry['path']}")
@@ -0,0 +1,104 @@
+"""
+Per-session accounting of the Streamlit reruns behind each prediction.
+"""
+import functools
+import time
+
+import streamlit as st
+from streamlit.logger import get_logger
+
+
+logger = get_logger(__name__)
+SESSION_KEY = "rerun_stats"
+
+
+class RerunStats:
+    """
+    Counts the reruns of one session and the server time they take, and
+    logs them each time a prediction completes. A full page rerun and a
+    rerun of a fragment alone are counted apart; a fragment drawn during a
+    page rerun is part of that rerun.
+    """
+
+    def __init__(self):
+        self.page_reruns = 0
+        self.fragment_reruns = 0
+        self.seconds = 0.0
+        self.predictions = 0
+        self._active = False
+        self._completed = False
+
+    def run(self, scope, func, *args, **kwargs):
+        if self._active:
+            return func(*args, **kwargs)
+        if scope == "page":
+            self.page_reruns += 1
+        else:
+            self.fragment_reruns += 1
+        self._active = True
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self._active = False
+            if self._completed:
+                self._log_prediction()
+
+    def prediction_completed(self):
+        """Marks that the current rerun displayed a prediction."""
+        self._completed = True
+
+    def _log_prediction(self):
+        self.predictions += 1
+        logger.info(
+            "Prediction %d: %d page reruns, %d fragment reruns, "
+            "%.1f ms server time since the previous prediction",
+            self.predictions,
+            self.page_reruns,
+            self.fragment_reruns,
+            self.seconds * 1e3,
+        )
+        self.page_reruns = 0
+        self.fragment_reruns = 0
+        self.seconds = 0.0
+        self._completed = False
+
+
+def session_rerun_stats():
+    """Returns the RerunStats of the current session."""
+    if SESSION_KEY not in st.session_state:
+        st.session_state[SESSION_KEY] = RerunStats()
+    return st.session_state[SESSION_KEY]
+
+
+def track_reruns(scope):
+    """
+    Decorates a page body ("page") or a fragment ("fragment") so that its
+    runs are counted and timed in the session's RerunStats.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return session_rerun_stats().run(scope, func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _run_with_page(func):
+    return func
+
+
+# st.fragment was st.experimental_fragment before Streamlit 1.37 (the
+# version pinned in requirements.txt); without either the decorated
+# function simply runs with the page
+fragment = getattr(st, "fragment", None) or getattr(
+    st, "experimental_fragment", None
+)
+if fragment is None:
+    logger.warning(
+        "Streamlit %s has no st.fragment: fragments rerun with the whole "
+        "page",
+        st.__version__,
+    )
+    fragment = _run_with_page
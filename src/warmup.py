@@ -0,0 +1,255 @@
+"""
+Warm-up of the dataset and model caches at server start.
+
+The first user after a restart would otherwise pay for loading them.
+Streamlit only runs app.py when a session connects, so the Procfile
+starts the server through
+    python -m src.warmup --serve app.py
+which runs "streamlit run app.py" in this process and fills the caches
+in a background thread as soon as the server runtime exists, before any
+session connects. Without --serve, the warm-up runs once and exits,
+leaving the on-disk caches (columnar datasets, widget manifest) built.
+
+READY_FILE is written when the server process is warm. It is a local
+file, for probes that run inside the container (e.g. "test -f"); a load
+balancer that only makes HTTP requests cannot see it, and Streamlit's
+/_stcore/health only reports that the server is up. The Heroku router
+does not check readiness at all.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from streamlit.logger import get_logger
+
+
+logger = get_logger(__name__)
+# Exists while the process that wrote it is warm; load balancer health
+# checks can test for it
+READY_FILE = os.environ.get(
+    "WARMUP_READY_FILE",
+    os.path.join(tempfile.gettempdir(), "ivf-success-predictor.ready"),
+)
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_thread = None
+
+
+def warmup_steps(version, predict=True):
+    """
+    Returns the (name, function) steps that fill the caches the pages use,
+    in the order the live predictor needs them. The heavy modules are
+    imported by the steps, not by this module, so starting the warm-up
+    does not slow down the page being rendered.
+    """
+    def cleaned_dataset():
+        from src.data_management import load_ifv_treatment_data
+
+        load_ifv_treatment_data()
+
+    def bitmap_index():
+        from src.data_management import load_bitmap_index
+
+        load_bitmap_index()
+
+    def best_features():
+        from src.data_management import load_best_features
+
+        load_best_features(version)
+
+    def pre_processing():
+        from src.model_registry import registry
+
+        registry.get("pre_processing", version)
+
+    def model():
+        from src.model_registry import registry
+
+        registry.load_model(version)
+
+    def widget_manifest():
+        from src.widget_manifest import load_widget_manifest
+
+        load_widget_manifest(version)
+
+    def live_predictor_page():
+        from app_pages.page_live_predictor import (
+            load_prediction_table_for_version,
+        )
+
+        load_prediction_table_for_version(version)
+
+    def dummy_prediction():
+        # Scores one row of the cleaned data through the pipeline (not the
+        # prediction table), so every code path and compiled kernel used
+        # by a prediction has run once
+        from src.data_management import (
+            load_best_features,
+            load_ifv_treatment_data,
+        )
+        from src.machine_learning.prediction_live import predict_outcomes
+        from src.model_registry import registry
+
+        features = load_best_features(version)
+        X_live = load_ifv_treatment_data(columns=features).head(1)
+        predict_outcomes(
+            X_live,
+            features,
+            registry.get("pre_processing", version),
+            registry.load_model(version),
+            model_version=version,
+        )
+
+    steps = [
+        ("cleaned dataset", cleaned_dataset),
+        ("EDA bitmap index", bitmap_index),
+        ("best features", best_features),
+        ("pre-processing pipeline", pre_processing),
+        ("model", model),
+        ("widget manifest", widget_manifest),
+        ("live predictor page and prediction table", live_predictor_page),
+    ]
+    if predict:
+        steps.append(("dummy prediction", dummy_prediction))
+    return steps
+
+
+def run_warmup(version=None, predict=True, mark_ready=True):
+    """
+    Runs every warm-up step for a model version (by default the current
+    one), logging its time, then marks the process as ready and, with
+    mark_ready, writes READY_FILE. A failing step is logged and skipped:
+    the page that needs it loads it on first use as it would without a
+    warm-up. Returns the time of each step in seconds, None for the steps
+    that failed.
+    """
+    if version is None:
+        # Not imported at the top, so the app shell stays light
+        from src.model_registry import DEFAULT_VERSION
+
+        version = DEFAULT_VERSION
+    if mark_ready:
+        _clear_ready_file()
+    timings = {}
+    start = time.perf_counter()
+    for name, step in warmup_steps(version, predict):
+        step_start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up of the %s failed", name)
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - step_start
+        logger.info("Warmed up the %s in %.0f ms", name, timings[name] * 1e3)
+    logger.info(
+        "Warm-up done in %.0f ms", (time.perf_counter() - start) * 1e3
+    )
+    _ready.set()
+    if mark_ready:
+        _write_ready_file()
+    return timings
+
+
+def start_warmup(version=None, predict=True, wait_for_server=False):
+    """
+    Starts the warm-up in a background thread, once per process. Later
+    calls return the thread of the first one. With wait_for_server, the
+    thread waits for the Streamlit runtime to start first, so the caches
+    it fills are the ones the server's sessions use.
+    """
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(
+                target=_warm_up_server if wait_for_server else run_warmup,
+                args=(version, predict),
+                name="warmup",
+                daemon=True,
+            )
+            _thread.start()
+        return _thread
+
+
+def serve(script_path, version=None, predict=True):
+    """
+    Runs "streamlit run script_path" in this process, with the warm-up
+    started at boot rather than when the first session runs the script.
+    Returns when the server stops.
+    """
+    from streamlit.web import cli
+
+    start_warmup(version, predict, wait_for_server=True)
+    cli.main(args=["run", script_path], prog_name="streamlit")
+
+
+def _warm_up_server(version, predict):
+    from streamlit.runtime import Runtime
+
+    while not Runtime.exists():
+        time.sleep(0.1)
+    run_warmup(version, predict)
+
+
+def is_ready():
+    """True once the warm-up of this process has finished."""
+    return _ready.is_set()
+
+
+def wait_until_ready(timeout=None):
+    """Blocks until the warm-up has finished. Returns is_ready()."""
+    return _ready.wait(timeout)
+
+
+def _write_ready_file():
+    try:
+        with open(READY_FILE, "w") as f:
+            f.write(str(os.getpid()))
+    except OSError:
+        logger.warning("Could not write the readiness file %s", READY_FILE)
+
+
+def _clear_ready_file():
+    try:
+        os.remove(READY_FILE)
+    except OSError:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--version", default=None)
+    parser.add_argument(
+        "--no-predict",
+        action="store_true",
+        help="Skip the dummy prediction",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="SCRIPT",
+        help="Run the Streamlit app SCRIPT, warmed up at boot",
+    )
+    args = parser.parse_args()
+
+    if args.serve:
+        # app.py imports src.warmup; run the server from that module, not
+        # from this __main__ copy of it, so both share one warm-up thread
+        # and one readiness state
+        import src.warmup
+
+        src.warmup.serve(
+            args.serve, args.version, predict=not args.no_predict
+        )
+        raise SystemExit
+
+    # The in-process caches die with this process, so only the on-disk
+    # caches are warm afterwards; readiness is the server process's
+    timings = run_warmup(
+        args.version, predict=not args.no_predict, mark_ready=False
+    )
+    for name, seconds in timings.items():
+        result = "failed" if seconds is None else f"{seconds * 1e3:8.0f} ms"
+        print(f"{name:>42}: {result}")
@@ -0,0 +1,193 @@
+"""
+Description of the input widgets of the live predictor.
+
+Build the manifest of a model version from the repository root, e.g.
+    python -m src.widget_manifest --version v1
+"""
+import argparse
+import json
+import os
+import time
+
+import streamlit as st
+
+from src.column_stats import mean
+from src.count_cube import value_order
+from src.data_management import (
+    CLEANED_DATA_PATH,
+    MAX_CACHED_ENTRIES,
+    file_fingerprint,
+    load_best_features,
+    read_column_stats,
+)
+from src.data_schema import SCHEMA_VERSION, apply_schema
+from src.model_registry import DEFAULT_VERSION, MODEL_ROOT
+
+
+WIDGET_MANIFEST_FILE_NAME = "widget_manifest.json"
+# Bump when the fields of the manifest change to force a rebuild
+WIDGET_MANIFEST_FORMAT = 2
+
+# Notes shown above the widgets, keyed by the info flags of the manifest
+WIDGET_NOTES = {
+    "embryos_transferred": "* 1e means 1 embryo selectively elected.",
+    "cycle_type": (
+        """
+        * '- frozen' or '- fresh' indicates frozen or
+        fresh cycle, respectively.
+        """
+    ),
+}
+
+
+def widget_manifest_path(version):
+    return os.path.join(MODEL_ROOT, version, WIDGET_MANIFEST_FILE_NAME)
+
+
+def manifest_key(version):
+    """
+    Returns what a manifest is computed from: the cleaned data, the best
+    features of the model version and the dataset schema.
+    """
+    return {
+        "format": WIDGET_MANIFEST_FORMAT,
+        "schema": SCHEMA_VERSION,
+        "data": file_fingerprint(CLEANED_DATA_PATH),
+        "best_features": file_fingerprint(
+            os.path.join(MODEL_ROOT, version, "best_features.csv")
+        ),
+    }
+
+
+def build_widget_manifest(stats, best_features, key=None):
+    """
+    Describes the widget of each feature from the column statistics of the
+    reference data (see src/column_stats.py), in the order of
+    best_features:
+    - "yes_no": a No/Yes dropdown for 0/1 features
+    - "number": an integer input between the minimum and maximum of the
+      feature, starting at its mean
+    - "select": a dropdown of the distinct labels, in the category order
+      of src/data_schema.py for the binned features (e.g. "1-5" before
+      "6-10" before "11-15"), in numeric or text order otherwise
+    The info flags name the notes of WIDGET_NOTES shown before the widget.
+    Each note is shown once, before the first feature it applies to.
+    """
+    widgets = []
+    shown = set()
+    for feature in best_features:
+        column = stats[feature]
+        info = []
+        if feature == "Embryos transferred":
+            info.append("embryos_transferred")
+
+        if column["kind"] == "numeric":
+            if column["values"] == [0, 1]:
+                widget = {"type": "yes_no", "options": ["No", "Yes"]}
+            else:
+                widget = {
+                    "type": "number",
+                    "min": int(column["min"]),
+                    "max": int(column["max"]),
+                    "default": int(mean(column)),
+                }
+        else:
+            options = value_order(feature, column["labels"])
+            if any("- frozen" in o or "- fresh" in o for o in options):
+                info.append("cycle_type")
+            widget = {"type": "select", "options": options}
+
+        widget["feature"] = feature
+        widget["info"] = [flag for flag in info if flag not in shown]
+        shown.update(info)
+        widgets.append(widget)
+
+    return {"key": key, "widgets": widgets}
+
+
+def write_widget_manifest(manifest, path):
+    """Writes the manifest atomically."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_widget_manifest(path, key):
+    """
+    Reads a saved manifest. Returns None if there is none or it was built
+    from other inputs than the given key.
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("key") != key:
+        return None
+    return manifest
+
+
+def make_widget_manifest(version):
+    """
+    Returns the widget manifest of a model version, reading it from its
+    file when it is up to date and otherwise building and saving it.
+    """
+    key = manifest_key(version)
+    path = widget_manifest_path(version)
+    manifest = read_widget_manifest(path, key)
+    if manifest is None:
+        best_features = load_best_features(version)
+        # Kept up to date by src/incremental_refresh.py as rows are
+        # appended, so the manifest is rebuilt without reading the data
+        stats = read_column_stats(CLEANED_DATA_PATH, prepare=apply_schema)
+        manifest = build_widget_manifest(stats, best_features, key)
+        try:
+            write_widget_manifest(manifest, path)
+        except OSError:
+            # A read-only file system only costs the file, not the manifest
+            pass
+    return manifest
+
+
+def load_widget_manifest(version=DEFAULT_VERSION):
+    """
+    Loads the widget manifest of a model version. Cached per version of
+    its inputs and of the manifest file, so a manifest rebuilt by a
+    refresh of the cleaned data (src/incremental_refresh.py) reaches the
+    running app without a restart.
+    """
+    path = widget_manifest_path(version)
+    try:
+        stat = os.stat(path)
+        file_version = (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        file_version = None
+    return _load_widget_manifest(version, manifest_key(version), file_version)
+
+
+@st.cache_data(max_entries=MAX_CACHED_ENTRIES)
+def _load_widget_manifest(version, key, file_version):
+    return make_widget_manifest(version)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--version", default=DEFAULT_VERSION)
+    args = parser.parse_args()
+
+    path = widget_manifest_path(args.version)
+    if os.path.exists(path):
+        os.remove(path)
+    start = time.perf_counter()
+    manifest = make_widget_manifest(args.version)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    make_widget_manifest(args.version)
+    read_time = time.perf_counter() - start
+
+    for widget in manifest["widgets"]:
+        print(f"{widget['feature']:>45}: {widget['type']}")
+    print(f"Built in {build_time * 1e3:.1f} ms, "
+          f"read back in {read_time * 1e3:.1f} ms "
+          f"({os.path.getsize(path)} bytes)")